@@ -0,0 +1,52 @@
+"""add_lower_unique_indexes_users
+
+Indici unici su `lower(username)` e `lower(email)` di users.
+
+Il login cerca l'utente per username o email senza distinguere maiuscole, ma
+username non aveva indici: ogni login scansionava la tabella. Con gli indici
+sull'espressione, la stessa delle query, la ricerca è un lookup e la
+registrazione non deve più controllare i duplicati con due SELECT: li rifiuta il
+DB, anche tra due registrazioni simultanee.
+
+La registrazione salva già username ed email in minuscolo, quindi i dati
+esistenti non hanno duplicati che differiscono solo per maiuscole; se ce ne
+fossero, l'upgrade fallisce e vanno risolti a mano prima.
+
+Revision ID: a8b9c0d1e2f3
+Revises: f7a8b9c0d1e2
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8b9c0d1e2f3'
+down_revision: Union[str, Sequence[str], None] = 'f7a8b9c0d1e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ux_users_username_lower',
+        'users',
+        [sa.text('lower(username)')],
+        unique=True,
+    )
+    op.create_index(
+        'ux_users_email_lower',
+        'users',
+        [sa.text('lower(email)')],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_users_email_lower', table_name='users')
+    op.drop_index('ux_users_username_lower', table_name='users')
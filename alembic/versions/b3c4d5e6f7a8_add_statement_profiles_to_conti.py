@@ -0,0 +1,37 @@
+"""add_statement_profiles_to_conti
+
+Aggiunge `conti.statement_profiles` (JSON, nullable): il layout degli estratti
+conto (PDF / foglio di calcolo) riconosciuto al primo import, così gli import
+successivi dello stesso conto saltano il rilevamento di banca e colonne.
+
+Solo ADD COLUMN nullable: non distruttivo, nessuna modifica ai dati esistenti.
+
+Revision ID: b3c4d5e6f7a8
+Revises: a7c1f2d3e4b5
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3c4d5e6f7a8'
+down_revision: Union[str, Sequence[str], None] = 'a7c1f2d3e4b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'conti',
+        sa.Column('statement_profiles', sa.JSON(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conti', 'statement_profiles')
@@ -0,0 +1,45 @@
+"""add_refresh_tokens_cleanup_indexes
+
+Indici su `expires_at`, `used_at` e `revoked_at` di refresh_tokens, per la
+pulizia notturna (`task_pulizia_refresh_token`): ogni login e ogni rotazione
+aggiungono una riga e nessuno le cancellava, quindi la tabella (e con lei
+`consume_refresh_token` e `revoke_token_family`) cresceva senza limite. La
+pulizia elimina a blocchi le righe scadute, revocate o ruotate da tempo, e ogni
+criterio ha qui il suo indice.
+
+Solo CREATE INDEX: nessuna modifica ai dati. Su una tabella già molto grande
+valutare `CREATE INDEX CONCURRENTLY`.
+
+Revision ID: b9c0d1e2f3a4
+Revises: a8b9c0d1e2f3
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9c0d1e2f3a4'
+down_revision: Union[str, Sequence[str], None] = 'a8b9c0d1e2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = (
+    ('ix_refresh_tokens_expires_at', 'expires_at'),
+    ('ix_refresh_tokens_used_at', 'used_at'),
+    ('ix_refresh_tokens_revoked_at', 'revoked_at'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, column in _INDEXES:
+        op.create_index(name, 'refresh_tokens', [column], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, _column in reversed(_INDEXES):
+        op.drop_index(name, table_name='refresh_tokens')
@@ -0,0 +1,43 @@
+"""add_rate_limit_counters
+
+Tabella `rate_limit_counters` per il rate limit condiviso
+(`RATE_LIMIT_STORAGE_URI=db://`, vedi rate_limit.py). In memoria ogni worker
+contava per sé, quindi con N worker i limiti di /login, /register e /auth/*
+valevano N volte tanto e ripartivano a ogni riavvio.
+
+Una riga per chiave (limite + client), aggiornata con un upsert atomico a ogni
+richiesta. Solo CREATE TABLE: nessuna modifica ai dati esistenti.
+
+Revision ID: c0d1e2f3a4b5
+Revises: b9c0d1e2f3a4
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c0d1e2f3a4b5'
+down_revision: Union[str, Sequence[str], None] = 'b9c0d1e2f3a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'rate_limit_counters',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('prev_count', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rate_limit_counters')
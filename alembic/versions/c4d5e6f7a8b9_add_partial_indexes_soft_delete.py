@@ -0,0 +1,81 @@
+"""add_partial_indexes_soft_delete
+
+Indici parziali sulle righe non cancellate (`WHERE deleted_at IS NULL`) delle
+transazioni, per i filtri più caldi:
+
+- `(user_id, data, id)`: lista paginata/recenti ordinata per data e id. Prende
+  il posto di `ix_transazioni_user_id_data`: ogni query che lo usava filtra già
+  `deleted_at IS NULL`, quindi il vecchio indice resterebbe solo da mantenere;
+- `(user_id, categoria_id, data)` e `(user_id, tag_id, data)`: statistiche
+  filtrate per categoria o tag;
+- `(conto_id, data)`: movimenti e ricalcoli di saldo di un conto.
+
+Più l'indice parziale `(user_id, status) WHERE status = 'PENDING'` per il
+controllo delle proposte bancarie pendenti.
+
+Nessuna modifica dati; il downgrade ricrea l'indice rimosso. Su tabelle molto
+grandi valutare `CREATE INDEX CONCURRENTLY` per evitare il lock in scrittura.
+
+Revision ID: c4d5e6f7a8b9
+Revises: b3c4d5e6f7a8
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d5e6f7a8b9'
+down_revision: Union[str, Sequence[str], None] = 'b3c4d5e6f7a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_ATTIVE = sa.text('deleted_at IS NULL')
+_PENDING = sa.text("status = 'PENDING'")
+
+_TRANSAZIONI_INDEXES = (
+    ('ix_transazioni_attive_user_data_id', ['user_id', 'data', 'id']),
+    ('ix_transazioni_attive_user_categoria_data', ['user_id', 'categoria_id', 'data']),
+    ('ix_transazioni_attive_user_tag_data', ['user_id', 'tag_id', 'data']),
+    ('ix_transazioni_attive_conto_data', ['conto_id', 'data']),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, columns in _TRANSAZIONI_INDEXES:
+        op.create_index(
+            name,
+            'transazioni',
+            columns,
+            unique=False,
+            postgresql_where=_ATTIVE,
+            sqlite_where=_ATTIVE,
+        )
+    op.create_index(
+        'ix_bank_proposals_pending_user',
+        'bank_transaction_proposals',
+        ['user_id', 'status'],
+        unique=False,
+        postgresql_where=_PENDING,
+        sqlite_where=_PENDING,
+    )
+    op.drop_index(op.f('ix_transazioni_user_id_data'), table_name='transazioni')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(
+        op.f('ix_transazioni_user_id_data'),
+        'transazioni',
+        ['user_id', 'data'],
+        unique=False,
+    )
+    op.drop_index(
+        'ix_bank_proposals_pending_user', table_name='bank_transaction_proposals'
+    )
+    for name, _columns in reversed(_TRANSAZIONI_INDEXES):
+        op.drop_index(name, table_name='transazioni')
@@ -0,0 +1,41 @@
+"""add_rate_limit_counters_expires_at_index
+
+Indice su `expires_at` di rate_limit_counters, per la pulizia oraria
+(`task_pulizia_rate_limit`): ogni IP e ogni utente nuovo lasciano una riga, e
+senza pulizia la tabella cresce con il numero di client mai visti. La pulizia
+elimina a blocchi le righe scadute da più della finestra più lunga.
+
+Solo CREATE INDEX: nessuna modifica ai dati.
+
+Revision ID: d2e3f4a5b6c7
+Revises: c0d1e2f3a4b5
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2e3f4a5b6c7'
+down_revision: Union[str, Sequence[str], None] = 'c0d1e2f3a4b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_rate_limit_counters_expires_at',
+        'rate_limit_counters',
+        ['expires_at'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_rate_limit_counters_expires_at', table_name='rate_limit_counters'
+    )
@@ -0,0 +1,63 @@
+"""add_trigram_search_indexes
+
+Indici GIN a trigrammi (estensione `pg_trgm`) sulle descrizioni di transazioni
+(solo righe non cancellate) e proposte bancarie.
+
+`ILIKE '%testo%'` non può usare un B-tree, quindi il filtro `descrizione` delle
+liste faceva la scansione di tutte le righe dell'utente; con `gin_trgm_ops` lo
+stesso ILIKE (da 3 caratteri in su) e la ricerca per similarità (`<%`) di
+`/transazioni/search` passano dall'indice.
+
+Scelti i trigrammi e non un `tsvector` con stemming italiano: le descrizioni
+sono nomi di esercenti e causali ("AMAZON MKTPLACE", "PAGAMENTO POS"), dove
+conta la sottostringa e non la radice delle parole.
+
+`CREATE EXTENSION` richiede un ruolo con i permessi adeguati (pg_trgm è
+"trusted" da Postgres 13). Il downgrade lascia l'estensione installata.
+
+Revision ID: d5e6f7a8b9c0
+Revises: c4d5e6f7a8b9
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5e6f7a8b9c0'
+down_revision: Union[str, Sequence[str], None] = 'c4d5e6f7a8b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_transazioni_descrizione_trgm',
+        'transazioni',
+        ['descrizione'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'descrizione': 'gin_trgm_ops'},
+        postgresql_where=sa.text('deleted_at IS NULL'),
+    )
+    op.create_index(
+        'ix_bank_proposals_descrizione_trgm',
+        'bank_transaction_proposals',
+        ['descrizione'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'descrizione': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_bank_proposals_descrizione_trgm', table_name='bank_transaction_proposals'
+    )
+    op.drop_index('ix_transazioni_descrizione_trgm', table_name='transazioni')
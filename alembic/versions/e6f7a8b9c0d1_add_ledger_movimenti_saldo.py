@@ -0,0 +1,130 @@
+"""add_ledger_movimenti_saldo
+
+Introduce il ledger dei saldi (vedi ledger.py):
+
+- `movimenti_saldo`: una riga append-only per ogni variazione del saldo di un
+  conto (conto, data contabile, importo con segno, causale, transazione);
+- `saldi_snapshot`: saldo di fine giornata a intervalli (fine mese), per
+  calcolare il saldo a una data senza sommare tutta la storia.
+
+Backfill: per ogni transazione esistente (anche in soft-delete: il soft-delete
+di un conto non ha mai toccato i saldi) l'effetto sul conto e, per giroconti e
+accantonamenti, sulla destinazione, alla data della transazione. Poi, per ogni
+conto, un movimento APERTURA con la differenza tra il saldo attuale e la somma
+ricostruita (saldo iniziale più eventuali correzioni a mano), datato al primo
+movimento o alla creazione del conto: così la somma del ledger coincide con
+`conti.saldo`. Infine uno snapshot a fine del mese scorso per ogni conto.
+
+Lo storico ricostruito riflette le transazioni come sono oggi (le modifiche
+passate non erano tracciate); da qui in poi ogni modifica ha il suo storno.
+
+Revision ID: e6f7a8b9c0d1
+Revises: d5e6f7a8b9c0
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6f7a8b9c0d1'
+down_revision: Union[str, Sequence[str], None] = 'd5e6f7a8b9c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'movimenti_saldo',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conto_id', sa.Integer(), nullable=False),
+        sa.Column('transazione_id', sa.Integer(), nullable=True),
+        sa.Column('data', sa.Date(), nullable=False),
+        sa.Column('importo', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('causale', sa.String(), nullable=False),
+        sa.Column('creationDate', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['conto_id'], ['conti.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(
+            ['transazione_id'], ['transazioni.id'], ondelete='SET NULL'
+        ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_movimenti_saldo_conto_data', 'movimenti_saldo', ['conto_id', 'data']
+    )
+    op.create_table(
+        'saldi_snapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('conto_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.Date(), nullable=False),
+        sa.Column('saldo', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('creationDate', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['conto_id'], ['conti.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ux_saldi_snapshot_conto_data',
+        'saldi_snapshot',
+        ['conto_id', 'data'],
+        unique=True,
+    )
+
+    # --- Backfill ---
+    op.execute(
+        """
+        INSERT INTO movimenti_saldo
+            (conto_id, transazione_id, data, importo, causale, "creationDate")
+        SELECT t.conto_id, t.id, COALESCE(t.data, CURRENT_DATE),
+               CASE WHEN t.tipo IN ('USCITA', 'RICARICA', 'ACCANTONAMENTO')
+                    THEN -t.importo ELSE t.importo END,
+               'TRANSAZIONE', now()
+        FROM transazioni t
+        WHERE t.conto_id IS NOT NULL
+        UNION ALL
+        SELECT t.conto_destinazione_id, t.id, COALESCE(t.data, CURRENT_DATE),
+               t.importo, 'TRANSAZIONE', now()
+        FROM transazioni t
+        WHERE t.tipo IN ('RICARICA', 'ACCANTONAMENTO')
+          AND t.conto_destinazione_id IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO movimenti_saldo (conto_id, data, importo, causale, "creationDate")
+        SELECT c.id,
+               LEAST(COALESCE(m.prima_data, CURRENT_DATE),
+                     COALESCE(c."creationDate"::date, CURRENT_DATE)),
+               c.saldo - COALESCE(m.totale, 0),
+               'APERTURA', now()
+        FROM conti c
+        LEFT JOIN (
+            SELECT conto_id, min(data) AS prima_data, sum(importo) AS totale
+            FROM movimenti_saldo
+            GROUP BY conto_id
+        ) m ON m.conto_id = c.id
+        WHERE c.saldo - COALESCE(m.totale, 0) <> 0
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO saldi_snapshot (conto_id, data, saldo, "creationDate")
+        SELECT conto_id,
+               (date_trunc('month', CURRENT_DATE) - interval '1 day')::date,
+               sum(importo), now()
+        FROM movimenti_saldo
+        WHERE data < date_trunc('month', CURRENT_DATE)
+        GROUP BY conto_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_saldi_snapshot_conto_data', table_name='saldi_snapshot')
+    op.drop_table('saldi_snapshot')
+    op.drop_index('ix_movimenti_saldo_conto_data', table_name='movimenti_saldo')
+    op.drop_table('movimenti_saldo')
@@ -1,5 +1,4 @@
 from dotenv import load_dotenv
-import bcrypt
 import hashlib
 import logging
 import os
@@ -8,10 +7,21 @@ from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import RefreshToken, User
 
+# Hash delle password: vivono in passwords.py (pool di processi dedicato),
+# esposti anche da qui per chi li importava da auth.
+from passwords import (  # noqa: F401
+    get_password_hash,
+    get_password_hash_async,
+    needs_rehash,
+    verify_password,
+    verify_password_async,
+)
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -21,6 +31,12 @@ logger = logging.getLogger(__name__)
 # che sta in un cookie httpOnly e non è leggibile da JavaScript.
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 90))
+# Per quanto si tengono i token già ruotati: servono solo alla reuse detection
+# (un token ruotato che ricompare fa revocare la famiglia). Dopo questa finestra
+# un replay trova un token sconosciuto e viene comunque rifiutato con 401.
+REFRESH_TOKEN_USED_RETENTION_DAYS = int(
+    os.getenv("REFRESH_TOKEN_USED_RETENTION_DAYS", 7)
+)
 
 REFRESH_COOKIE_NAME = "refresh_token"
 # Il refresh token serve solo agli endpoint di sessione: limitando il path, il
@@ -28,21 +44,6 @@ REFRESH_COOKIE_NAME = "refresh_token"
 REFRESH_COOKIE_PATH = "/auth"
 
 
-def get_password_hash(password: str):
-    # Trasforma la stringa in byte, genera il sale e fa l'hash
-    pwd_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(pwd_bytes, salt)
-    # Restituisce l'hash come stringa per salvarlo nel DB
-    return hashed_password.decode("utf-8")
-
-
-def verify_password(plain_password: str, hashed_password: str):
-    password_byte = plain_password.encode("utf-8")
-    hashed_byte = hashed_password.encode("utf-8")
-    return bcrypt.checkpw(password_byte, hashed_byte)
-
-
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -186,6 +187,38 @@ def consume_refresh_token(db: Session, raw_token: str) -> RefreshToken:
     return db_token
 
 
+def delete_stale_refresh_tokens(
+    db: Session, batch_size: int = 1000, now: datetime | None = None
+) -> int:
+    """Elimina i refresh token che non possono più aprire una sessione: scaduti,
+    revocati e ruotati da più di REFRESH_TOKEN_USED_RETENTION_DAYS. Senza, ogni
+    login e ogni rotazione lasciano una riga per sempre.
+
+    Cancella a blocchi di `batch_size` righe con un commit per blocco, così non
+    tiene lock a lungo su una tabella scritta a ogni /auth/refresh; ogni criterio
+    ha il suo indice. Ritorna il numero di righe eliminate.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    used_cutoff = now - timedelta(days=REFRESH_TOKEN_USED_RETENTION_DAYS)
+    criteri = (
+        RefreshToken.expires_at < now,
+        RefreshToken.revoked_at.is_not(None),
+        RefreshToken.used_at < used_cutoff,
+    )
+    deleted = 0
+    for criterio in criteri:
+        while True:
+            ids = db.scalars(
+                select(RefreshToken.id).where(criterio).limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            db.execute(delete(RefreshToken).where(RefreshToken.id.in_(ids)))
+            db.commit()
+            deleted += len(ids)
+    return deleted
+
+
 def set_refresh_cookie(response: Response, raw_token: str) -> None:
     """Cookie httpOnly: illeggibile da JavaScript, quindi non rubabile via XSS.
 
@@ -297,6 +330,8 @@ def get_admin_user_id(
     Vive qui e non in un router perché la usano sia `open_banking` (flusso Enable
     Banking) sia `bank_connectors` (che salva le credenziali della banca): sono le
     uniche parti che maneggiano token bancari, e devono avere lo stesso cancello.
+    La riusa anche la riconciliazione dei saldi (`POST /conti/reconcile`), l'unica
+    altra operazione che guarda i dati di tutti gli utenti.
     L'admin è identificato da OPEN_BANKING_ADMIN_EMAIL; se la variabile non c'è, la
     funzionalità è chiusa per tutti.
     """
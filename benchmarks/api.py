@@ -0,0 +1,249 @@
+"""Benchmark degli endpoint più usati e dei job schedulati su un utente pesante.
+
+Genera il dataset di `benchmarks.dataset` (10 conti, 50k transazioni in 10 anni)
+in un database vuoto, poi misura gli endpoint attraverso l'app vera (middleware,
+dipendenze e serializzazione comprese, utente corrente sostituito) e i task dello
+scheduler, una volta ciascuno e in quest'ordine, perché modificano i dati.
+Restano fuori `task_aggiornamento_prezzi` e `task_sync_bank_connectors`, che
+misurerebbero Yahoo Finance e la banca.
+
+Per ogni endpoint si registrano mediana e minimo di `--ripetizioni` chiamate
+(dopo una di riscaldamento) e il numero di query SQL; per ogni task la durata e
+le righe elaborate. Il risultato si confronta con la baseline in
+`benchmarks/baselines/api.json`: una mediana oltre la tolleranza o un numero di
+query diverso fa uscire con codice 1. Dopo un'ottimizzazione (o un
+peggioramento voluto) la baseline si rigenera con `--salva-baseline` e va nella
+stessa PR, così il reviewer vede i numeri cambiare.
+
+    python -m benchmarks.api                         # misura e confronta
+    python -m benchmarks.api --salva-baseline        # riscrive la baseline
+    python -m benchmarks.api --transazioni 5000 -r 3 # giro veloce, senza confronto
+
+Il database è un SQLite temporaneo; `BENCH_DATABASE_URL` ne indica un altro (ad
+es. un Postgres vuoto e usa e getta: il benchmark ci crea le tabelle e i dati).
+Le baseline valgono solo a parità di database, dimensioni e seme. Su SQLite i
+saldi sono sommati in virgola mobile e la riconciliazione segnala derive di
+arrotondamento che su Postgres non ci sono.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import auth
+import rate_limit
+from benchmarks.dataset import genera_dataset
+from database import Base, SessionLocal, get_db
+from main import app
+from services import (
+    task_pulizia_refresh_token,
+    task_ricarica_automatica_conti,
+    task_riconciliazione_saldi,
+    task_snapshot_saldi,
+    task_transazioni_ricorrenti,
+)
+
+BASELINE = Path(__file__).parent / "baselines" / "api.json"
+
+TASKS = (
+    task_transazioni_ricorrenti,
+    task_ricarica_automatica_conti,
+    task_snapshot_saldi,
+    task_riconciliazione_saldi,
+    task_pulizia_refresh_token,
+)
+
+_QUERY = re.compile(r'desc="(\d+) queries"')
+
+
+def endpoint(dataset) -> dict[str, str]:
+    """Nome -> URL delle chiamate da misurare, sui dati del dataset."""
+    anno = dataset.oggi.year - 1
+    periodo = f"data_inizio={dataset.inizio}&data_fine={dataset.oggi}"
+    ultima_pagina = dataset.transazioni // 50
+    return {
+        "transazioni_paginated_first": "/transazioni/paginated?page=1&size=50",
+        "transazioni_paginated_deep": (
+            f"/transazioni/paginated?page={ultima_pagina}&size=50"
+        ),
+        "transazioni_recent": "/transazioni?n=100",
+        "statistics_year_details": f"/statistics/yearDetails?year={anno}",
+        "statistics_month_details": (
+            f"/statistics/monthDetails?year={anno}&month={dataset.oggi.month}"
+        ),
+        "charts_income_expense": f"/charts/income-expense?{periodo}",
+        "charts_savings": f"/charts/savings?{periodo}",
+        "charts_expense_composition": f"/charts/expense-composition?{periodo}",
+        "charts_category_trend": (
+            f"/charts/category-trend?categoria_id={dataset.categoria_id}&{periodo}"
+        ),
+        "conti_current_month_expenses": (
+            "/conti/currentMonthExpenses?include_future_recurring=true"
+        ),
+        "conti_expenses_by_category": "/conti/expensesByCategory",
+        "conti_forecast": "/conti/forecast?months=12",
+        "investimenti": "/investimenti",
+    }
+
+
+def _misura_endpoint(client: TestClient, url: str, ripetizioni: int) -> dict:
+    durate = []
+    query = None
+    for giro in range(ripetizioni + 1):
+        inizio = time.perf_counter()
+        risposta = client.get(url)
+        durata = (time.perf_counter() - inizio) * 1000
+        if risposta.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {risposta.status_code} {risposta.text}")
+        if giro:  # la prima è di riscaldamento
+            durate.append(durata)
+        conteggio = _QUERY.search(risposta.headers.get("Server-Timing", ""))
+        query = int(conteggio.group(1)) if conteggio else None
+    return {
+        "median_ms": round(statistics.median(durate), 2),
+        "min_ms": round(min(durate), 2),
+        "queries": query,
+    }
+
+
+def esegui(
+    database_url: Optional[str], transazioni: int, ripetizioni: int, seed: int
+) -> dict:
+    with tempfile.TemporaryDirectory() as cartella:
+        engine = create_engine(
+            database_url or f"sqlite:///{Path(cartella) / 'bench.db'}"
+        )
+        Base.metadata.create_all(engine)
+        sessioni = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+        inizio = time.perf_counter()
+        with sessioni() as db:
+            dataset = genera_dataset(db, seed=seed, transazioni=transazioni)
+        generazione_s = time.perf_counter() - inizio
+        print(f"dataset: {dataset.transazioni} transazioni in {generazione_s:.1f}s")
+
+        def get_db_bench():
+            db = sessioni()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        # I task aprono le sessioni da SessionLocal, come nel worker
+        SessionLocal.configure(bind=engine)
+        app.dependency_overrides[get_db] = get_db_bench
+        app.dependency_overrides[auth.get_current_user_id] = lambda: dataset.user_id
+        rate_limit.USER_QUOTA = rate_limit.parse("1000000/second")
+
+        risultati = {
+            "environment": {
+                "database": engine.dialect.name,
+                "transactions": dataset.transazioni,
+                "seed": seed,
+                "repeat": ripetizioni,
+                "python": platform.python_version(),
+            },
+            "endpoints": {},
+            "tasks": {},
+        }
+        try:
+            with TestClient(app) as client:
+                for nome, url in endpoint(dataset).items():
+                    misura = _misura_endpoint(client, url, ripetizioni)
+                    risultati["endpoints"][nome] = misura
+                    print(f"{nome:<32} {misura['median_ms']:>9.1f} ms")
+
+            for task in TASKS:
+                inizio = time.perf_counter()
+                righe = task()
+                durata = (time.perf_counter() - inizio) * 1000
+                risultati["tasks"][task.__name__] = {
+                    "ms": round(durata, 1),
+                    "rows": righe,
+                }
+                print(f"{task.__name__:<32} {durata:>9.1f} ms  {righe} righe")
+        finally:
+            app.dependency_overrides.clear()
+            engine.dispose()
+    return risultati
+
+
+def confronta(risultati: dict, baseline: dict, tolleranza: float) -> list[str]:
+    """Regressioni rispetto alla baseline: tempi oltre `tolleranza` (0.5 = +50%)
+    e qualunque variazione nel numero di query."""
+    chiavi = ("database", "transactions", "seed")
+    ambiente, ambiente_base = risultati["environment"], baseline["environment"]
+    if any(ambiente[k] != ambiente_base.get(k) for k in chiavi):
+        print("Ambiente diverso da quello della baseline: confronto saltato")
+        return []
+    regressioni = []
+    for sezione, campo in (("endpoints", "median_ms"), ("tasks", "ms")):
+        for nome, misura in risultati[sezione].items():
+            base = baseline[sezione].get(nome)
+            if base is None:
+                continue
+            if misura[campo] > base[campo] * (1 + tolleranza):
+                regressioni.append(
+                    f"{nome}: {misura[campo]:.1f} ms contro {base[campo]:.1f} ms"
+                )
+            if misura.get("queries") != base.get("queries"):
+                regressioni.append(
+                    f"{nome}: {misura['queries']} query contro {base['queries']}"
+                )
+    return regressioni
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark di API e job")
+    parser.add_argument("--transazioni", type=int, default=50_000)
+    parser.add_argument("-r", "--ripetizioni", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--salva-baseline", action="store_true")
+    parser.add_argument(
+        "--tolleranza",
+        type=float,
+        default=0.5,
+        help="rallentamento accettato rispetto alla baseline (0.5 = +50%%)",
+    )
+    args = parser.parse_args(argv)
+    # services.py configura il logging a INFO: una riga per richiesta e per
+    # task coprirebbe i risultati
+    logging.getLogger().setLevel(logging.WARNING)
+
+    risultati = esegui(
+        os.getenv("BENCH_DATABASE_URL"), args.transazioni, args.ripetizioni, args.seed
+    )
+
+    if args.salva_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(risultati, indent=2) + "\n")
+        print(f"Baseline salvata in {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"Nessuna baseline in {args.baseline}")
+        return 0
+
+    regressioni = confronta(
+        risultati, json.loads(args.baseline.read_text()), args.tolleranza
+    )
+    for regressione in regressioni:
+        print(f"REGRESSIONE {regressione}")
+    return 1 if regressioni else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
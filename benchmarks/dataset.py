@@ -0,0 +1,343 @@
+"""Generatore deterministico di un utente "pesante" per i benchmark.
+
+Stesso seme, stessi dati: 10 conti, 50k transazioni distribuite su 10 anni fino
+a `oggi` (uscite, entrate, giroconti, accantonamenti, spese divise in più parti
+e rimborsi collegati alla spesa), ricorrenze attive già scadute (lavoro per il
+job delle ricorrenze), un conto con ricarica automatica, refresh token vecchi
+da ripulire e investimenti con lo storico di un PAC mensile.
+
+Le transazioni passano da `services._scrivi_transazioni_in_blocco`, come gli
+import: saldi dei conti e ledger tornano con le transazioni.
+
+    from benchmarks.dataset import genera_dataset
+    dataset = genera_dataset(db, transazioni=5_000)
+"""
+
+import hashlib
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+import models
+from ledger import effetti_transazione
+from services import _scrivi_transazioni_in_blocco
+
+_CATEGORIE_USCITA = {
+    "Casa": ("Affitto", "Bollette", "Manutenzione"),
+    "Spesa": ("Supermercato", "Mercato", "Panetteria"),
+    "Trasporti": ("Carburante", "Treno", "Parcheggio"),
+    "Salute": ("Farmacia", "Visite", "Dentista"),
+    "Svago": ("Ristoranti", "Cinema", "Viaggi"),
+    "Abbigliamento": ("Vestiti", "Scarpe", "Accessori"),
+    "Tecnologia": ("Elettronica", "Abbonamenti", "Software"),
+    "Famiglia": ("Scuola", "Sport", "Regali"),
+}
+_CATEGORIE_ENTRATA = {"Lavoro": ("Stipendio", "Bonus", "Rimborsi spese")}
+_TAG = ("vacanza", "lavoro", "regalo", "urgente", "online", "contanti")
+_DESCRIZIONI = (
+    "Pagamento POS SUPERMERCATO ROSSI",
+    "Bonifico a favore di MARIO BIANCHI",
+    "Addebito SDD utenze luce e gas",
+    "Prelievo bancomat ATM 0123",
+    "Pagamento Amazon Marketplace",
+    "Rifornimento ENI STATION",
+    "Abbonamento mensile palestra",
+)
+_FREQUENZE = ("GIORNALIERA", "SETTIMANALE", "MENSILE", "ANNUALE")
+_TITOLI = (
+    ("IE00B4L5Y983", "SWDA.MI", "iShares Core MSCI World"),
+    ("IE00BKM4GZ66", "EIMI.MI", "iShares Core MSCI EM IMI"),
+    ("IE00B3F81R35", "AGGH.MI", "iShares Core Global Aggregate Bond"),
+    ("LU0908500753", "MEUD.MI", "Amundi Stoxx Europe 600"),
+    ("IE00BFMXXD54", "VUAA.MI", "Vanguard S&P 500"),
+)
+
+_BLOCCO = 5_000
+
+
+@dataclass
+class DatasetGenerato:
+    user_id: int
+    conto_ids: list[int]
+    categoria_id: int  # una categoria di uscita, per /charts/category-trend
+    transazioni: int
+    inizio: date
+    oggi: date
+
+
+def _importo(rng: random.Random, minimo: float, massimo: float) -> Decimal:
+    # Spese piccole frequenti e poche grandi: distribuzione sbilanciata verso il basso
+    valore = minimo + (massimo - minimo) * rng.random() ** 3
+    return Decimal(f"{valore:.2f}")
+
+
+def _tassonomia(db: Session, user_id: int, categorie: dict) -> list[tuple]:
+    """Crea categorie e sottocategorie; ritorna (categoria_id, [sottocategoria_id])."""
+    risultato = []
+    for nome, sottocategorie in categorie.items():
+        categoria = models.Categoria(nome=nome, user_id=user_id)
+        categoria.sottocategorie = [
+            models.Sottocategoria(nome=sotto, user_id=user_id)
+            for sotto in sottocategorie
+        ]
+        db.add(categoria)
+        db.flush()
+        risultato.append((categoria.id, [s.id for s in categoria.sottocategorie]))
+    return risultato
+
+
+def genera_dataset(
+    db: Session,
+    *,
+    seed: int = 42,
+    conti: int = 10,
+    transazioni: int = 50_000,
+    anni: int = 10,
+    oggi: Optional[date] = None,
+) -> DatasetGenerato:
+    """Crea l'utente e tutti i suoi dati, e fa commit. A parità di argomenti
+    (e di `oggi`) genera sempre le stesse righe."""
+    rng = random.Random(seed)
+    oggi = oggi or date.today()
+    inizio = oggi - relativedelta(years=anni)
+    giorni = (oggi - inizio).days
+
+    user = models.User(
+        username=f"bench{seed}",
+        email=f"bench{seed}@example.it",
+        hashed_password="!",  # nessun login: i benchmark sostituiscono l'utente corrente
+        total_budget=Decimal("1500.00"),
+    )
+    db.add(user)
+    db.flush()
+
+    uscite = _tassonomia(db, user.id, _CATEGORIE_USCITA)
+    entrate = _tassonomia(db, user.id, _CATEGORIE_ENTRATA)
+    tag_ids = []
+    for nome in _TAG:
+        tag = models.Tag(nome=nome, user_id=user.id)
+        db.add(tag)
+        db.flush()
+        tag_ids.append(tag.id)
+
+    lista_conti = [
+        models.Conto(nome=f"Conto {i + 1}", saldo=Decimal("0"), user_id=user.id)
+        for i in range(conti)
+    ]
+    lista_conti[0].nome = "Conto corrente"
+    lista_conti[0].default = True
+    lista_conti[-1].nome = "Salvadanaio"
+    db.add_all(lista_conti)
+    db.flush()
+    conto_ids = [c.id for c in lista_conti]
+    principale, salvadanaio = conto_ids[0], conto_ids[-1]
+    # Una prepagata ricaricata dal conto corrente, da controllare oggi
+    prepagata = lista_conti[1]
+    prepagata.nome = "Prepagata"
+    prepagata.ricarica_automatica = True
+    prepagata.conto_sorgente_id = principale
+    prepagata.soglia_minima = Decimal("200.00")
+    prepagata.budget_obiettivo = Decimal("500.00")
+    prepagata.frequenza_controllo = "MENSILE"
+    prepagata.prossimo_controllo = oggi
+
+    def riga(tipo, importo, giorno, conto_id, **altro):
+        if tipo in ("ENTRATA", "USCITA"):
+            categoria_id, sottocategorie = rng.choice(
+                entrate if tipo == "ENTRATA" else uscite
+            )
+            altro.setdefault("categoria_id", categoria_id)
+            altro.setdefault("sottocategoria_id", rng.choice(sottocategorie))
+        return {
+            "importo": importo,
+            "importo_netto": importo,
+            "tipo": tipo,
+            "data": giorno,
+            "descrizione": rng.choice(_DESCRIZIONI),
+            "conto_id": conto_id,
+            "user_id": user.id,
+            "tag_id": rng.choice(tag_ids) if rng.random() < 0.2 else None,
+            **altro,
+        }
+
+    # Prima le righe senza dipendenze (tutto tranne i rimborsi), poi i rimborsi,
+    # che hanno bisogno dell'id della spesa a cui si riferiscono.
+    righe: list[dict] = []
+    gruppi_split: list[list[int]] = []
+    rimborsi: list[tuple[int, dict]] = []  # (indice della spesa in righe, riga)
+    spese_recenti: list[int] = []
+    while len(righe) + len(rimborsi) < transazioni:
+        progresso = len(righe) + len(rimborsi)
+        giorno = inizio + timedelta(days=progresso * giorni // transazioni)
+        # Le spese passano per lo più dal conto corrente; gli altri conti vivono
+        # delle ricariche che ricevono da lì
+        conto_id = principale if rng.random() < 0.6 else rng.choice(conto_ids[1:-1])
+        scelta = rng.random()
+        if scelta < 0.03 and transazioni - progresso >= 3:
+            gruppo = []
+            for _ in range(rng.randint(2, 3)):
+                gruppo.append(len(righe))
+                righe.append(riga("USCITA", _importo(rng, 5, 150), giorno, conto_id))
+            gruppi_split.append(gruppo)
+        elif scelta < 0.05 and spese_recenti:
+            padre = rng.choice(spese_recenti)
+            spesa = righe[padre]
+            importo = (spesa["importo_netto"] * Decimal("0.5")).quantize(
+                Decimal("0.01")
+            )
+            if importo <= 0:
+                continue
+            spesa["importo_netto"] -= importo
+            rimborsi.append(
+                (padre, riga("RIMBORSO", importo, giorno, spesa["conto_id"]))
+            )
+        elif scelta < 0.08:
+            righe.append(
+                riga(
+                    "RICARICA",
+                    _importo(rng, 200, 2000),
+                    giorno,
+                    principale,
+                    conto_destinazione_id=rng.choice(conto_ids[1:-1]),
+                )
+            )
+        elif scelta < 0.10:
+            righe.append(
+                riga(
+                    "ACCANTONAMENTO",
+                    _importo(rng, 50, 300),
+                    giorno,
+                    principale,
+                    conto_destinazione_id=salvadanaio,
+                )
+            )
+        elif scelta < 0.22:
+            righe.append(riga("ENTRATA", _importo(rng, 200, 3000), giorno, principale))
+        else:
+            spese_recenti.append(len(righe))
+            spese_recenti = spese_recenti[-200:]
+            righe.append(riga("USCITA", _importo(rng, 2, 400), giorno, conto_id))
+
+    ids = _scrivi(db, righe)
+    _scrivi(
+        db,
+        [{**r, "parent_transaction_id": ids[padre]} for padre, r in rimborsi],
+    )
+    # Come dopo lo split via API: le parti portano l'id dell'originale, che qui
+    # non è mai esistito; usiamo quello della prima parte.
+    split = [
+        {"id": ids[i], "split_group_id": ids[gruppo[0]]}
+        for gruppo in gruppi_split
+        for i in gruppo
+    ]
+    if split:
+        db.execute(update(models.Transazione), split)
+
+    _ricorrenze(db, rng, user.id, conto_ids, uscite, entrate, oggi)
+    _investimenti(db, rng, user.id, inizio, oggi)
+    _refresh_token(db, user.id, oggi)
+    db.commit()
+
+    return DatasetGenerato(
+        user_id=user.id,
+        conto_ids=conto_ids,
+        categoria_id=uscite[0][0],
+        transazioni=len(righe) + len(rimborsi),
+        inizio=inizio,
+        oggi=oggi,
+    )
+
+
+def _scrivi(db: Session, righe: list[dict]) -> list[int]:
+    ids = []
+    for partenza in range(0, len(righe), _BLOCCO):
+        blocco = righe[partenza : partenza + _BLOCCO]
+        movimenti = [
+            {"conto_id": conto_id, "data": r["data"], "importo": delta, "riga": i}
+            for i, r in enumerate(blocco)
+            for conto_id, delta in effetti_transazione(
+                r["tipo"], r["importo"], r["conto_id"], r.get("conto_destinazione_id")
+            )
+        ]
+        ids += _scrivi_transazioni_in_blocco(db, blocco, movimenti)
+    return ids
+
+
+def _ricorrenze(db, rng, user_id, conto_ids, uscite, entrate, oggi) -> None:
+    """20 ricorrenze attive scadute da qualche giorno: il job le deve recuperare."""
+    righe = []
+    for i in range(20):
+        entrata = i % 5 == 0
+        categoria_id, sottocategorie = rng.choice(entrate if entrata else uscite)
+        righe.append(
+            {
+                "nome": f"Ricorrenza {i + 1}",
+                "importo": _importo(rng, 5, 1500 if entrata else 200),
+                "tipo": "ENTRATA" if entrata else "USCITA",
+                "frequenza": _FREQUENZE[i % len(_FREQUENZE)],
+                "prossima_esecuzione": oggi - timedelta(days=rng.randint(0, 20)),
+                "attiva": True,
+                "user_id": user_id,
+                "conto_id": rng.choice(conto_ids[:-1]),
+                "categoria_id": categoria_id,
+                "sottocategoria_id": rng.choice(sottocategorie),
+            }
+        )
+    db.execute(insert(models.Ricorrenza), righe)
+
+
+def _investimenti(db, rng, user_id, inizio, oggi) -> None:
+    """Un PAC mensile da 200 € per titolo, con prezzo a passeggiata casuale."""
+    for isin, ticker, nome in _TITOLI:
+        prezzo = rng.uniform(20, 120)
+        storico = []
+        giorno = inizio
+        while giorno <= oggi:
+            prezzo *= 1 + rng.gauss(0.005, 0.04)
+            quantita = Decimal(f"{200 / prezzo:.6f}")
+            storico.append(
+                models.StoricoInvestimento(
+                    data=giorno,
+                    quantita=quantita,
+                    prezzo_unitario=Decimal(f"{prezzo:.6f}"),
+                    valore_attuale=Decimal("200.00"),
+                )
+            )
+            giorno += relativedelta(months=1)
+        db.add(
+            models.Investimento(
+                isin=isin,
+                ticker=ticker,
+                nome_titolo=nome,
+                user_id=user_id,
+                prezzo_attuale=Decimal(f"{prezzo:.6f}"),
+                data_ultimo_aggiornamento=oggi,
+                storico=storico,
+            )
+        )
+    db.flush()
+
+
+def _refresh_token(db, user_id, oggi) -> None:
+    """Due anni di sessioni ruotate ogni giorno: quasi tutte da ripulire."""
+    adesso = datetime.combine(oggi, datetime.min.time())
+    righe = []
+    for i in range(730):
+        creato = adesso - timedelta(days=730 - i)
+        righe.append(
+            {
+                "user_id": user_id,
+                "token_hash": hashlib.sha256(f"{user_id}-{i}".encode()).hexdigest(),
+                "family_id": f"famiglia-{user_id}-{i // 30}",
+                "expires_at": creato + timedelta(days=90),
+                "created_at": creato,
+                "used_at": creato + timedelta(days=1) if i < 729 else None,
+            }
+        )
+    db.execute(insert(models.RefreshToken), righe)
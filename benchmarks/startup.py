@@ -0,0 +1,98 @@
+"""Benchmark dell'avvio dell'API: quanto costa `import main` a un processo nuovo.
+
+Ogni giro è un interprete nuovo (come un worker di uvicorn che parte o scala)
+che importa l'app e riporta il tempo dell'import, il tempo totale del processo
+e la memoria residente massima. Stampa mediana e minimo, i moduli più lenti
+(da `-X importtime`) e quali dipendenze pesanti sono state caricate: quelle in
+`MODULI_PESANTI` vanno importate solo dove servono (prezzi, estratti conto).
+
+    python -m benchmarks.startup         # 10 giri
+    python -m benchmarks.startup 30      # giri
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Dipendenze che l'avvio non deve caricare: yfinance (con pandas e NumPy) serve
+# solo al task dei prezzi, pdfplumber e openpyxl solo all'import degli estratti.
+MODULI_PESANTI = ("yfinance", "pandas", "numpy", "pdfplumber", "openpyxl")
+
+_FIGLIO = f"""
+import json, resource, sys, time
+inizio = time.perf_counter()
+import main
+durata = time.perf_counter() - inizio
+print(json.dumps({{
+    "import_s": durata,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "pesanti": [m for m in {MODULI_PESANTI!r} if m in sys.modules],
+}}))
+"""
+
+
+def avvio() -> dict:
+    """Un processo nuovo che importa l'app: tempi, memoria e moduli pesanti."""
+    inizio = time.perf_counter()
+    uscita = subprocess.run(
+        [sys.executable, "-c", _FIGLIO],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    risultato = json.loads(uscita.stdout.strip().splitlines()[-1])
+    risultato["processo_s"] = time.perf_counter() - inizio
+    return risultato
+
+
+def moduli_lenti(n: int = 10) -> list[tuple[str, float]]:
+    """I moduli con l'import cumulativo più lento, da `python -X importtime`."""
+    uscita = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    tempi = []
+    for riga in uscita.stderr.splitlines():
+        if not riga.startswith("import time:") or "|" not in riga:
+            continue
+        _, cumulativo, nome = riga.split("|")
+        if cumulativo.strip().isdigit():
+            tempi.append((nome.strip(), int(cumulativo) / 1_000_000))
+    return sorted(tempi, key=lambda t: t[1], reverse=True)[:n]
+
+
+def main(giri: int = 10) -> int:
+    misure = [avvio() for _ in range(giri)]
+    for campo, etichetta in (
+        ("import_s", "import main"),
+        ("processo_s", "processo"),
+    ):
+        valori = [m[campo] for m in misure]
+        print(
+            f"{etichetta:<12} mediana {statistics.median(valori) * 1000:7.0f} ms"
+            f"  min {min(valori) * 1000:7.0f} ms"
+        )
+    print(f"{'RSS max':<12} {max(m['rss_mb'] for m in misure):7.1f} MB")
+
+    print("\nmoduli più lenti (cumulativo):")
+    for nome, secondi in moduli_lenti():
+        print(f"  {secondi * 1000:7.0f} ms  {nome}")
+
+    pesanti = sorted({p for m in misure for p in m["pesanti"]})
+    if pesanti:
+        print(f"\ndipendenze pesanti caricate all'avvio: {', '.join(pesanti)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(a) for a in sys.argv[1:2])))
@@ -0,0 +1,90 @@
+"""Microbenchmark dei parser di estratti conto (PDF testuale e fogli di calcolo).
+
+Genera N movimenti sintetici in modo deterministico e misura i record/secondo
+di `iter_statement_movimenti` (righe di testo come quelle estratte dal PDF) e
+di `iter_statement_rows` (righe di celle CSV e Excel). L'estrazione del testo
+da pdfplumber e la lettura del file sono escluse: si misura il solo parsing.
+
+    python -m benchmarks.statement_parsers            # 100k righe
+    python -m benchmarks.statement_parsers 20000 5    # righe, ripetizioni
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from services import iter_statement_movimenti, iter_statement_rows
+
+_DESCRIZIONI = (
+    "Pagamento POS SUPERMERCATO ROSSI",
+    "Bonifico a favore di MARIO BIANCHI",
+    "Addebito SDD utenze luce e gas",
+    "Prelievo bancomat ATM 0123",
+    "Accredito stipendio",
+)
+
+
+def _importo_it(value: float) -> str:
+    intero, decimali = f"{abs(value):.2f}".split(".")
+    intero = f"{int(intero):,}".replace(",", ".")
+    return f"{'-' if value < 0 else ''}{intero},{decimali}"
+
+
+def _movimenti(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    start = datetime(2016, 1, 1)
+    for i in range(n):
+        giorno = start + timedelta(days=i * 3650 // n)
+        importo = round(rng.uniform(-2500, 2500), 2) or 1.0
+        yield giorno, rng.choice(_DESCRIZIONI), importo
+
+
+def pdf_lines(n: int) -> list[str]:
+    """Righe "da PDF": un movimento su tre va a capo su più righe."""
+    lines = ["ESTRATTO CONTO", "Saldo iniziale 1.000,00"]
+    for i, (giorno, descr, importo) in enumerate(_movimenti(n)):
+        d = giorno.strftime("%d/%m/%Y")
+        if i % 3 == 0:
+            lines += [f"{d} {d} {descr}", "CARTA 1234", f"{_importo_it(importo)} €"]
+        else:
+            lines.append(f"{d} {descr} {_importo_it(importo)}")
+    return lines
+
+
+def csv_rows(n: int) -> list[list]:
+    rows = [["Data", "Data valuta", "Operazione", "Entrate", "Uscite"]]
+    for giorno, descr, importo in _movimenti(n):
+        d = giorno.strftime("%d/%m/%Y")
+        entrata = _importo_it(importo) if importo > 0 else ""
+        uscita = _importo_it(-importo) if importo < 0 else ""
+        rows.append([d, d, f"  {descr}  ", entrata, uscita])
+    return rows
+
+
+def xlsx_rows(n: int) -> list[list]:
+    rows = [["Data contabile", "Descrizione", "Importo"]]
+    for giorno, descr, importo in _movimenti(n):
+        rows.append([giorno, descr, importo])
+    return rows
+
+
+def _bench(name: str, run, repeat: int) -> None:
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = sum(1 for _ in run())
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:<6} {count:>8} record  {best:8.3f}s  {count / best:>12,.0f} record/s")
+
+
+def main(n: int = 100_000, repeat: int = 3) -> None:
+    lines, rows_csv, rows_xlsx = pdf_lines(n), csv_rows(n), xlsx_rows(n)
+    _bench("pdf", lambda: iter_statement_movimenti(lines), repeat)
+    _bench("csv", lambda: iter_statement_rows(rows_csv, provider="CSV"), repeat)
+    _bench("xlsx", lambda: iter_statement_rows(rows_xlsx, provider="EXCEL"), repeat)
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
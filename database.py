@@ -4,6 +4,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from metrics import QueuePoolMisurato
+
 # Carica le variabili dal file .env
 load_dotenv()
 
@@ -17,7 +19,8 @@ database = os.getenv("DB_NAME")
 # Componi l'URL in modo dinamico
 SQLALCHEMY_DATABASE_URL = f"postgresql://{user}:{password}@{host}:{port}/{database}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Il pool è il QueuePool di default, che in più misura l'attesa di una connessione
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=QueuePoolMisurato)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,136 @@
+"""Previsione dei saldi dalle ricorrenze.
+
+Le ricorrenze attive si espandono nelle esecuzioni future fino all'orizzonte
+richiesto e, partendo dal saldo attuale di ogni conto, danno il saldo previsto
+giorno per giorno. Le date seguono le stesse regole con cui
+`services.task_transazioni_ricorrenti` le esegue davvero (`avanza_ricorrenza`):
+giornaliere e settimanali sono un passo fisso in giorni e si calcolano per
+aritmetica, senza iterare; mensili e annuali avanzano di un periodo alla volta
+(31 gennaio -> 28 febbraio -> 28 marzo), come il task.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+from ledger import effetti_transazione
+
+_PASSO_GIORNI = {"GIORNALIERA": 1, "SETTIMANALE": 7}
+
+
+def avanza_ricorrenza(giorno: date, frequenza: str) -> Optional[date]:
+    """Data dell'esecuzione successiva a `giorno` (None se la frequenza non è nota)."""
+    if frequenza in _PASSO_GIORNI:
+        return giorno + timedelta(days=_PASSO_GIORNI[frequenza])
+    if frequenza == "MENSILE":
+        return giorno + relativedelta(months=1)
+    if frequenza == "ANNUALE":
+        return giorno + relativedelta(years=1)
+    return None
+
+
+def espandi_ricorrenza(prossima: date, frequenza: str, fino_a: date) -> list[date]:
+    """Date delle esecuzioni da `prossima` a `fino_a` inclusi.
+
+    Una frequenza sconosciuta non avanza: una sola esecuzione, come nel task.
+    """
+    if prossima > fino_a:
+        return []
+    passo = _PASSO_GIORNI.get(frequenza)
+    if passo is not None:
+        quante = (fino_a - prossima).days // passo + 1
+        return [prossima + timedelta(days=passo * i) for i in range(quante)]
+
+    date_esecuzione = []
+    giorno: Optional[date] = prossima
+    while giorno is not None and giorno <= fino_a:
+        date_esecuzione.append(giorno)
+        giorno = avanza_ricorrenza(giorno, frequenza)
+    return date_esecuzione
+
+
+def movimenti_previsti(
+    ricorrenze: Iterable, data_inizio: date, data_fine: date
+) -> dict[int, dict[date, Decimal]]:
+    """Per conto, la variazione di saldo prevista in ogni giorno con esecuzioni.
+
+    `ricorrenze` sono righe con conto_id, tipo, importo, frequenza e
+    prossima_esecuzione. Le esecuzioni arretrate (prima di `data_inizio`) non
+    sono ancora sul saldo: il task le registra al prossimo giro, quindi cadono a
+    `data_inizio`.
+    """
+    previsti: dict[int, dict[date, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+    for ric in ricorrenze:
+        effetti = effetti_transazione(ric.tipo, ric.importo, ric.conto_id)
+        for giorno in espandi_ricorrenza(
+            ric.prossima_esecuzione, ric.frequenza, data_fine
+        ):
+            for conto_id, delta in effetti:
+                previsti[conto_id][max(giorno, data_inizio)] += delta
+    return previsti
+
+
+def proietta_saldi(
+    db: Session, user_id: int, data_fine: date, data_inizio: Optional[date] = None
+) -> list[dict]:
+    """Saldo previsto di ogni conto attivo dell'utente da oggi (o `data_inizio`) a
+    `data_fine`, in due query: conti e ricorrenze attive.
+
+    Per conto: saldo attuale, finale e minimo (con la sua data) e i punti di un
+    grafico a gradini, cioè `data_inizio`, ogni giorno in cui il saldo cambia e
+    `data_fine`; tra un punto e l'altro il saldo resta quello del punto prima.
+    """
+    data_inizio = data_inizio or date.today()
+    conti = db.execute(
+        select(models.Conto.id, models.Conto.nome, models.Conto.saldo)
+        .where(models.Conto.user_id == user_id, models.Conto.deleted_at.is_(None))
+        .order_by(models.Conto.id)
+    ).all()
+    ricorrenze = db.execute(
+        select(
+            models.Ricorrenza.conto_id,
+            models.Ricorrenza.tipo,
+            models.Ricorrenza.importo,
+            models.Ricorrenza.frequenza,
+            models.Ricorrenza.prossima_esecuzione,
+        ).where(
+            models.Ricorrenza.user_id == user_id,
+            models.Ricorrenza.attiva,
+            models.Ricorrenza.prossima_esecuzione <= data_fine,
+            models.Ricorrenza.conto_id.in_([conto.id for conto in conti]),
+        )
+    ).all()
+    previsti = movimenti_previsti(ricorrenze, data_inizio, data_fine)
+
+    risultato = []
+    for conto in conti:
+        saldo = conto.saldo or Decimal("0")
+        minimo, data_minimo = saldo, data_inizio
+        punti = {data_inizio: saldo}
+        for giorno, delta in sorted(previsti.get(conto.id, {}).items()):
+            saldo += delta
+            punti[giorno] = saldo
+            if saldo < minimo:
+                minimo, data_minimo = saldo, giorno
+        punti.setdefault(data_fine, saldo)
+        risultato.append(
+            {
+                "conto_id": conto.id,
+                "nome": conto.nome,
+                "saldo_attuale": conto.saldo or Decimal("0"),
+                "saldo_finale": saldo,
+                "saldo_minimo": minimo,
+                "data_saldo_minimo": data_minimo,
+                "punti": [
+                    {"data": giorno, "saldo": valore}
+                    for giorno, valore in sorted(punti.items())
+                ],
+            }
+        )
+    return risultato
@@ -0,0 +1,142 @@
+"""Quante query SQL fa una richiesta, e quanto tempo passa nel DB.
+
+Gli eventi `before_cursor_execute` / `after_cursor_execute` sono registrati su
+tutti gli Engine: se c'è una misura attiva (`misura_query`, aperta dal middleware
+per ogni richiesta HTTP) ogni statement ne aggiorna conteggio, tempo totale e
+statement più lento. La misura vive in una ContextVar: gli endpoint sincroni
+girano nel thread pool con una copia del contesto, quindi aggiornano lo stesso
+oggetto della richiesta.
+
+`QueryStatsMiddleware` scrive i numeri nei log (campi `db_queries`, `db_ms`,
+`db_slowest_ms`, `db_slowest_sql`) e, fuori produzione, nell'header
+`Server-Timing`, leggibile dal pannello Network del browser. Nei test
+`misura_query` regge la fixture `max_queries` (tests/conftest.py).
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StatisticheQuery:
+    query: int = 0
+    durata_ms: float = 0.0
+    piu_lenta_ms: float = 0.0
+    piu_lenta_sql: Optional[str] = None
+
+    def registra(self, statement: str, durata_ms: float) -> None:
+        self.query += 1
+        self.durata_ms += durata_ms
+        if durata_ms >= self.piu_lenta_ms:
+            self.piu_lenta_ms = durata_ms
+            self.piu_lenta_sql = statement
+
+    def server_timing(self, totale_ms: float) -> str:
+        return ", ".join(
+            (
+                f'db;dur={self.durata_ms:.1f};desc="{self.query} queries"',
+                f"db-slowest;dur={self.piu_lenta_ms:.1f}",
+                f"app;dur={totale_ms:.1f}",
+            )
+        )
+
+
+_corrente: ContextVar[Optional[StatisticheQuery]] = ContextVar(
+    "statistiche_query", default=None
+)
+
+
+@contextmanager
+def misura_query() -> Iterator[StatisticheQuery]:
+    """Conta gli statement eseguiti (da qualsiasi engine) dentro il blocco."""
+    stats = StatisticheQuery()
+    token = _corrente.set(stats)
+    try:
+        yield stats
+    finally:
+        _corrente.reset(token)
+
+
+# L'inizio sta sul contesto di esecuzione dello statement, non sulla connessione:
+# uno statement che solleva non arriva ad `after_cursor_execute`, e un inizio
+# lasciato sulla connessione lo erediterebbe la query successiva.
+_INIZIO = "_instrumentation_inizio_query"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _prima_della_query(conn, cursor, statement, parameters, context, executemany):
+    if _corrente.get() is not None and context is not None:
+        setattr(context, _INIZIO, time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _dopo_la_query(conn, cursor, statement, parameters, context, executemany):
+    stats = _corrente.get()
+    inizio = getattr(context, _INIZIO, None)
+    if stats is None or inizio is None:
+        return
+    stats.registra(statement, (time.perf_counter() - inizio) * 1000)
+
+
+class QueryStatsMiddleware:
+    """Middleware ASGI: misura le query di ogni richiesta HTTP.
+
+    ASGI puro (non BaseHTTPMiddleware) così l'app gira nello stesso task e
+    contesto in cui è aperta la misura.
+    """
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inizio = time.perf_counter()
+        status_code = 500
+        with misura_query() as stats:
+
+            async def send_con_header(message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    if self.server_timing:
+                        totale_ms = (time.perf_counter() - inizio) * 1000
+                        MutableHeaders(scope=message).append(
+                            "Server-Timing", stats.server_timing(totale_ms)
+                        )
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_con_header)
+            finally:
+                logger.info(
+                    "%s %s -> %s: %d query, %.1f ms nel DB",
+                    scope["method"],
+                    scope["path"],
+                    status_code,
+                    stats.query,
+                    stats.durata_ms,
+                    extra={
+                        "http_method": scope["method"],
+                        "http_path": scope["path"],
+                        "http_status": status_code,
+                        "duration_ms": round((time.perf_counter() - inizio) * 1000, 1),
+                        "db_queries": stats.query,
+                        "db_ms": round(stats.durata_ms, 1),
+                        "db_slowest_ms": round(stats.piu_lenta_ms, 1),
+                        "db_slowest_sql": stats.piu_lenta_sql,
+                    },
+                )
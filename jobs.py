@@ -0,0 +1,175 @@
+"""Esecuzione dei job schedulati con lo scheduler attivo su più repliche.
+
+Ogni replica può far girare lo stesso `BackgroundScheduler`: quando un cron
+scatta, `esegui_job` prima prenota lo scatto inserendo la riga (job, slot) in
+`job_runs`, dove l'indice unico lascia passare solo la prima replica; le altre
+saltano. Su Postgres il job tiene anche un `pg_try_advisory_lock` per tutta la
+durata, così due esecuzioni dello stesso job con slot diversi (un giro lungo
+che sconfina nel successivo, un lancio a mano) non si sovrappongono.
+
+Non c'è un leader da eleggere né da sostituire: se la replica che ha preso uno
+scatto muore, la sua riga resta RUNNING e lo scatto successivo lo prende chi
+arriva prima. La riga registra esito, durata e righe elaborate (il valore di
+ritorno del task, se è un intero); gli stessi numeri vanno nelle metriche
+Prometheus del processo (metrics.py). L'esito è ERROR solo se il task solleva:
+i `task_*` fanno rollback e log dell'errore e poi lo rilanciano.
+"""
+
+import logging
+import os
+import socket
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, Optional
+
+from apscheduler.triggers.base import BaseTrigger
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+from metrics import registra_esecuzione_job
+
+logger = logging.getLogger(__name__)
+
+ISTANZA = f"{socket.gethostname()}:{os.getpid()}"
+
+# Esiti di un'esecuzione
+RUNNING = "RUNNING"
+OK = "OK"
+ERROR = "ERROR"
+SKIPPED = "SKIPPED"  # slot preso, ma il job girava ancora (lock occupato)
+
+
+def _ora() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _chiave_lock(job: str) -> int:
+    """Chiave stabile dell'advisory lock di un job (uguale su tutte le repliche)."""
+    return zlib.crc32(f"job_runs:{job}".encode())
+
+
+@contextmanager
+def _lock_job(engine: Engine, job: str) -> Iterator[bool]:
+    """Advisory lock di sessione su una connessione dedicata in autocommit (il job
+    apre le sue sessioni: qui non deve restare una transazione aperta). Fuori da
+    Postgres basta la prenotazione dello slot."""
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    chiave = _chiave_lock(job)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        preso = conn.scalar(select(func.pg_try_advisory_lock(chiave)))
+        try:
+            yield bool(preso)
+        finally:
+            if preso:
+                conn.scalar(select(func.pg_advisory_unlock(chiave)))
+
+
+def esegui_job(
+    job: str,
+    funzione: Callable[[], Optional[int]],
+    *,
+    session_factory=SessionLocal,
+    istanza: str = ISTANZA,
+    slot: Optional[datetime] = None,
+) -> Optional[int]:
+    """Esegue `funzione` se questa istanza si aggiudica lo scatto `slot` (di default
+    il minuto corrente) del job. Ritorna l'id della riga in `job_runs`, o None se
+    lo scatto l'ha già preso un'altra istanza."""
+    inizio = _ora()
+    slot = slot or inizio.replace(second=0, microsecond=0)
+    db = session_factory()
+    try:
+        run = models.JobRun(
+            job=job, slot=slot, instance=istanza, status=RUNNING, started_at=inizio
+        )
+        db.add(run)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            logger.info("Job %s delle %s già preso da un'altra istanza", job, slot)
+            return None
+
+        with _lock_job(db.get_bind(), job) as preso:
+            cronometro = time.perf_counter()
+            if not preso:
+                logger.warning("Job %s ancora in esecuzione altrove: salto", job)
+                run.status = SKIPPED
+            else:
+                try:
+                    righe = funzione()
+                    run.status = OK
+                    run.rows = righe if isinstance(righe, int) else None
+                except Exception as e:
+                    logger.exception("Errore nel job %s", job)
+                    run.status = ERROR
+                    run.error = str(e)
+            durata = time.perf_counter() - cronometro
+            run.finished_at = _ora()
+            run.duration_ms = int(durata * 1000)
+            db.commit()
+            registra_esecuzione_job(job, run.status, durata, run.rows)
+        return run.id
+    finally:
+        db.close()
+
+
+def ultimo_scatto(
+    trigger: BaseTrigger, adesso: datetime, finestra: timedelta
+) -> Optional[datetime]:
+    """L'ultimo scatto di `trigger` non oltre `adesso` e al più `finestra` prima,
+    in UTC naive come gli slot di `job_runs`; None se non ce n'è."""
+    scatto = None
+    prossimo = trigger.get_next_fire_time(None, adesso - finestra)
+    while prossimo is not None and prossimo <= adesso:
+        scatto = prossimo
+        prossimo = trigger.get_next_fire_time(
+            scatto, scatto + timedelta(microseconds=1)
+        )
+    if scatto is None:
+        return None
+    return scatto.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def job_schedulato(
+    funzione: Callable[[], Optional[int]],
+    *,
+    trigger: Optional[BaseTrigger] = None,
+    ritardo_max: timedelta = timedelta(hours=1),
+    session_factory=SessionLocal,
+    istanza: str = ISTANZA,
+) -> Callable[[], Optional[int]]:
+    """`funzione` pronta per `scheduler.add_job`: passa da `esegui_job` col suo
+    nome come nome del job.
+
+    Con `trigger` lo slot è l'istante dello scatto, non il minuto in cui la
+    replica parte: due repliche svegliate a cavallo del minuto, o una in ritardo
+    (thread occupati, misfire), prenotano lo stesso slot e il job gira una volta.
+    Gli scatti più vecchi di `ritardo_max` non si riconoscono più e si torna al
+    minuto di partenza."""
+    nome = funzione.__name__
+
+    def esegui() -> Optional[int]:
+        slot = None
+        if trigger is not None:
+            slot = ultimo_scatto(trigger, datetime.now(timezone.utc), ritardo_max)
+            if slot is None:
+                logger.warning(
+                    "Job %s: nessuno scatto negli ultimi %s, uso il minuto corrente",
+                    nome,
+                    ritardo_max,
+                )
+        return esegui_job(
+            nome, funzione, session_factory=session_factory, istanza=istanza, slot=slot
+        )
+
+    esegui.__name__ = nome
+    return esegui
@@ -0,0 +1,417 @@
+"""Ledger dei saldi dei conti.
+
+Ogni variazione di `Conto.saldo` è anche una riga append-only di
+`MovimentoSaldo` (conto, data contabile, importo con segno, causale): il saldo
+corrente è la somma dei movimenti del conto, e il saldo a una data passata è la
+somma dei movimenti fino a quella data.
+
+Per non sommare ogni volta tutta la storia, `SaldoSnapshot` fissa il saldo di
+fine giornata a intervalli (a fine mese, vedi `crea_snapshot_mensili`): il saldo
+a una data è lo snapshot più recente non successivo più i pochi movimenti tra i
+due, entrambi letti sull'indice (conto_id, data).
+
+Le scritture passano da `registra_movimento` (o `registra_movimenti` per gli
+import in blocco), mai da `conto.saldo += ...` diretti: il saldo si aggiorna nel
+DB con `UPDATE conti SET saldo = saldo + :delta`, atomico rispetto alle altre
+scritture sullo stesso conto (UI, scheduler, più schede aperte). Un
+`conto.saldo = letto + delta` sull'oggetto ORM perderebbe l'aggiornamento di chi
+ha scritto tra la lettura e il flush.
+
+Quando una stessa transazione DB tocca più conti (giroconti, storno + nuovo
+movimento su conti diversi) i lock delle righe vanno presi sempre in ordine di
+id, così due scritture incrociate sugli stessi conti non vanno in deadlock:
+`registra_transazione` applica gli effetti in quest'ordine e `blocca_conti`
+blocca in anticipo tutti i conti di un'operazione in più passi.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import (
+    Select,
+    bindparam,
+    case,
+    func,
+    insert,
+    literal,
+    select,
+    union_all,
+    update,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import models
+
+# Causali dei movimenti
+APERTURA = "APERTURA"  # saldo iniziale alla creazione del conto
+TRANSAZIONE = "TRANSAZIONE"  # effetto di una transazione (creata o modificata)
+STORNO = "STORNO"  # annullamento dell'effetto di una transazione
+RETTIFICA = "RETTIFICA"  # saldo corretto a mano dall'utente
+RICONCILIAZIONE = "RICONCILIAZIONE"  # deriva corretta da `riconcilia_saldi`
+
+_GIROCONTI = ("RICARICA", "ACCANTONAMENTO")
+
+
+def effetti_transazione(
+    tipo: str,
+    importo: Decimal,
+    conto_id: int,
+    conto_destinazione_id: Optional[int] = None,
+) -> list[tuple[int, Decimal]]:
+    """(conto_id, delta) che una transazione applica ai saldi.
+
+    USCITA toglie, ENTRATA e RIMBORSO aggiungono. RICARICA e ACCANTONAMENTO
+    spostano l'importo verso la destinazione (opzionale per l'accantonamento).
+    """
+    if tipo in _GIROCONTI:
+        effetti = [(conto_id, -importo)]
+        if conto_destinazione_id:
+            effetti.append((conto_destinazione_id, importo))
+        return effetti
+    return [(conto_id, -importo if tipo == "USCITA" else importo)]
+
+
+def _allinea_snapshot(db: Session, movimenti: list[dict]) -> None:
+    """Un movimento con data già coperta da snapshot li sposta tutti dalla sua data
+    in poi (executemany: di norma non tocca righe, gli snapshot sono nel passato)."""
+    snapshot = models.SaldoSnapshot.__table__
+    db.execute(
+        update(snapshot)
+        .where(
+            snapshot.c.conto_id == bindparam("b_conto_id"),
+            snapshot.c.data >= bindparam("b_data"),
+        )
+        .values(saldo=snapshot.c.saldo + bindparam("b_importo")),
+        [
+            {
+                "b_conto_id": m["conto_id"],
+                "b_data": m["data"],
+                "b_importo": m["importo"],
+            }
+            for m in movimenti
+        ],
+    )
+
+
+def blocca_conti(
+    db: Session, *conto_ids: Optional[int], user_id: Optional[int] = None
+) -> None:
+    """`SELECT ... FOR UPDATE` dei conti indicati, in ordine di id (gli id None
+    sono ignorati). Su SQLite, che blocca l'intero DB in scrittura, è un no-op.
+
+    Con `user_id` blocca solo i conti di quell'utente: gli id che arrivano dal
+    client non devono poter bloccare i conti di altri prima delle verifiche.
+    """
+    ids = sorted({conto_id for conto_id in conto_ids if conto_id is not None})
+    if ids:
+        query = select(models.Conto.id).where(models.Conto.id.in_(ids))
+        if user_id is not None:
+            query = query.where(models.Conto.user_id == user_id)
+        db.execute(query.order_by(models.Conto.id).with_for_update())
+
+
+def registra_movimento(
+    db: Session,
+    conto: models.Conto,
+    importo: Decimal,
+    data: date,
+    causale: str,
+    transazione: Optional[models.Transazione] = None,
+) -> None:
+    """Applica `importo` (con segno) al saldo del conto e lo registra nel ledger.
+
+    `transazione` può essere ancora da salvare: l'id arriva al flush.
+    """
+    if not importo:
+        return
+    conti = models.Conto.__table__
+    nuovo_saldo = db.execute(
+        update(conti)
+        .where(conti.c.id == conto.id)
+        .values(saldo=conti.c.saldo + importo)
+        .returning(conti.c.saldo)
+    ).scalar_one()
+    # L'oggetto ORM prende il valore calcolato dal DB senza risultare modificato:
+    # il flush non deve riscrivere sopra un saldo letto prima.
+    set_committed_value(conto, "saldo", nuovo_saldo)
+    db.add(
+        models.MovimentoSaldo(
+            conto_id=conto.id,
+            transazione=transazione,
+            data=data,
+            importo=importo,
+            causale=causale,
+        )
+    )
+    _allinea_snapshot(db, [{"conto_id": conto.id, "data": data, "importo": importo}])
+
+
+def registra_transazione(
+    db: Session,
+    transazione: models.Transazione,
+    *conti: Optional[models.Conto],
+    storno: bool = False,
+) -> None:
+    """Registra (o, con `storno`, annulla) l'effetto di `transazione` sui saldi.
+
+    `conti` sono i conti già caricati (sorgente ed eventuale destinazione); un
+    conto che non c'è (None) viene saltato, come faceva il codice che aggiornava
+    il saldo solo se trovava il conto. Lo storno è datato come la transazione,
+    così anche lo storico dei saldi la "dimentica": va chiamato PRIMA di
+    modificarne importo, tipo o conti.
+    """
+    per_id = {conto.id: conto for conto in conti if conto is not None}
+    effetti = effetti_transazione(
+        transazione.tipo,
+        transazione.importo,
+        transazione.conto_id,
+        transazione.conto_destinazione_id,
+    )
+    # In ordine di id: i lock sulle righe dei conti si prendono sempre così
+    for conto_id, importo in sorted(effetti, key=lambda effetto: effetto[0]):
+        conto = per_id.get(conto_id)
+        if conto is None:
+            continue
+        registra_movimento(
+            db,
+            conto,
+            -importo if storno else importo,
+            transazione.data or date.today(),
+            STORNO if storno else TRANSAZIONE,
+            transazione=transazione,
+        )
+
+
+def registra_movimenti(db: Session, movimenti: list[dict]) -> None:
+    """Solo ledger, in blocco: per chi aggiorna i saldi da sé con un UPDATE già
+    aggregato (import batch). Ogni dict ha conto_id, data, importo, causale e,
+    opzionale, transazione_id."""
+    if not movimenti:
+        return
+    db.execute(
+        insert(models.MovimentoSaldo),
+        [{"transazione_id": None, **m} for m in movimenti],
+    )
+    _allinea_snapshot(db, movimenti)
+
+
+def saldo_al(db: Session, conto_id: int, giorno: Optional[date] = None) -> Decimal:
+    """Saldo del conto a fine `giorno` secondo il ledger (senza data: ad oggi,
+    cioè la somma di tutti i movimenti)."""
+    movimento = models.MovimentoSaldo
+    totale = select(func.sum(movimento.importo)).where(movimento.conto_id == conto_id)
+    base = Decimal("0")
+    if giorno is not None:
+        snapshot = db.execute(
+            select(models.SaldoSnapshot.data, models.SaldoSnapshot.saldo)
+            .where(
+                models.SaldoSnapshot.conto_id == conto_id,
+                models.SaldoSnapshot.data <= giorno,
+            )
+            .order_by(models.SaldoSnapshot.data.desc())
+            .limit(1)
+        ).first()
+        totale = totale.where(movimento.data <= giorno)
+        if snapshot is not None:
+            base = snapshot.saldo
+            totale = totale.where(movimento.data > snapshot.data)
+    return base + (db.scalar(totale) or Decimal("0"))
+
+
+def storico_saldo(
+    db: Session, conto_id: int, data_inizio: date, data_fine: date
+) -> list[tuple[date, Decimal]]:
+    """Saldo di fine giornata a `data_inizio`, in ogni giorno con movimenti e a
+    `data_fine`: i punti di un grafico a gradini."""
+    movimento = models.MovimentoSaldo
+    saldo = saldo_al(db, conto_id, data_inizio - timedelta(days=1))
+    giorni = db.execute(
+        select(movimento.data, func.sum(movimento.importo))
+        .where(
+            movimento.conto_id == conto_id,
+            movimento.data >= data_inizio,
+            movimento.data <= data_fine,
+        )
+        .group_by(movimento.data)
+        .order_by(movimento.data)
+    ).all()
+
+    punti = {data_inizio: saldo}
+    for giorno, importo in giorni:
+        saldo += importo
+        punti[giorno] = saldo
+    punti.setdefault(data_fine, saldo)
+    return sorted(punti.items())
+
+
+def crea_snapshot_mensili(db: Session, giorno: date) -> int:
+    """Snapshot a fine `giorno` per tutti i conti che non l'hanno già, in una sola
+    INSERT ... SELECT sul ledger. Ritorna quanti snapshot ha creato."""
+    movimento = models.MovimentoSaldo
+    snapshot = models.SaldoSnapshot
+    gia_presenti = select(snapshot.conto_id).where(snapshot.data == giorno)
+    result = db.execute(
+        insert(snapshot).from_select(
+            ["conto_id", "data", "saldo", "creationDate"],
+            select(
+                movimento.conto_id,
+                literal(giorno),
+                func.sum(movimento.importo),
+                literal(datetime.now(timezone.utc)),
+            )
+            .where(
+                movimento.data <= giorno,
+                movimento.conto_id.not_in(gia_presenti),
+            )
+            .group_by(movimento.conto_id),
+        )
+    )
+    return result.rowcount
+
+
+def _saldi_attesi(conto_ids: list[int]) -> Select:
+    """(id, user_id, saldo, saldo atteso, somma del ledger) dei conti indicati, in
+    una sola query.
+
+    Il saldo atteso si ricalcola dalle transazioni (entrambi i lati di giroconti e
+    accantonamenti) più i movimenti che non vengono da una transazione (APERTURA e
+    RETTIFICA); le RICONCILIAZIONE restano fuori, altrimenti una deriva riparata
+    diventerebbe il nuovo riferimento. Contano anche le transazioni in soft-delete:
+    le nasconde solo la cancellazione del conto, che non tocca il saldo.
+    """
+    transazione = models.Transazione
+    movimento = models.MovimentoSaldo
+    conto = models.Conto
+    zero = literal(Decimal("0"))
+    effetti = union_all(
+        select(
+            transazione.conto_id.label("conto_id"),
+            case(
+                (transazione.tipo.in_(("USCITA",) + _GIROCONTI), -transazione.importo),
+                else_=transazione.importo,
+            ).label("atteso"),
+            zero.label("ledger"),
+        ).where(transazione.conto_id.in_(conto_ids)),
+        select(transazione.conto_destinazione_id, transazione.importo, zero).where(
+            transazione.tipo.in_(_GIROCONTI),
+            transazione.conto_destinazione_id.in_(conto_ids),
+        ),
+        select(
+            movimento.conto_id,
+            case(
+                (movimento.causale.in_((APERTURA, RETTIFICA)), movimento.importo),
+                else_=zero,
+            ),
+            movimento.importo,
+        ).where(movimento.conto_id.in_(conto_ids)),
+    ).subquery()
+    totali = (
+        select(
+            effetti.c.conto_id,
+            func.sum(effetti.c.atteso).label("atteso"),
+            func.sum(effetti.c.ledger).label("ledger"),
+        )
+        .group_by(effetti.c.conto_id)
+        .subquery()
+    )
+    return (
+        select(
+            conto.id,
+            conto.user_id,
+            conto.saldo,
+            func.coalesce(totali.c.atteso, 0).label("atteso"),
+            func.coalesce(totali.c.ledger, 0).label("ledger"),
+        )
+        .outerjoin(totali, totali.c.conto_id == conto.id)
+        .where(conto.id.in_(conto_ids))
+        .order_by(conto.id)
+    )
+
+
+def _conti_sfasati(db: Session, conto_ids: list[int]) -> list[dict]:
+    """Conti il cui saldo (o la cui somma del ledger) non è quella attesa."""
+    sfasati = []
+    for riga in db.execute(_saldi_attesi(conto_ids)):
+        atteso, ledger = Decimal(riga.atteso), Decimal(riga.ledger)
+        if riga.saldo != atteso or ledger != atteso:
+            sfasati.append(
+                {
+                    "conto_id": riga.id,
+                    "user_id": riga.user_id,
+                    "saldo": riga.saldo,
+                    "saldo_atteso": atteso,
+                    "saldo_ledger": ledger,
+                    "differenza": riga.saldo - atteso,
+                    "riparato": False,
+                }
+            )
+    return sfasati
+
+
+def riconcilia_saldi(
+    db: Session, ripara: bool = False, batch_size: int = 500
+) -> dict:
+    """Confronta saldo e ledger di ogni conto con il saldo ricalcolato dalle
+    transazioni.
+
+    I conti si scorrono per id a blocchi di `batch_size`, con una query aggregata
+    per blocco. Con `ripara` i conti sfasati si bloccano, la deriva si ricalcola
+    sotto lock (una transazione in corso non è una deriva), il saldo torna quello
+    atteso e un movimento RICONCILIAZIONE riallinea il ledger. Il commit è del
+    chiamante.
+    """
+    oggi = date.today()
+    verificati = 0
+    sfasati: list[dict] = []
+    ultimo_id = 0
+    while True:
+        conto_ids = list(
+            db.scalars(
+                select(models.Conto.id)
+                .where(models.Conto.id > ultimo_id)
+                .order_by(models.Conto.id)
+                .limit(batch_size)
+            )
+        )
+        if not conto_ids:
+            break
+        ultimo_id = conto_ids[-1]
+        verificati += len(conto_ids)
+
+        sfasati_blocco = _conti_sfasati(db, conto_ids)
+        if sfasati_blocco and ripara:
+            blocca_conti(db, *(d["conto_id"] for d in sfasati_blocco))
+            sfasati_blocco = _conti_sfasati(
+                db, [d["conto_id"] for d in sfasati_blocco]
+            )
+            conti = models.Conto.__table__
+            if sfasati_blocco:
+                db.execute(
+                    update(conti)
+                    .where(conti.c.id == bindparam("b_conto_id"))
+                    .values(saldo=conti.c.saldo - bindparam("b_differenza")),
+                    [
+                        {"b_conto_id": d["conto_id"], "b_differenza": d["differenza"]}
+                        for d in sfasati_blocco
+                    ],
+                )
+            registra_movimenti(
+                db,
+                [
+                    {
+                        "conto_id": d["conto_id"],
+                        "data": oggi,
+                        "importo": d["saldo_atteso"] - d["saldo_ledger"],
+                        "causale": RICONCILIAZIONE,
+                    }
+                    for d in sfasati_blocco
+                    if d["saldo_atteso"] != d["saldo_ledger"]
+                ],
+            )
+            for d in sfasati_blocco:
+                d["riparato"] = True
+        sfasati.extend(sfasati_blocco)
+
+    return {"conti_verificati": verificati, "conti_sfasati": sfasati}
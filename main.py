@@ -4,17 +4,15 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from apscheduler.schedulers.background import BackgroundScheduler
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+import passwords
+from database import engine
+from instrumentation import QueryStatsMiddleware
+from metrics import MetricsMiddleware, PasswordHashCollector, PoolCollector
+from prometheus_client import REGISTRY
 from rate_limit import limiter
-from services import (
-    task_aggiornamento_prezzi,
-    task_transazioni_ricorrenti,
-    task_ricarica_automatica_conti,
-    task_sync_bank_connectors,
-)
 from routers import (
     auth,
     conti,
@@ -31,39 +29,20 @@ from routers import (
     bank_connectors,
     bank_proposals,
     open_banking,
+    metrics,
 )
 
 logger = logging.getLogger(__name__)
 
-# Lo scheduler gira IN-PROCESS: se l'app viene avviata con più worker
-# (uvicorn/gunicorn --workers N) o scalata su più repliche, ogni processo ne
-# avvia una copia e i job cron partono N volte (transazioni ricorrenti,
-# ricariche e aggiornamenti prezzi duplicati). Deve quindi essere eseguito da
-# un solo processo: il gate qui sotto lo tiene attivo di default (deploy a
-# singolo worker) e va messo a "false" su tutte le repliche tranne una.
-RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() in ("1", "true", "yes")
-
-scheduler = BackgroundScheduler()
-scheduler.add_job(task_aggiornamento_prezzi, "cron", hour=2, minute=0)
-scheduler.add_job(task_transazioni_ricorrenti, "cron", hour=3, minute=0)
-scheduler.add_job(task_ricarica_automatica_conti, "cron", hour=4, minute=0)
-# Ogni 6 ore (4 volte/giorno): le API AIS (PSD2) limitano gli accessi non
-# presidiati, quindi una sync oraria genera 429 "Too Many Requests".
-scheduler.add_job(task_sync_bank_connectors, "cron", hour="*/6")
+# I job schedulati (prezzi, ricorrenze, ricariche, sync bancaria...) girano nel
+# processo separato di worker.py: qui si servono solo richieste.
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    if RUN_SCHEDULER:
-        scheduler.start()
-        logger.info("Scheduler avviato su questo processo")
-    else:
-        logger.info("Scheduler disabilitato su questo processo (RUN_SCHEDULER=false)")
     yield
-    # Shutdown
-    if RUN_SCHEDULER and scheduler.running:
-        scheduler.shutdown(wait=False)
+    # Shutdown: chiude i processi del pool degli hash password
+    passwords.shutdown()
 
 
 # In produzione la documentazione interattiva non va esposta: /docs e /openapi.json
@@ -86,6 +65,16 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Query SQL e tempo nel DB di ogni richiesta: nei log sempre, nell'header
+# Server-Timing solo fuori produzione (vedi instrumentation.py)
+app.add_middleware(QueryStatsMiddleware, server_timing=not IS_PRODUCTION)
+
+# Latenze per route e richieste in corso, esposte su /metrics insieme allo stato
+# del pool di connessioni e alla coda degli hash password (vedi metrics.py)
+app.add_middleware(MetricsMiddleware)
+REGISTRY.register(PoolCollector(engine))
+REGISTRY.register(PasswordHashCollector())
+
 # Middleware CORS (rimane qui)
 app.add_middleware(
     CORSMiddleware,
@@ -111,6 +100,7 @@ app.include_router(bank_proposals.router)  # Proposte di transazione (tutte le p
 app.include_router(open_banking.router)  # Open Banking (GoCardless) requisition flow
 app.include_router(debiti.router)  # Debiti
 app.include_router(auth.router)  # Endpoint per forgot-password e reset-password
+app.include_router(metrics.router)  # Metriche Prometheus (protette da METRICS_TOKEN)
 
 
 @app.get("/")
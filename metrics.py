@@ -0,0 +1,195 @@
+"""Metriche Prometheus di API, pool di connessioni, job e sync bancaria.
+
+Tutto finisce nel registry di default di `prometheus_client`:
+
+- richieste HTTP: istogramma delle latenze per metodo, route (il template, es.
+  `/conti/{conto_id}`, non il path: gli id farebbero esplodere le serie) e
+  status, più le richieste in corso (`MetricsMiddleware`);
+- pool SQLAlchemy: connessioni in uso, overflow e dimensione lette al momento
+  dello scrape (`PoolCollector`), e il tempo di attesa per avere una connessione
+  (`QueuePoolMisurato`, il pool dell'engine dell'app e del worker);
+- hash delle password: richieste in corso e in coda nel pool di passwords.py
+  (`PasswordHashCollector`);
+- job schedulati: durata, esiti e righe elaborate (registrati da
+  `jobs.esegui_job`);
+- sync bancaria: latenza per provider ed esito, e quante volte la banca ha
+  risposto 429 (`misura_sync_bancaria`).
+
+L'API le espone su `/metrics` (routers/metrics.py, protetto da token). I job e la
+sync schedulata girano nel processo di worker.py, che le espone su una porta sua
+(`WORKER_METRICS_PORT`): ogni processo ha i propri contatori.
+"""
+
+import functools
+import time
+
+import requests
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+import passwords
+
+# Job e sync durano da secondi a decine di minuti: i bucket di default
+# (fino a 10 s) li metterebbero tutti nell'ultimo.
+_BUCKET_LUNGHI = (0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+HTTP_DURATA = Histogram(
+    "http_request_duration_seconds",
+    "Latenza delle richieste HTTP",
+    ["method", "route", "status"],
+)
+HTTP_IN_CORSO = Gauge("http_requests_in_progress", "Richieste HTTP in corso")
+
+DB_POOL_ATTESA = Histogram(
+    "db_pool_wait_seconds",
+    "Attesa per ottenere una connessione dal pool (apertura inclusa)",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+JOB_DURATA = Histogram(
+    "job_duration_seconds",
+    "Durata delle esecuzioni dei job schedulati",
+    ["job"],
+    buckets=_BUCKET_LUNGHI,
+)
+JOB_ESECUZIONI = Counter(
+    "job_runs", "Esecuzioni dei job schedulati per esito", ["job", "status"]
+)
+JOB_RIGHE = Counter("job_rows_processed", "Righe elaborate dai job", ["job"])
+
+BANK_SYNC_DURATA = Histogram(
+    "bank_sync_duration_seconds",
+    "Latenza della lettura dei movimenti dalla banca",
+    ["provider", "outcome"],
+    buckets=_BUCKET_LUNGHI,
+)
+BANK_SYNC_429 = Counter(
+    "bank_sync_rate_limited",
+    "Risposte 429 Too Many Requests dal provider bancario",
+    ["provider"],
+)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza e richieste in corso per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inizio = time.perf_counter()
+        status_code = 500
+
+        async def send_con_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_CORSO.inc()
+        try:
+            await self.app(scope, receive, send_con_status)
+        finally:
+            HTTP_IN_CORSO.dec()
+            # Il router di FastAPI mette la route trovata nello scope
+            route = scope.get("route")
+            HTTP_DURATA.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - inizio)
+
+
+class QueuePoolMisurato(QueuePool):
+    """QueuePool che misura quanto si aspetta una connessione: col pool esaurito
+    è il tempo passato in coda, altrimenti quasi zero (o l'apertura di una
+    connessione nuova)."""
+
+    def _do_get(self):
+        inizio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_ATTESA.observe(time.perf_counter() - inizio)
+
+
+class PoolCollector(Collector):
+    """Stato del pool di `engine`, letto a ogni scrape."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        if not isinstance(pool, QueuePool):
+            return
+        for nome, descrizione, valore in (
+            ("db_pool_size", "Connessioni stabili del pool", pool.size()),
+            ("db_pool_checked_out", "Connessioni in uso", pool.checkedout()),
+            # Negativo finché il pool non ha aperto tutte le connessioni stabili
+            ("db_pool_overflow", "Connessioni oltre pool_size", pool.overflow()),
+        ):
+            yield GaugeMetricFamily(nome, descrizione, value=valore)
+
+
+class PasswordHashCollector(Collector):
+    """Coda degli hash bcrypt di passwords.py, letta a ogni scrape: `queued`
+    sopra zero a lungo vuol dire processi di hash insufficienti, vicino a
+    `max_pending` che il login sta per rispondere 503."""
+
+    def collect(self):
+        stats = passwords.stats()
+        for nome, descrizione, valore in (
+            ("password_hash_pending", "Hash password in corso o in coda", "pending"),
+            (
+                "password_hash_queued",
+                "Hash password in attesa di un processo",
+                "queued",
+            ),
+            ("password_hash_workers", "Processi del pool degli hash", "workers"),
+            (
+                "password_hash_max_pending",
+                "Hash in attesa oltre cui si risponde 503",
+                "max_pending",
+            ),
+        ):
+            yield GaugeMetricFamily(nome, descrizione, value=stats[valore])
+
+
+def registra_esecuzione_job(job: str, status: str, durata_s: float, righe) -> None:
+    JOB_DURATA.labels(job).observe(durata_s)
+    JOB_ESECUZIONI.labels(job, status).inc()
+    if righe:
+        JOB_RIGHE.labels(job).inc(righe)
+
+
+def misura_sync_bancaria(funzione):
+    """Decoratore per `fetch_bank_transactions_for_conto(db, conto, ...)`."""
+
+    @functools.wraps(funzione)
+    def wrapper(db, conto, *args, **kwargs):
+        provider = conto.bank_connector_provider or "NONE"
+        inizio = time.perf_counter()
+        esito = "error"
+        try:
+            risultato = funzione(db, conto, *args, **kwargs)
+            esito = "ok"
+            return risultato
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                BANK_SYNC_429.labels(provider).inc()
+                esito = "rate_limited"
+            raise
+        finally:
+            BANK_SYNC_DURATA.labels(provider, esito).observe(
+                time.perf_counter() - inizio
+            )
+
+    return wrapper
@@ -1,6 +1,7 @@
 from sqlalchemy import (
     Column,
     Integer,
+    Float,
     Numeric,
     String,
     DateTime,
@@ -8,6 +9,9 @@ from sqlalchemy import (
     Boolean,
     Date,
     Index,
+    JSON,
+    Text,
+    func,
 )
 from sqlalchemy.orm import relationship, backref
 from datetime import datetime, timezone
@@ -68,7 +72,14 @@ class RefreshToken(Base):
 
     user = relationship("User")
 
-    __table_args__ = (Index("ix_refresh_tokens_user_family", "user_id", "family_id"),)
+    # Gli indici su scadenza, rotazione e revoca servono alla pulizia periodica
+    # (auth.delete_stale_refresh_tokens), che cancella a blocchi per ciascun criterio.
+    __table_args__ = (
+        Index("ix_refresh_tokens_user_family", "user_id", "family_id"),
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+        Index("ix_refresh_tokens_used_at", "used_at"),
+        Index("ix_refresh_tokens_revoked_at", "revoked_at"),
+    )
 
     creationDate = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     lastUpdate = Column(
@@ -137,6 +148,10 @@ class Conto(Base):
     # and the pending auth `state` matched on the callback handshake.
     bank_connector_session_id = Column(String, nullable=True)
     bank_connector_auth_state = Column(String, nullable=True)
+    # Layout degli estratti conto già importati su questo conto, per tipo di file
+    # ("PDF" / "SPREADSHEET" -> profilo, vedi statement_profiles.py): gli import
+    # successivi partono da qui invece di rilevare di nuovo banca e colonne.
+    statement_profiles = Column(JSON, nullable=True)
 
 
 class BankTransactionProposal(Base):
@@ -423,12 +438,112 @@ class Ricorrenza(Base):
     )
 
 
+class MovimentoSaldo(Base):
+    """Una variazione del saldo di un conto (ledger append-only).
+
+    `Conto.saldo` è la somma di tutti i movimenti del conto: ogni scrittura che
+    tocca un saldo passa da `ledger.registra_movimento`, che aggiorna il saldo e
+    aggiunge qui la riga. Le righe non si modificano né si cancellano: modifica e
+    cancellazione di una transazione aggiungono uno storno.
+
+    `data` è la data contabile (quella della transazione), non quella di
+    inserimento: è ciò che serve per il saldo a una data passata.
+    """
+
+    __tablename__ = "movimenti_saldo"
+
+    id = Column(Integer, primary_key=True)
+    conto_id = Column(
+        Integer, ForeignKey("conti.id", ondelete="CASCADE"), nullable=False
+    )
+    transazione_id = Column(
+        Integer, ForeignKey("transazioni.id", ondelete="SET NULL"), nullable=True
+    )
+    data = Column(Date, nullable=False)
+    importo = Column(Numeric(12, 2), nullable=False)
+    # "APERTURA", "TRANSAZIONE", "STORNO" o "RETTIFICA" (vedi ledger.py)
+    causale = Column(String, nullable=False)
+
+    transazione = relationship("Transazione")
+
+    creationDate = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (Index("ix_movimenti_saldo_conto_data", "conto_id", "data"),)
+
+
+class SaldoSnapshot(Base):
+    """Saldo di un conto a fine giornata `data`, per non sommare tutto il ledger.
+
+    Il saldo a una data è lo snapshot più recente non successivo (ricerca
+    sull'indice) più i movimenti tra lo snapshot e la data. Un movimento con data
+    passata aggiorna anche gli snapshot dalla sua data in poi.
+    """
+
+    __tablename__ = "saldi_snapshot"
+
+    id = Column(Integer, primary_key=True)
+    conto_id = Column(
+        Integer, ForeignKey("conti.id", ondelete="CASCADE"), nullable=False
+    )
+    data = Column(Date, nullable=False)
+    saldo = Column(Numeric(12, 2), nullable=False)
+
+    creationDate = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ux_saldi_snapshot_conto_data", "conto_id", "data", unique=True),
+    )
+
+
+class JobRun(Base):
+    """Un'esecuzione di un job schedulato (vedi jobs.py).
+
+    La riga fa anche da prenotazione: con lo scheduler attivo su più repliche
+    ognuna prova a inserire (job, slot) per lo stesso scatto del cron, e l'indice
+    unico lascia passare solo la prima.
+    """
+
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String, nullable=False)
+    slot = Column(DateTime, nullable=False)  # scatto del cron, al minuto
+    instance = Column(String, nullable=False)  # host:pid di chi l'ha eseguito
+    status = Column(String, nullable=False)  # RUNNING, OK, ERROR, SKIPPED
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    rows = Column(Integer, nullable=True)  # righe elaborate, se il task le riporta
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (Index("ux_job_runs_job_slot", "job", "slot", unique=True),)
+
+
+class RateLimitCounter(Base):
+    """Contatore del rate limit condiviso tra worker e repliche (vedi rate_limit.py).
+
+    Una riga per chiave (limite + client): ogni richiesta la aggiorna con un solo
+    upsert atomico. `expires_at` (epoch in secondi) è la fine della finestra;
+    `prev_count` serve solo alla strategia sliding-window-counter. Le righe
+    scadute le elimina `task_pulizia_rate_limit`.
+    """
+
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    prev_count = Column(Integer, nullable=False, default=0)
+    expires_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_rate_limit_counters_expires_at", "expires_at"),)
+
+
 # --- Indici di performance -------------------------------------------------
 # Ogni query è user-scoped (`.filter(Model.user_id == ...)`): senza indice su
 # user_id il DB fa un full scan che cresce con TUTTI i dati di TUTTI gli utenti.
-# Sulla tabella più grande (transazioni) l'indice composito (user_id, data)
-# copre anche il range/ordinamento per data della lista paginata; conto_id
-# accelera i filtri per conto e i ricalcoli di saldo.
+# Su transazioni conto_id accelera i filtri per conto e i ricalcoli di saldo;
+# filtro utente e range/ordinamento per data sono coperti dagli indici parziali
+# qui sotto.
 Index("ix_conti_user_id", Conto.user_id)
 Index("ix_categorie_user_id", Categoria.user_id)
 Index("ix_sottocategorie_user_id", Sottocategoria.user_id)
@@ -438,5 +553,81 @@ Index("ix_debiti_user_id", Debito.user_id)
 Index("ix_investimenti_user_id", Investimento.user_id)
 Index("ix_ricorrenze_user_id", Ricorrenza.user_id)
 Index("ix_bank_proposals_user_id", BankTransactionProposal.user_id)
-Index("ix_transazioni_user_id_data", Transazione.user_id, Transazione.data)
 Index("ix_transazioni_conto_id", Transazione.conto_id)
+
+# Login e registrazione cercano username ed email senza distinguere maiuscole:
+# indici unici sull'espressione lower(...), la stessa usata nelle query, così la
+# ricerca non scansiona users e i duplicati li rifiuta il DB.
+Index("ux_users_username_lower", func.lower(User.username), unique=True)
+Index("ux_users_email_lower", func.lower(User.email), unique=True)
+
+# --- Indici parziali sulle righe "vive" ---------------------------------------
+# Quasi ogni lettura di transazioni filtra `deleted_at IS NULL`: indici parziali
+# con lo stesso predicato contengono solo le righe visibili (più piccoli) e
+# rispondono a filtro utente + soft-delete + ordinamento in un'unica scansione,
+# invece di combinare `ix_transazioni_deleted_at` con `(user_id, data)`.
+# - (user_id, data, id): lista paginata/recenti, ordinate per "data:desc, id:desc"
+#   (sostituisce il vecchio (user_id, data): ogni query che lo usava filtra
+#   già le sole righe vive);
+# - (user_id, categoria_id, data) e (user_id, tag_id, data): statistiche filtrate;
+# - (conto_id, data): movimenti e saldi di un conto.
+# Le proposte bancarie si leggono quasi solo PENDING (controllo al landing).
+_TRANSAZIONE_ATTIVA = Transazione.deleted_at.is_(None)
+Index(
+    "ix_transazioni_attive_user_data_id",
+    Transazione.user_id,
+    Transazione.data,
+    Transazione.id,
+    postgresql_where=_TRANSAZIONE_ATTIVA,
+    sqlite_where=_TRANSAZIONE_ATTIVA,
+)
+Index(
+    "ix_transazioni_attive_user_categoria_data",
+    Transazione.user_id,
+    Transazione.categoria_id,
+    Transazione.data,
+    postgresql_where=_TRANSAZIONE_ATTIVA,
+    sqlite_where=_TRANSAZIONE_ATTIVA,
+)
+Index(
+    "ix_transazioni_attive_user_tag_data",
+    Transazione.user_id,
+    Transazione.tag_id,
+    Transazione.data,
+    postgresql_where=_TRANSAZIONE_ATTIVA,
+    sqlite_where=_TRANSAZIONE_ATTIVA,
+)
+Index(
+    "ix_transazioni_attive_conto_data",
+    Transazione.conto_id,
+    Transazione.data,
+    postgresql_where=_TRANSAZIONE_ATTIVA,
+    sqlite_where=_TRANSAZIONE_ATTIVA,
+)
+_PROPOSTA_PENDING = BankTransactionProposal.status == "PENDING"
+Index(
+    "ix_bank_proposals_pending_user",
+    BankTransactionProposal.user_id,
+    BankTransactionProposal.status,
+    postgresql_where=_PROPOSTA_PENDING,
+    sqlite_where=_PROPOSTA_PENDING,
+)
+
+# --- Ricerca nelle descrizioni (pg_trgm) ---------------------------------------
+# `ILIKE '%testo%'` non può usare un B-tree: senza questi indici ogni ricerca (il
+# filtro `descrizione` delle liste e `/transazioni/search`) legge tutte le righe
+# dell'utente. Un GIN a trigrammi serve sia ILIKE sia la similarità (`<%`).
+# Solo Postgres: su SQLite (test) la ricerca ripiega sulla scansione.
+Index(
+    "ix_transazioni_descrizione_trgm",
+    Transazione.descrizione,
+    postgresql_using="gin",
+    postgresql_ops={"descrizione": "gin_trgm_ops"},
+    postgresql_where=_TRANSAZIONE_ATTIVA,
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_bank_proposals_descrizione_trgm",
+    BankTransactionProposal.descrizione,
+    postgresql_using="gin",
+    postgresql_ops={"descrizione": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
@@ -0,0 +1,112 @@
+"""Hash delle password con bcrypt, fuori dal thread pool delle richieste.
+
+bcrypt è volutamente lento (centinaia di ms a hash). Eseguito dentro gli
+endpoint sincroni occupava i thread del pool condiviso di Starlette: una raffica
+di login (anche con utenti inesistenti, che pagano comunque l'hash fittizio)
+bastava a bloccare tutte le altre API. Qui gli hash girano in un pool di processi
+dedicato e di dimensione fissa: gli endpoint di autenticazione lo attendono in
+modo asincrono, senza tenere un thread, e un processo separato non contende il
+GIL col server.
+
+Oltre `PASSWORD_HASH_MAX_PENDING` richieste in attesa si risponde 503 invece di
+accodare all'infinito. `stats()` espone la profondità della coda.
+
+Il modulo non importa nulla del resto dell'app: i processi del pool (avviati in
+modalità spawn) lo reimportano da soli.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+# Fattore di costo di bcrypt (2^rounds iterazioni). Cambiandolo, gli hash
+# esistenti vengono aggiornati al login successivo (`needs_rehash`).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+
+
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
+    # Trasforma la stringa in byte, genera il sale e fa l'hash
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt)
+    # Restituisce l'hash come stringa per salvarlo nel DB
+    return hashed_password.decode("utf-8")
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(
+        plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+    )
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True se l'hash ha un costo diverso da quello configurato ($2b$<rounds>$...)."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _nel_pool(funzione, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        logger.warning("Coda degli hash password piena (%d in attesa)", _pending)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), funzione, *args)
+    finally:
+        _pending -= 1
+
+
+async def get_password_hash_async(password: str) -> str:
+    """`get_password_hash` nel pool dedicato (il costo è deciso qui, non nel figlio)."""
+    return await _nel_pool(get_password_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _nel_pool(verify_password, plain_password, hashed_password)
+
+
+def stats() -> dict:
+    """Richieste di hash in corso: quelle oltre il numero di processi sono in coda."""
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "pending": _pending,
+        "queued": max(0, _pending - PASSWORD_HASH_WORKERS),
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+    }
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -4,14 +4,308 @@ Vive in un modulo a sé (e non in `main.py`) perché i router devono importarlo
 decorare i propri endpoint, e `main.py` importa i router: metterlo lì creerebbe un
 ciclo di import.
 
-Il conteggio è per indirizzo IP e in memoria: dietro a un reverse proxy assicurarsi
-che l'IP reale arrivi (header `X-Forwarded-For` + `--proxy-headers` su uvicorn),
-altrimenti tutte le richieste risultano provenire dal proxy e condividono lo stesso
-budget. Con più worker/repliche il contatore non è condiviso: per un rate limit
-davvero globale serve uno storage esterno (`storage_uri="redis://..."`).
+Il conteggio è per indirizzo IP: dietro a un reverse proxy assicurarsi che l'IP
+reale arrivi (header `X-Forwarded-For` + `--proxy-headers` su uvicorn), altrimenti
+tutte le richieste risultano provenire dal proxy e condividono lo stesso budget.
+
+Dove stanno i contatori lo decide `RATE_LIMIT_STORAGE_URI`:
+
+- `memory://` (default): in memoria del processo. Con N worker ogni limite vale
+  N volte tanto, e i contatori si perdono a ogni riavvio;
+- `db://`: tabella `rate_limit_counters` del database dell'app (`DbStorage`),
+  condivisa da tutti i worker e le repliche senza infrastruttura in più;
+  `db+<url SQLAlchemy>` usa un altro database (es. `db+sqlite:///rl.db` in
+  locale e nei test, dove la tabella viene creata al volo);
+- `redis://...` (o `valkey://...`): lo storage Redis di `limits`, che richiede il
+  pacchetto `redis` installato.
+
+`RATE_LIMIT_STRATEGY` sceglie la finestra: `fixed-window` (default) o
+`sliding-window-counter`, che pesa la finestra precedente ed evita il doppio
+budget a cavallo di due finestre. Su `db://` ogni richiesta è un solo upsert
+atomico, anche con più istanze in parallelo.
+
+Oltre ai limiti per IP degli endpoint di autenticazione, `quota(costo)` è la
+quota per utente delle API costose (vedi sotto).
 """
 
+import math
+import os
+import time
+from typing import Optional
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+from fastapi import Depends, HTTPException, Request, Response, status
+from limits import parse
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from sqlalchemy import case, create_engine, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+import auth
+from models import RateLimitCounter
+
+_contatori = RateLimitCounter.__table__
+
+
+class DbStorage(Storage, SlidingWindowCounterSupport):
+    """Storage di `limits` sulla tabella `rate_limit_counters` (Postgres o SQLite).
+
+    Ogni incremento è un `INSERT ... ON CONFLICT DO UPDATE ... RETURNING`: il DB
+    serializza gli aggiornamenti della stessa riga, quindi nessuna richiesta
+    concorrente va persa né passa oltre il limite.
+    """
+
+    STORAGE_SCHEME = ["db", "db+postgresql", "db+sqlite"]
+
+    def __init__(
+        self,
+        uri: str,
+        wrap_exceptions: bool = False,
+        engine: Optional[Engine] = None,
+        **options,
+    ):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        if engine is not None:
+            self.engine = engine
+        elif uri.startswith("db+"):
+            self.engine = create_engine(uri[len("db+") :], **options)
+            _contatori.create(self.engine, checkfirst=True)
+        else:
+            from database import engine as app_engine
+
+            self.engine = app_engine
+        self._insert = (
+            pg_insert if self.engine.dialect.name == "postgresql" else sqlite_insert
+        )
+
+    @property
+    def base_exceptions(self):
+        return SQLAlchemyError
+
+    def _riga(self, key: str):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(_contatori).where(_contatori.c.key == key)
+            ).first()
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        """Finestra fissa: riparte da `amount` se la precedente è scaduta."""
+        now = time.time()
+        scaduta = _contatori.c.expires_at <= now
+        stmt = self._insert(_contatori).values(
+            key=key, count=amount, prev_count=0, expires_at=now + expiry
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[_contatori.c.key],
+            set_={
+                "count": case((scaduta, amount), else_=_contatori.c.count + amount),
+                "expires_at": case(
+                    (scaduta, now + expiry), else_=_contatori.c.expires_at
+                ),
+            },
+        ).returning(_contatori.c.count)
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).scalar_one()
+
+    def get(self, key: str) -> int:
+        riga = self._riga(key)
+        return riga.count if riga and riga.expires_at > time.time() else 0
+
+    def get_expiry(self, key: str) -> float:
+        riga = self._riga(key)
+        return riga.expires_at if riga else time.time()
+
+    def check(self) -> bool:
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(select(1))
+            return True
+        except SQLAlchemyError:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with self.engine.begin() as conn:
+            return conn.execute(delete(_contatori)).rowcount
+
+    def clear(self, key: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(_contatori).where(_contatori.c.key == key))
+
+    # --- sliding window counter ------------------------------------------------
+    # La riga tiene il conteggio della finestra corrente (`count`, che finisce a
+    # `expires_at`) e di quella prima (`prev_count`). Le finestre sono allineate a
+    # multipli di `expiry`, quindi dalla fine si riconosce se la riga è della
+    # finestra corrente, della precedente o più vecchia.
+
+    @staticmethod
+    def _finestra(expiry: int, now: float) -> tuple[float, float]:
+        """Fine della finestra corrente e peso della precedente (la frazione di
+        finestra corrente che manca)."""
+        fine = (math.floor(now / expiry) + 1) * expiry
+        return float(fine), (fine - now) / expiry
+
+    def acquire_sliding_window_entry(
+        self, key: str, limit: int, expiry: int, amount: int = 1
+    ) -> bool:
+        if amount > limit:
+            return False
+        fine, peso = self._finestra(expiry, time.time())
+        corrente = _contatori.c.expires_at == fine
+        precedente = _contatori.c.expires_at == fine - expiry
+        count = case((corrente, _contatori.c.count), else_=0)
+        prev_count = case(
+            (corrente, _contatori.c.prev_count),
+            (precedente, _contatori.c.count),
+            else_=0,
+        )
+        stmt = self._insert(_contatori).values(
+            key=key, count=amount, prev_count=0, expires_at=fine
+        )
+        # floor(pesato) + amount <= limit, senza floor (non c'è su ogni SQLite)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[_contatori.c.key],
+            set_={
+                "count": count + amount,
+                "prev_count": prev_count,
+                "expires_at": fine,
+            },
+            where=prev_count * peso + count < limit - amount + 1,
+        ).returning(_contatori.c.count)
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).first() is not None
+
+    def get_sliding_window(
+        self, key: str, expiry: int
+    ) -> tuple[int, float, int, float]:
+        now = time.time()
+        fine, _ = self._finestra(expiry, now)
+        riga = self._riga(key)
+        count = prev_count = 0
+        if riga and riga.expires_at == fine:
+            count, prev_count = riga.count, riga.prev_count
+        elif riga and riga.expires_at == fine - expiry:
+            prev_count = riga.count
+        return (
+            prev_count,
+            fine - now if prev_count else 0.0,
+            count,
+            fine - now + expiry,
+        )
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        self.clear(key)
+
+    # --- pulizia -----------------------------------------------------------------
+
+    def elimina_scaduti(self, trattieni: float, batch_size: int = 1000) -> int:
+        """Elimina le righe scadute da più di `trattieni` secondi, a blocchi di
+        `batch_size` con una transazione per blocco. Ritorna le righe eliminate.
+
+        `trattieni` deve valere almeno la finestra più lunga: una riga appena
+        scaduta è ancora il `prev_count` della sliding window per tutta la finestra
+        dopo. La condizione è ripetuta nel DELETE, così una chiave tornata attiva
+        tra la SELECT e il DELETE non perde il suo contatore.
+        """
+        scaduta = _contatori.c.expires_at < time.time() - trattieni
+        eliminati = 0
+        while True:
+            with self.engine.begin() as conn:
+                chiavi = conn.scalars(
+                    select(_contatori.c.key).where(scaduta).limit(batch_size)
+                ).all()
+                if not chiavi:
+                    return eliminati
+                eliminati += conn.execute(
+                    delete(_contatori).where(_contatori.c.key.in_(chiavi), scaduta)
+                ).rowcount
+
+
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "fixed-window")
+
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY,
+)
+
+
+def limite_fuori_dal_loop(request: Request) -> None:
+    """Dipendenza per gli endpoint `async def` decorati con `@limiter.limit`:
+    `dependencies=[Depends(limite_fuori_dal_loop)]`.
+
+    Su un endpoint async slowapi controlla il limite direttamente nell'event
+    loop, e con `db://` è un upsert sincrono che blocca tutte le richieste. Come
+    dipendenza sincrona FastAPI la esegue nel thread pool; il decoratore la trova
+    già fatta e aggiunge solo gli header.
+    """
+    if not limiter.enabled:
+        return
+    limiter._check_request_limit(request, request.scope["endpoint"], False)
+    request.state._rate_limiting_complete = True
+
+
+# --- Quota per utente --------------------------------------------------------
+# Un solo utente che martella statistiche, import o sync bancaria può saturare il
+# DB (e la quota della banca) per tutti. Ogni utente ha un budget USER_QUOTA di
+# unità per finestra, condiviso da tutte le route che lo dichiarano, e ogni
+# chiamata ne consuma il proprio costo: un elenco costa 1, un import 50. La
+# chiave è l'utente, non l'IP, e i contatori stanno nello stesso storage del
+# limiter (condiviso tra istanze con `db://` o Redis).
+USER_QUOTA = parse(os.getenv("USER_QUOTA", "1000/hour"))
+
+# Quanto tenere i contatori scaduti prima di eliminarli: la finestra più lunga in
+# uso. I limiti degli endpoint sono al più orari, la quota è configurabile; un
+# giorno di margine copre entrambi salvo quote più lunghe.
+RATE_LIMIT_RETENTION = max(24 * 3600, USER_QUOTA.get_expiry())
+
+
+def elimina_contatori_scaduti(batch_size: int = 1000) -> int:
+    """Pulizia dei contatori di `DbStorage` (vedi `task_pulizia_rate_limit`).
+
+    Ogni IP e ogni utente lasciano una riga che nessuna richiesta cancella: senza
+    pulizia la tabella cresce col numero di client mai visti. Con `memory://` e
+    Redis le chiavi scadono da sole e non c'è niente da fare.
+    """
+    storage = limiter.limiter.storage
+    if not isinstance(storage, DbStorage):
+        return 0
+    return storage.elimina_scaduti(RATE_LIMIT_RETENTION, batch_size)
+
+
+def quota(costo: int):
+    """Dipendenza da dichiarare sulla route: `dependencies=[Depends(quota(50))]`.
+
+    Aggiunge alla risposta gli header `RateLimit-*` (limite, residuo, secondi al
+    reset della finestra); a budget esaurito risponde 429 con `Retry-After`.
+    """
+
+    def consuma_quota(
+        response: Response,
+        current_user_id: int = Depends(auth.get_current_user_id),
+    ) -> int:
+        chiave = ("quota", "user", str(current_user_id))
+        strategia = limiter.limiter
+        consentita = strategia.hit(USER_QUOTA, *chiave, cost=costo)
+        stats = strategia.get_window_stats(USER_QUOTA, *chiave)
+        reset = max(1, math.ceil(stats.reset_time - time.time()))
+        headers = {
+            "RateLimit-Limit": str(USER_QUOTA.amount),
+            "RateLimit-Remaining": str(stats.remaining),
+            "RateLimit-Reset": str(reset),
+            "RateLimit-Policy": f"{USER_QUOTA.amount};w={USER_QUOTA.get_expiry()}",
+        }
+        if not consentita:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="API quota exhausted, please retry later",
+                headers={**headers, "Retry-After": str(reset)},
+            )
+        response.headers.update(headers)
+        return current_user_id
 
-limiter = Limiter(key_func=get_remote_address)
+    consuma_quota.costo = costo
+    return consuma_quota
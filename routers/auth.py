@@ -13,16 +13,17 @@ from fastapi import (
     status,
     BackgroundTasks,
 )
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database import get_db
 from models import User
 from schemas import ForgotPasswordRequest, ResetPasswordRequest, Token
-from rate_limit import limiter
+from rate_limit import limite_fuori_dal_loop, limiter
 
 import auth as auth_utils
 
-# Assumo che tu abbia una funzione per hashare le password, es. pwd_context.hash()
-from auth import get_password_hash
+from auth import get_password_hash_async
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -72,7 +73,11 @@ def forgot_password(
     background_tasks: BackgroundTasks,  # Usiamo BackgroundTasks per non bloccare la risposta
     db: Session = Depends(get_db),
 ):
-    user = db.query(User).filter(User.email == payload.email).first()
+    user = (
+        db.query(User)
+        .filter(func.lower(User.email) == payload.email.lower())
+        .first()
+    )
 
     # BEST PRACTICE DI SICUREZZA:
     # Anche se l'utente non esiste, restituiamo sempre "OK".
@@ -99,15 +104,36 @@ def forgot_password(
     }
 
 
-@router.post("/reset-password")
+def _aggiorna_password(db: Session, user: User, hashed_password: str) -> None:
+    """Scritture del reset, nel thread pool (come le letture: la Session è
+    sincrona e nell'event loop bloccherebbe le altre richieste)."""
+    user.hashed_password = hashed_password
+
+    # Invalida i token di accesso esistenti incrementando la versione del token
+    user.token_version = getattr(user, "token_version", 1) + 1
+
+    # Chi cambia password si aspetta che le sessioni aperte altrove cadano:
+    # senza questo, un refresh token rubato sopravvivrebbe al reset.
+    auth_utils.revoke_all_user_tokens(db, user.id)
+
+    # 4. Invalida il token per evitare che venga riutilizzato
+    user.reset_token = None
+    user.reset_token_expiration = None
+
+    db.commit()
+
+
+@router.post("/reset-password", dependencies=[Depends(limite_fuori_dal_loop)])
 @limiter.limit("5/hour")
-def reset_password(
+async def reset_password(
     request: Request,
     payload: ResetPasswordRequest,
     db: Session = Depends(get_db),
 ):
     # 1. Cerca l'utente tramite il token
-    user = db.query(User).filter(User.reset_token == payload.token).first()
+    user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.reset_token == payload.token).first()
+    )
 
     # 2. Verifica se il token esiste ed è ancora valido
     if not user:
@@ -122,20 +148,8 @@ def reset_password(
         )
 
     # 3. Aggiorna la password (ricordati di farne l'hashing!)
-    user.hashed_password = get_password_hash(payload.new_password)
-
-    # Invalida i token di accesso esistenti incrementando la versione del token
-    user.token_version = getattr(user, "token_version", 1) + 1
-
-    # Chi cambia password si aspetta che le sessioni aperte altrove cadano:
-    # senza questo, un refresh token rubato sopravvivrebbe al reset.
-    auth_utils.revoke_all_user_tokens(db, user.id)
-
-    # 4. Invalida il token per evitare che venga riutilizzato
-    user.reset_token = None
-    user.reset_token_expiration = None
-
-    db.commit()
+    hashed_password = await get_password_hash_async(payload.new_password)
+    await run_in_threadpool(_aggiorna_password, db, user, hashed_password)
 
     return {"message": "Password aggiornata con successo. Ora puoi fare il login."}
 
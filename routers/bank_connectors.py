@@ -10,6 +10,7 @@ from fastapi import (
 from sqlalchemy.orm import Session
 from database import get_db
 import auth
+from rate_limit import quota
 from schemas.bank_transaction import (
     BankConnectorConfigCreate,
     BankConnectorConfigOut,
@@ -26,13 +27,12 @@ from services import (
     create_bank_transaction_proposal,
     import_bank_transaction_proposal,
     discard_bank_transaction_proposal,
-    parse_bank_statement_pdf,
-    parse_bank_statement_spreadsheet,
+    open_bank_statement,
     encrypt_token,
 )
 from datetime import date, datetime, timezone
 from decimal import Decimal
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 router = APIRouter(prefix="/conti/{conto_id}/bank-connector", tags=["BankConnector"])
 
@@ -112,7 +112,9 @@ def configure_bank_connector(
     )
 
 
-@router.post("/sync", response_model=BankConnectorSyncResponse)
+@router.post(
+    "/sync", response_model=BankConnectorSyncResponse, dependencies=[Depends(quota(50))]
+)
 def sync_bank_connector(
     conto_id: int,
     db: Session = Depends(get_db),
@@ -160,13 +162,33 @@ def sync_bank_connector(
 _STATEMENT_EXTS = (".pdf", ".xlsx", ".xls", ".csv")
 
 
-@router.post("/import-statement", response_model=BankStatementImportResponse)
+def _statement_read_error(e: Exception) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"Could not read the statement file: {str(e)}",
+    )
+
+
+def _read_statement(movimenti: Iterable[dict]) -> Iterator[dict]:
+    """Errori di LETTURA del file (sollevati dal parser mentre produce i
+    movimenti) -> 422; quelli di salvataggio restano fuori da qui."""
+    try:
+        yield from movimenti
+    except Exception as e:
+        raise _statement_read_error(e)
+
+
+@router.post(
+    "/import-statement",
+    response_model=BankStatementImportResponse,
+    dependencies=[Depends(quota(50))],
+)
 def import_bank_statement(
     conto_id: int,
     file: UploadFile = File(...),
     data_da: Optional[date] = Form(None),
     data_a: Optional[date] = Form(None),
-    balance_column: bool = Form(False),
+    balance_column: Optional[bool] = Form(None),
     db: Session = Depends(get_db),
     current_user_id: int = Depends(auth.get_current_user_id),
 ):
@@ -176,7 +198,9 @@ def import_bank_statement(
     assegnando categoria/sottocategoria/conto/tag prima di confermarle.
 
     Excel/CSV usano un parser a colonne (affidabile); il PDF un parser euristico
-    (`balance_column` è rilevante solo per il PDF).
+    (`balance_column` è rilevante solo per il PDF). Il layout riconosciuto viene
+    ricordato sul conto: dal secondo import in poi il rilevamento è saltato, e
+    `balance_column` può essere omesso (vale l'ultima scelta fatta).
     """
     conto = get_conto(db, conto_id, current_user_id)
 
@@ -187,45 +211,46 @@ def import_bank_statement(
             detail="The file must be a PDF, Excel (.xlsx) or CSV",
         )
 
-    file_bytes = file.file.read()
-    if not file_bytes:
+    # Il file NON viene letto tutto in memoria: i parser lo consumano in streaming
+    # dallo spool dell'upload (su disco oltre la soglia di Starlette).
+    if not file.file.read(1):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="The uploaded file is empty",
         )
+    file.file.seek(0)
 
+    profiles = conto.statement_profiles or {}
     try:
-        if filename.endswith(".pdf"):
-            movimenti = parse_bank_statement_pdf(
-                file_bytes,
-                data_da=data_da,
-                data_a=data_a,
-                balance_column=balance_column,
-            )
-        else:
-            movimenti = parse_bank_statement_spreadsheet(
-                file_bytes,
-                filename,
-                data_da=data_da,
-                data_a=data_a,
-            )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=f"Could not read the statement file: {str(e)}",
+        profile, movimenti = open_bank_statement(
+            file.file,
+            filename,
+            profiles=profiles,
+            data_da=data_da,
+            data_a=data_a,
+            balance_column=balance_column,
         )
+    except Exception as e:
+        raise _statement_read_error(e)
 
-    parsed = len(movimenti)
+    parsed = 0
     new_proposals = 0
     try:
-        for candidate in movimenti:
+        # I movimenti arrivano in streaming (il PDF pagina per pagina, i fogli
+        # riga per riga): ogni candidato diventa proposta appena letto, senza
+        # attendere la fine del file.
+        for candidate in _read_statement(movimenti):
+            parsed += 1
             # create_bank_transaction_proposal deduplica su (data, importo,
             # descrizione): reimportare lo stesso estratto non crea doppioni.
-            if create_bank_transaction_proposal(
-                db, current_user_id, conto, candidate
-            ):
+            if create_bank_transaction_proposal(db, current_user_id, conto, candidate):
                 new_proposals += 1
+        if profile is not None and profiles.get(profile["kind"]) != profile:
+            conto.statement_profiles = {**profiles, profile["kind"]: profile}
         db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -237,6 +262,7 @@ def import_bank_statement(
         parsed=parsed,
         new_proposals=new_proposals,
         skipped=parsed - new_proposals,
+        profile=profile["key"] if profile else None,
     )
 
 
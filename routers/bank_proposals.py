@@ -1,15 +1,31 @@
-from fastapi import APIRouter, Depends
+import logging
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 import auth
 from database import get_db
-from models import BankTransactionProposal
-from schemas.bank_transaction import BankTransactionProposalOut
+from models import (
+    BankTransactionProposal,
+    Categoria,
+    Conto,
+    Sottocategoria,
+    Transazione,
+)
+from schemas.bank_transaction import (
+    BankTransactionProposalBatchImport,
+    BankTransactionProposalOut,
+)
+from schemas.transazione import TransazioneOut
+from services import find_owned_tassonomia, import_bank_transaction_proposals_batch
 
 # Endpoint "flat": il FE con UNA sola chiamata sa se ci sono proposte pendenti
 # su QUALSIASI conto dell'utente (per il controllo automatico al landing).
 router = APIRouter(prefix="/bank-proposals", tags=["BankConnector"])
 
+logger = logging.getLogger(__name__)
+
 
 @router.get("", response_model=list[BankTransactionProposalOut])
 def get_all_pending_proposals(
@@ -25,3 +41,129 @@ def get_all_pending_proposals(
         .order_by(BankTransactionProposal.data.desc())
         .all()
     )
+
+
+@router.post("/import-batch", response_model=list[TransazioneOut])
+def import_bank_transaction_proposals_batch_endpoint(
+    batch: BankTransactionProposalBatchImport,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id),
+):
+    """Importa più proposte (anche di conti diversi) in una sola richiesta e in
+    una sola transazione DB: o entrano tutte o nessuna.
+
+    Le verifiche sono le stesse dell'import singolo (proposta dell'utente e
+    PENDING, conto di destinazione suo e non cancellato) più la proprietà della
+    tassonomia, ma fatte con una query per tipo di entità invece che per riga.
+    Se un'altra richiesta importa le stesse proposte nel frattempo risponde 409.
+    """
+    items = batch.items
+    proposal_ids = [item.proposal_id for item in items]
+    if len(set(proposal_ids)) != len(proposal_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each proposal can appear only once in a batch",
+        )
+
+    proposals_by_id = {
+        p.id: p
+        for p in db.query(BankTransactionProposal).filter(
+            BankTransactionProposal.id.in_(proposal_ids),
+            BankTransactionProposal.user_id == current_user_id,
+        )
+    }
+    if len(proposals_by_id) != len(proposal_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Proposal not found",
+        )
+    proposals = [proposals_by_id[pid] for pid in proposal_ids]
+    if any(p.status != "PENDING" for p in proposals):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PENDING proposals can be imported",
+        )
+
+    conto_ids = {
+        item.conto_id or proposal.conto_id for item, proposal in zip(items, proposals)
+    }
+    found_conti = (
+        db.query(Conto.id)
+        .filter(
+            Conto.id.in_(conto_ids),
+            Conto.user_id == current_user_id,
+            Conto.deleted_at.is_(None),
+        )
+        .count()
+    )
+    if found_conti != len(conto_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found or not authorized",
+        )
+
+    categoria_ids = {i.categoria_id for i in items if i.categoria_id is not None}
+    sottocategoria_ids = {
+        i.sottocategoria_id for i in items if i.sottocategoria_id is not None
+    }
+    tag_ids = {i.tag_id for i in items if i.tag_id is not None}
+    owned = find_owned_tassonomia(
+        db, current_user_id, categoria_ids, sottocategoria_ids, tag_ids
+    )
+    for kind, ids, detail in (
+        ("categoria", categoria_ids, "Category not found or not authorized"),
+        (
+            "sottocategoria",
+            sottocategoria_ids,
+            "Subcategory not found or not authorized",
+        ),
+        ("tag", tag_ids, "Tag not found or not authorized"),
+    ):
+        if any((kind, id_) not in owned for id_ in ids):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+    # Prenotazione con un UPDATE condizionato prima di scrivere: due richieste
+    # concorrenti (doppio click, due schede) leggono entrambe PENDING, ma il DB
+    # serializza gli UPDATE e il secondo non trova più le righe da prenotare.
+    prenotate = (
+        db.query(BankTransactionProposal)
+        .filter(
+            BankTransactionProposal.id.in_(proposal_ids),
+            BankTransactionProposal.status == "PENDING",
+        )
+        .update({"status": "IMPORTED"}, synchronize_session=False)
+    )
+    if prenotate != len(proposal_ids):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Proposals already imported by another request",
+        )
+
+    try:
+        transazione_ids = import_bank_transaction_proposals_batch(
+            db, proposals, items, current_user_id
+        )
+        now = datetime.now(timezone.utc)
+        if categoria_ids:
+            db.query(Categoria).filter(Categoria.id.in_(categoria_ids)).update(
+                {"lastImport": now}, synchronize_session=False
+            )
+        if sottocategoria_ids:
+            db.query(Sottocategoria).filter(
+                Sottocategoria.id.in_(sottocategoria_ids)
+            ).update({"lastImport": now}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Errore import batch proposte")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import proposals: {str(e)}",
+        )
+
+    created = {
+        t.id: t
+        for t in db.query(Transazione).filter(Transazione.id.in_(transazione_ids))
+    }
+    return [created[tid] for tid in transazione_ids]
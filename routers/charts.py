@@ -6,6 +6,7 @@ from typing import Optional, List
 from pydantic import BaseModel
 from database import get_db
 from auth import get_current_user_id
+from rate_limit import quota
 from models import Transazione, Categoria
 
 router = APIRouter(prefix="/charts", tags=["Charts"])
@@ -73,7 +74,11 @@ def generate_month_labels(inizio: date, fine: date, multi_year: bool):
 # --- ENDPOINT ---
 
 
-@router.get("/income-expense", response_model=List[MonthlyIncomeExpenseOut])
+@router.get(
+    "/income-expense",
+    response_model=List[MonthlyIncomeExpenseOut],
+    dependencies=[Depends(quota(5))],
+)
 def get_chart_income_expense(
     data_inizio: Optional[date] = Query(
         None, description="Data inizio (es: 2026-01-01)"
@@ -126,7 +131,9 @@ def get_chart_income_expense(
     return list(monthly_data.values())
 
 
-@router.get("/savings", response_model=List[MonthlySavingsOut])
+@router.get(
+    "/savings", response_model=List[MonthlySavingsOut], dependencies=[Depends(quota(5))]
+)
 def get_chart_savings(
     data_inizio: Optional[date] = Query(
         None, description="Data inizio (es: 2026-01-01)"
@@ -185,7 +192,11 @@ def get_chart_savings(
     return savings_list
 
 
-@router.get("/expense-composition", response_model=List[ExpenseCompositionOut])
+@router.get(
+    "/expense-composition",
+    response_model=List[ExpenseCompositionOut],
+    dependencies=[Depends(quota(5))],
+)
 def get_chart_expense_composition(
     data_inizio: Optional[date] = Query(
         None, description="Data inizio (es: 2026-01-01)"
@@ -226,7 +237,11 @@ def get_chart_expense_composition(
     return composition
 
 
-@router.get("/category-trend", response_model=List[CategoryTrendOut])
+@router.get(
+    "/category-trend",
+    response_model=List[CategoryTrendOut],
+    dependencies=[Depends(quota(5))],
+)
 def get_chart_category_trend(
     categoria_id: int = Query(..., description="L'ID della categoria da analizzare"),
     data_inizio: Optional[date] = Query(
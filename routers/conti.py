@@ -1,13 +1,31 @@
-from datetime import date, datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy import func, case
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from database import get_db
 import auth
+from rate_limit import quota
 from models import Conto, Transazione, User, Ricorrenza
-from schemas import ContoCreate, ContoOut, ContoUpdate, ContoFilters
+from schemas import (
+    ContoCreate,
+    ContoOut,
+    ContoUpdate,
+    ContoFilters,
+    ContoSaldoStorico,
+    ContoPrevisioni,
+    ContoRiconciliazione,
+)
 from schemas.transazione import TipoTransazione
 from services import apply_filters_and_sort
+from forecast import espandi_ricorrenza, proietta_saldi
+from dateutil.relativedelta import relativedelta
+from ledger import (
+    APERTURA,
+    RETTIFICA,
+    registra_movimento,
+    riconcilia_saldi,
+    storico_saldo,
+)
 import calendar
 from decimal import Decimal
 
@@ -50,8 +68,13 @@ def create_conto(
         if conto.default:
             reset_default_account(db, current_user_id)
 
-        new_conto = Conto(**conto.model_dump(), user_id=current_user_id)
+        # Il saldo iniziale entra come primo movimento del ledger (APERTURA)
+        conto_data = conto.model_dump()
+        saldo_iniziale = conto_data.pop("saldo")
+        new_conto = Conto(**conto_data, saldo=Decimal("0"), user_id=current_user_id)
         db.add(new_conto)
+        db.flush()
+        registra_movimento(db, new_conto, saldo_iniziale, date.today(), APERTURA)
         db.commit()
         db.refresh(new_conto)
         return new_conto
@@ -132,6 +155,15 @@ def update_conto(
         if update_data.get("default") is True:
             reset_default_account(db, current_user_id)
 
+        # Saldo corretto a mano: nel ledger va la differenza (RETTIFICA)
+        nuovo_saldo = update_data.pop("saldo", None)
+        if nuovo_saldo is not None:
+            # La differenza va calcolata sul saldo attuale, bloccato fino al commit
+            db.refresh(db_conto, attribute_names=["saldo"], with_for_update=True)
+            registra_movimento(
+                db, db_conto, nuovo_saldo - db_conto.saldo, date.today(), RETTIFICA
+            )
+
         for key, value in update_data.items():
             setattr(db_conto, key, value)
 
@@ -146,6 +178,69 @@ def update_conto(
         )
 
 
+@router.post("/reconcile", response_model=ContoRiconciliazione)
+def reconcile_balances(
+    repair: bool = Query(False, description="Corregge i saldi sfasati"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_admin_user_id),
+):
+    """Ricalcola i saldi di tutti i conti dalle transazioni e riporta quelli
+    sfasati; con `repair` li corregge (vedi ledger.riconcilia_saldi). Solo admin:
+    lavora su tutti gli utenti."""
+    try:
+        report = riconcilia_saldi(db, ripara=repair)
+        db.commit()
+        return report
+    except Exception:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reconcile account balances",
+        )
+
+
+@router.get("/{conto_id}/balance-history", response_model=ContoSaldoStorico)
+def get_balance_history(
+    conto_id: int,
+    data_inizio: date | None = Query(None, description="Default: 90 giorni fa"),
+    data_fine: date | None = Query(None, description="Default: oggi"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id),
+):
+    """Saldo del conto nel tempo, ricostruito dal ledger dei movimenti: un punto
+    a inizio periodo, uno per ogni giorno con movimenti e uno a fine periodo."""
+    data_fine = data_fine or date.today()
+    data_inizio = data_inizio or data_fine - timedelta(days=90)
+    if data_inizio > data_fine:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="data_inizio must not be after data_fine",
+        )
+
+    conto_exists = (
+        db.query(Conto.id)
+        .filter(
+            Conto.id == conto_id,
+            Conto.user_id == current_user_id,
+            Conto.deleted_at.is_(None),
+        )
+        .first()
+    )
+    if not conto_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found or unauthorized",
+        )
+
+    punti = storico_saldo(db, conto_id, data_inizio, data_fine)
+    return {
+        "conto_id": conto_id,
+        "data_inizio": data_inizio,
+        "data_fine": data_fine,
+        "punti": [{"data": giorno, "saldo": saldo} for giorno, saldo in punti],
+    }
+
+
 @router.delete("/{conto_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_conto(
     conto_id: int,
@@ -248,6 +343,25 @@ def restore_conto(
         )
 
 
+@router.get(
+    "/forecast", response_model=ContoPrevisioni, dependencies=[Depends(quota(5))]
+)
+def get_forecast(
+    months: int = Query(12, ge=1, le=24, description="Orizzonte in mesi"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id),
+):
+    """Saldo previsto di ogni conto da oggi a `months` mesi, dal saldo attuale più
+    le esecuzioni future delle ricorrenze attive (vedi forecast.py)."""
+    data_inizio = date.today()
+    data_fine = data_inizio + relativedelta(months=months)
+    return {
+        "data_inizio": data_inizio,
+        "data_fine": data_fine,
+        "conti": proietta_saldi(db, current_user_id, data_fine, data_inizio),
+    }
+
+
 @router.get("/currentMonthExpenses")
 def get_current_month_expenses(
     include_future_recurring: bool = Query(
@@ -317,23 +431,30 @@ def get_current_month_expenses(
     remaining_amount = total_in + total_other - total_out - total_accantonamento
 
     if include_future_recurring:
-        recurring_out = db.query(func.sum(Ricorrenza.importo)).filter(
-            Ricorrenza.user_id == current_user_id,
-            Ricorrenza.tipo == TipoTransazione.USCITA,
-            Ricorrenza.attiva,
-            Ricorrenza.prossima_esecuzione >= today,
-            Ricorrenza.prossima_esecuzione <= last_day,
-        ).scalar() or Decimal("0")
-
-        recurring_in = db.query(func.sum(Ricorrenza.importo)).filter(
+        # Ogni esecuzione da oggi a fine mese, non solo la prossima: una ricorrenza
+        # settimanale conta quattro o cinque volte (vedi forecast.py).
+        ricorrenze = db.query(
+            Ricorrenza.tipo,
+            Ricorrenza.importo,
+            Ricorrenza.frequenza,
+            Ricorrenza.prossima_esecuzione,
+        ).filter(
             Ricorrenza.user_id == current_user_id,
-            Ricorrenza.tipo == TipoTransazione.ENTRATA,
+            Ricorrenza.tipo.in_([TipoTransazione.USCITA, TipoTransazione.ENTRATA]),
             Ricorrenza.attiva,
-            Ricorrenza.prossima_esecuzione >= today,
             Ricorrenza.prossima_esecuzione <= last_day,
-        ).scalar() or Decimal("0")
-
-        remaining_amount += recurring_in - recurring_out
+        )
+        for ric in ricorrenze:
+            esecuzioni = sum(
+                giorno >= today
+                for giorno in espandi_ricorrenza(
+                    ric.prossima_esecuzione, ric.frequenza, last_day
+                )
+            )
+            if ric.tipo == TipoTransazione.ENTRATA:
+                remaining_amount += ric.importo * esecuzioni
+            else:
+                remaining_amount -= ric.importo * esecuzioni
 
     percentage = None
     if user.total_budget and user.total_budget > Decimal("0"):
@@ -362,9 +483,12 @@ def get_expenses_by_category(
     _, last_day_num = calendar.monthrange(today.year, today.month)
     last_day = today.replace(day=last_day_num)
 
-    # Fetch all transactions (Expenses and Refunds) specificamente per questo mese
+    # Fetch all transactions (Expenses and Refunds) specificamente per questo mese.
+    # La categoria arriva nella stessa query: letta in lazy nel ciclo qui sotto
+    # costava una query per ogni categoria distinta.
     transazioni = (
         db.query(Transazione)
+        .options(joinedload(Transazione.categoria))
         .join(Conto, Transazione.conto_id == Conto.id)
         .filter(
             Conto.user_id == current_user_id,
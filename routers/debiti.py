@@ -7,6 +7,7 @@ from schemas.transazione import TransazioneOut, TipoTransazione
 from models import Debito, Conto, Transazione
 from decimal import Decimal
 from datetime import date, datetime, timezone
+from ledger import registra_transazione
 
 router = APIRouter(prefix="/debiti", tags=["Debiti"])
 
@@ -199,8 +200,8 @@ def pay_debito(
         if new_residuo is not None:
             db_debito.residuo = new_residuo
 
-        # Update account balance (USCITA decreases)
-        conto.saldo += body.importo * Decimal("-1")
+        # Update account balance (USCITA decreases), registrato nel ledger
+        registra_transazione(db, trans, conto)
 
         db.add(trans)
         db.add(db_debito)
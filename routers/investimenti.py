@@ -1,6 +1,6 @@
 from datetime import date
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from database import get_db
 import auth
 from models import Investimento, StoricoInvestimento
@@ -26,7 +26,13 @@ def get_investimenti(
     db: Session = Depends(get_db),
     current_user_id: int = Depends(auth.get_current_user_id),
 ):
-    query = db.query(Investimento).filter(Investimento.user_id == current_user_id)
+    # Lo storico serve alle proprietà calcolate di ogni titolo: caricato in una
+    # query sola per tutta la lista invece che una per titolo.
+    query = (
+        db.query(Investimento)
+        .options(selectinload(Investimento.storico))
+        .filter(Investimento.user_id == current_user_id)
+    )
 
     query = apply_filters_and_sort(
         query,
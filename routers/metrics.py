@@ -0,0 +1,24 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter(tags=["Metrics"])
+
+
+# Le metriche (route, volumi, stato del pool) non sono per chiunque: lo scraper
+# si presenta con `Authorization: Bearer $METRICS_TOKEN`. Senza token
+# configurato l'endpoint non esiste.
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(authorization: str = Header("")):
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import extract, func, case
+from datetime import date
 from typing import Optional
 from database import get_db
 from auth import get_current_user_id
+from rate_limit import quota
 from models import Transazione, Categoria, Sottocategoria
 
 router = APIRouter(prefix="/statistics", tags=["Statistics"])
@@ -19,9 +21,23 @@ def get_calculated_amount():
     )
 
 
-@router.get("/yearDetails")
+# Filtro per periodo come range su `data` (e non `extract(...) == ...`): così il
+# DB può usare gli indici (user_id, ..., data) invece di valutare ogni riga.
+# Anno e mese li valida la Query degli endpoint (422): fuori range `date()`
+# solleverebbe ValueError. L'anno si ferma a 9998 perché la fine del periodo è
+# il primo giorno dell'anno dopo.
+def get_period_filter(year: int, month: Optional[int] = None):
+    if month is None:
+        start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    else:
+        start = date(year, month, 1)
+        end = date(year + (month == 12), month % 12 + 1, 1)
+    return (Transazione.data >= start, Transazione.data < end)
+
+
+@router.get("/yearDetails", dependencies=[Depends(quota(10))])
 def get_year_details_statistics(
-    year: int = Query(..., description="L'anno di riferimento"),
+    year: int = Query(..., ge=1, le=9998, description="L'anno di riferimento"),
     categoria_id: Optional[int] = Query(None, description="Filtra per categoria padre"),
     tag_id: Optional[int] = Query(None, description="Filtra per tag"),  # <-- AGGIUNTO
     db: Session = Depends(get_db),
@@ -47,7 +63,7 @@ def get_year_details_statistics(
         .filter(
             Transazione.user_id == current_user_id,
             Transazione.deleted_at.is_(None),
-            extract("year", Transazione.data) == year,
+            *get_period_filter(year),
             Transazione.tipo != "RIMBORSO",
             # Gli accantonamenti hanno un totale separato: niente card per categoria
             Transazione.tipo != "ACCANTONAMENTO",
@@ -68,7 +84,7 @@ def get_year_details_statistics(
     ).filter(
         Transazione.user_id == current_user_id,
         Transazione.deleted_at.is_(None),
-        extract("year", Transazione.data) == year,
+        *get_period_filter(year),
         Transazione.tipo != "RIMBORSO",  # Escludiamo i rimborsi dal conteggio
     )
     if categoria_id:
@@ -108,10 +124,10 @@ def get_year_details_statistics(
     }
 
 
-@router.get("/monthDetails")
+@router.get("/monthDetails", dependencies=[Depends(quota(5))])
 def get_month_details_statistics(
-    year: int = Query(..., description="L'anno di riferimento"),
-    month: int = Query(..., description="Il mese di riferimento (1-12)"),
+    year: int = Query(..., ge=1, le=9998, description="L'anno di riferimento"),
+    month: int = Query(..., ge=1, le=12, description="Il mese di riferimento (1-12)"),
     categoria_id: Optional[int] = Query(None, description="Filtra per categoria padre"),
     tag_id: Optional[int] = Query(None, description="Filtra per tag"),  # <-- AGGIUNTO
     db: Session = Depends(get_db),
@@ -131,8 +147,7 @@ def get_month_details_statistics(
         .filter(
             Transazione.user_id == current_user_id,
             Transazione.deleted_at.is_(None),
-            extract("year", Transazione.data) == year,
-            extract("month", Transazione.data) == month,
+            *get_period_filter(year, month),
             Transazione.tipo != "RIMBORSO",  # Escludiamo i rimborsi dal conteggio
             # Gli accantonamenti hanno un totale separato: niente card per categoria
             Transazione.tipo != "ACCANTONAMENTO",
@@ -202,8 +217,7 @@ def get_month_details_statistics(
     ).filter(
         Transazione.user_id == current_user_id,
         Transazione.deleted_at.is_(None),
-        extract("year", Transazione.data) == year,
-        extract("month", Transazione.data) == month,
+        *get_period_filter(year, month),
         Transazione.tipo != "RIMBORSO",  # Escludiamo i rimborsi dal conteggio
     )
     if categoria_id:
@@ -1,8 +1,9 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from database import get_db
 import auth
+from rate_limit import quota
 from schemas import (
     TransazioneCreate,
     TransazioneOut,
@@ -13,12 +14,17 @@ from schemas import (
 )
 from schemas.transazione import TipoTransazione
 from models import Conto, Transazione
-from services import apply_filters_and_sort
+from services import (
+    RICERCA_MIN_CARATTERI,
+    apply_filters_and_sort,
+    search_transazioni,
+)
 from datetime import datetime, timezone
 from models import Categoria, Sottocategoria
 from sqlalchemy import func
 from decimal import Decimal
 from models import Debito, Tag
+from ledger import blocca_conti, registra_transazione
 
 router = APIRouter(prefix="/transazioni", tags=["Transazioni"])
 
@@ -256,26 +262,12 @@ def create_transazione(
             # 3. FONDAMENTALE: Forza SQLAlchemy a tracciare la modifica
             db.add(parent_trans)
 
-        # 4. Aggiornamento Saldo (Balance Update)
-        if transazione.tipo in (
-            TipoTransazione.RICARICA,
-            TipoTransazione.ACCANTONAMENTO,
-        ):
-            # Giroconto/accantonamento: i soldi escono dalla sorgente. Per la
-            # RICARICA il conto destinazione c'è sempre; per l'ACCANTONAMENTO
-            # è opzionale (salvadanaio): se presente, lo accreditiamo.
-            conto.saldo -= transazione.importo
-            if conto_dest:
-                conto_dest.saldo += transazione.importo
-                db.add(conto_dest)
-        else:
-            # Il rimborso aumenta il saldo del conto (come un'entrata)
-            modificatore = (
-                Decimal("-1")
-                if transazione.tipo == TipoTransazione.USCITA
-                else Decimal("1")
-            )
-            conto.saldo += transazione.importo * modificatore
+        # 4. Aggiornamento Saldo (Balance Update), registrato nel ledger.
+        # Giroconto/accantonamento: i soldi escono dalla sorgente. Per la
+        # RICARICA il conto destinazione c'è sempre; per l'ACCANTONAMENTO
+        # è opzionale (salvadanaio): se presente, lo accreditiamo.
+        # Il rimborso aumenta il saldo del conto (come un'entrata).
+        registra_transazione(db, new_trans, conto, conto_dest)
 
         # --- GESTIONE DEBITO (se fornito) ---
         if getattr(transazione, "debito_id", None):
@@ -436,7 +428,9 @@ def split_transazione(
         )
 
 
-@router.get("/paginated", response_model=TransazionePagination)
+@router.get(
+    "/paginated", response_model=TransazionePagination, dependencies=[Depends(quota(1))]
+)
 def get_transazioni(
     page: int = 1,
     size: int = 10,
@@ -494,7 +488,32 @@ def get_transazioni(
     }
 
 
-@router.get("", response_model=list[TransazioneOut])
+@router.get(
+    "/search", response_model=list[TransazioneOut], dependencies=[Depends(quota(2))]
+)
+def search_transazioni_endpoint(
+    q: str = Query(..., min_length=RICERCA_MIN_CARATTERI, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(auth.get_current_user_id),
+):
+    """Ricerca libera nelle descrizioni, dalla più pertinente (vedi
+    `services.build_transazioni_search_query`). Il termine conta senza gli spazi:
+    "   " passerebbe `min_length` e troverebbe tutto."""
+    if len("".join(q.split())) < RICERCA_MIN_CARATTERI:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=(
+                f"Search term must have at least {RICERCA_MIN_CARATTERI} "
+                "non-blank characters"
+            ),
+        )
+    return search_transazioni(db, current_user_id, q, limit)
+
+
+@router.get(
+    "", response_model=list[TransazioneOut], dependencies=[Depends(quota(1))]
+)
 def get_recent_transazioni(
     filters: TransazioneFilters = Depends(),
     n: int = None,
@@ -553,32 +572,35 @@ def update_transazione(
             else db_trans.importo
         )
 
-        # A. STORNO del vecchio movimento
-        if old_tipo in (TipoTransazione.RICARICA, TipoTransazione.ACCANTONAMENTO):
-            # Giroconto/accantonamento: la sorgente riprende i soldi, l'eventuale
-            # destinazione li perde
-            if conto_vecchio:
-                conto_vecchio.saldo += old_importo
-            if old_conto_dest_id:
-                old_dest = (
-                    db.query(Conto)
-                    .filter(
-                        Conto.id == old_conto_dest_id,
-                        Conto.user_id == current_user_id,
-                    )
-                    .first()
+        # Storno e nuovo movimento possono toccare fino a quattro conti: si
+        # bloccano subito tutti, in ordine di id. Solo quelli dell'utente: i nuovi
+        # id arrivano dal client e la proprietà si verifica più sotto (404).
+        blocca_conti(
+            db,
+            db_trans.conto_id,
+            old_conto_dest_id,
+            transazione_data.conto_id,
+            transazione_data.conto_destinazione_id,
+            user_id=current_user_id,
+        )
+
+        # A. STORNO del vecchio movimento (prima di toccare i dati della
+        # transazione). Giroconto/accantonamento: la sorgente riprende i soldi,
+        # l'eventuale destinazione li perde.
+        old_dest = None
+        if (
+            old_tipo in (TipoTransazione.RICARICA, TipoTransazione.ACCANTONAMENTO)
+            and old_conto_dest_id
+        ):
+            old_dest = (
+                db.query(Conto)
+                .filter(
+                    Conto.id == old_conto_dest_id,
+                    Conto.user_id == current_user_id,
                 )
-                if old_dest:
-                    old_dest.saldo -= old_importo
-                    db.add(old_dest)
-        else:
-            mod_vecchio = (
-                Decimal("1")
-                if old_tipo == TipoTransazione.USCITA
-                else Decimal("-1")
+                .first()
             )
-            if conto_vecchio:
-                conto_vecchio.saldo += old_importo * mod_vecchio
+        registra_transazione(db, db_trans, conto_vecchio, old_dest, storno=True)
 
         # B. AGGIORNAMENTO DATI
         update_data = transazione_data.model_dump(exclude_unset=True)
@@ -665,11 +687,11 @@ def update_transazione(
             )
 
         # D. APPLICAZIONE del nuovo movimento
+        conto_dest_nuovo = None
         if db_trans.tipo in (
             TipoTransazione.RICARICA,
             TipoTransazione.ACCANTONAMENTO,
         ):
-            conto_dest_nuovo = None
             if db_trans.conto_destinazione_id:
                 if db_trans.conto_destinazione_id == db_trans.conto_id:
                     raise HTTPException(
@@ -696,17 +718,7 @@ def update_transazione(
                     status_code=400,
                     detail="A transfer requires a different destination account",
                 )
-            conto_nuovo.saldo -= db_trans.importo
-            if conto_dest_nuovo:
-                conto_dest_nuovo.saldo += db_trans.importo
-                db.add(conto_dest_nuovo)
-        else:
-            mod_nuovo = (
-                Decimal("-1")
-                if db_trans.tipo == TipoTransazione.USCITA
-                else Decimal("1")
-            )
-            conto_nuovo.saldo += db_trans.importo * mod_nuovo
+        registra_transazione(db, db_trans, conto_nuovo, conto_dest_nuovo)
 
         # D-bis. RESIDUO DEBITO: storna il vecchio effetto e applica il nuovo,
         # così cambi di importo (o di debito) restano coerenti col residuo.
@@ -800,30 +812,22 @@ def delete_transazione(
         )
 
     try:
-        # Balance reversion
-        if db_trans.tipo in (
-            TipoTransazione.RICARICA,
-            TipoTransazione.ACCANTONAMENTO,
+        # Balance reversion (storno nel ledger). Giroconto/accantonamento: la
+        # sorgente riprende i soldi, l'eventuale destinazione li perde.
+        conto_dest = None
+        if (
+            db_trans.tipo in (TipoTransazione.RICARICA, TipoTransazione.ACCANTONAMENTO)
+            and db_trans.conto_destinazione_id
         ):
-            # Giroconto/accantonamento: la sorgente riprende i soldi, l'eventuale
-            # destinazione li perde
-            conto.saldo += db_trans.importo
-            if db_trans.conto_destinazione_id:
-                conto_dest = (
-                    db.query(Conto)
-                    .filter(
-                        Conto.id == db_trans.conto_destinazione_id,
-                        Conto.user_id == current_user_id,
-                    )
-                    .first()
+            conto_dest = (
+                db.query(Conto)
+                .filter(
+                    Conto.id == db_trans.conto_destinazione_id,
+                    Conto.user_id == current_user_id,
                 )
-                if conto_dest:
-                    conto_dest.saldo -= db_trans.importo
-                    db.add(conto_dest)
-        elif db_trans.tipo == TipoTransazione.USCITA:
-            conto.saldo += db_trans.importo
-        else:
-            conto.saldo -= db_trans.importo
+                .first()
+            )
+        registra_transazione(db, db_trans, conto, conto_dest, storno=True)
 
         # Se la transazione era collegata a un debito, ripristina il residuo
         # (operazione inversa di create/pay), senza superare l'ammontare totale.
@@ -865,11 +869,7 @@ def delete_transazione(
                 )
                 .first()
             )
-            if conto_figlio is not None:
-                if figlio.tipo == TipoTransazione.USCITA:
-                    conto_figlio.saldo += figlio.importo
-                else:
-                    conto_figlio.saldo -= figlio.importo
+            registra_transazione(db, figlio, conto_figlio, storno=True)
 
         db.delete(db_trans)
         db.commit()
@@ -1,5 +1,10 @@
 import os
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from database import get_db
 from routers.conti import get_current_month_expenses
@@ -7,7 +12,7 @@ import auth
 from fastapi.security import OAuth2PasswordRequestForm
 from models import User
 from schemas import Token, UserCreate, UserBudgetUpdate, UserResponse
-from rate_limit import limiter
+from rate_limit import limite_fuori_dal_loop, limiter
 
 router = APIRouter(tags=["User"])
 
@@ -16,12 +21,86 @@ router = APIRouter(tags=["User"])
 # rivela quali account esistono.
 _DUMMY_PASSWORD_HASH = auth.get_password_hash("dummy-password-for-timing-safety")
 
+
+def _violato_indice_email(errore: IntegrityError) -> bool:
+    """Il vincolo violato è su email (altrimenti è su username). Si guarda solo
+    la prima riga del messaggio, col nome dell'indice: la riga DETAIL di Postgres
+    riporta anche il valore inserito."""
+    messaggio = str(errore.orig).splitlines()[0]
+    return "users_email" in messaggio or "users.email" in messaggio
+
+
 # --- ENDPOINT UTENTI ---
 
 
-@router.post("/register", response_model=Token)
+# Register, login e reset password sono `async def` per attendere bcrypt nel pool
+# di passwords.py senza tenere un thread. La Session però è sincrona: ogni
+# accesso al DB (query, commit, e anche leggere attributi dopo un commit, che li
+# ricarica) passa da `run_in_threadpool`, altrimenti girerebbe nell'event loop e
+# fermerebbe tutte le altre richieste.
+
+
+def _token_di_sessione(db: Session, user: User, user_agent: Optional[str]) -> dict:
+    """Refresh token del dispositivo e access token, con commit. Nel thread pool."""
+    raw_refresh = auth.issue_refresh_token(db, user.id, user_agent=user_agent)
+    db.commit()
+    # Inseriamo la token_version nel JWT per validarla successivamente
+    access_token = auth.create_access_token(
+        data={
+            "user_id": user.id,
+            "token_version": getattr(user, "token_version", 1),
+        }
+    )
+    return {
+        "refresh_token": raw_refresh,
+        "access_token": access_token,
+        "username": user.username,
+    }
+
+
+def _crea_utente(
+    db: Session,
+    email: str,
+    username: str,
+    hashed_pwd: str,
+    user_agent: Optional[str],
+) -> dict:
+    # Creazione Utente in un solo giro: i duplicati (anche solo per maiuscole) li
+    # rifiutano gli indici unici su lower(email) e lower(username), senza due
+    # SELECT di controllo prima dell'INSERT (che lasciavano anche una finestra
+    # per due registrazioni simultanee).
+    try:
+        new_user = User(email=email, username=username, hashed_password=hashed_pwd)
+        db.add(new_user)
+        db.flush()
+        # Come il login: il nuovo utente parte già con la sessione del dispositivo
+        return _token_di_sessione(db, new_user, user_agent)
+    except IntegrityError as e:
+        db.rollback()
+        if _violato_indice_email(e):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The email address you entered is already associated with an account",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The username you selected is not available",
+        )
+    except Exception:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred while creating your account. Please try again later",
+        )
+
+
+@router.post(
+    "/register",
+    response_model=Token,
+    dependencies=[Depends(limite_fuori_dal_loop)],
+)
 @limiter.limit("5/hour")
-def register_user(
+async def register_user(
     user: UserCreate,
     request: Request,
     response: Response,
@@ -34,62 +113,43 @@ def register_user(
             detail="Missing fields. Please provide username, email, and password",
         )
 
-    # Normalizzazione input
-    email_lower = user.email.lower()
-    username_lower = user.username.lower()
-
-    # 1. Controllo duplicati
-    if db.query(User).filter(User.email == email_lower).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The email address you entered is already associated with an account",
-        )
-
-    if db.query(User).filter(User.username == username_lower).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The username you selected is not available",
-        )
-
-    # 2. Creazione Utente
-    try:
-        hashed_pwd = auth.get_password_hash(user.password)
-        new_user = User(
-            email=email_lower,
-            username=username_lower,
-            hashed_password=hashed_pwd,
-        )
-
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-
-        # Come il login: il nuovo utente parte già con la sessione del dispositivo
-        raw_refresh = auth.issue_refresh_token(
-            db, new_user.id, user_agent=request.headers.get("user-agent")
-        )
-        db.commit()
-        auth.set_refresh_cookie(response, raw_refresh)
+    hashed_pwd = await auth.get_password_hash_async(user.password)
+    sessione = await run_in_threadpool(
+        _crea_utente,
+        db,
+        # Normalizzazione input
+        user.email.lower(),
+        user.username.lower(),
+        hashed_pwd,
+        request.headers.get("user-agent"),
+    )
+    auth.set_refresh_cookie(response, sessione["refresh_token"])
+    return {"access_token": sessione["access_token"], "username": sessione["username"]}
 
-        access_token = auth.create_access_token(
-            data={
-                "user_id": new_user.id,
-                "token_version": getattr(new_user, "token_version", 1),
-            }
-        )
 
-        return {"access_token": access_token, "username": new_user.username}
-    except Exception:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An error occurred while creating your account. Please try again later",
+def _cerca_utente(db: Session, login_identifier: str) -> Optional[User]:
+    # Cerchiamo l'utente sia per username che per email: confrontare lower(...)
+    # fa usare gli indici unici ux_users_username_lower / ux_users_email_lower,
+    # e il costo resta lo stesso al crescere degli utenti.
+    return (
+        db.query(User)
+        .filter(
+            or_(
+                func.lower(User.username) == login_identifier,
+                func.lower(User.email) == login_identifier,
+            )
         )
+        .first()
+    )
 
 
-@router.post("/login", response_model=Token)
+@router.post(
+    "/login",
+    response_model=Token,
+    dependencies=[Depends(limite_fuori_dal_loop)],
+)
 @limiter.limit("10/minute;50/hour")
-def login(
+async def login(
     request: Request,
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
@@ -103,24 +163,19 @@ def login(
 
     # Il campo si chiama "username" in OAuth2PasswordRequestForm, ma può contenere sia username che email
     login_identifier = form_data.username.lower()
-
-    # Cerchiamo l'utente sia per username che per email usando or_
-    from sqlalchemy import or_
-
-    user = (
-        db.query(User)
-        .filter(or_(User.username == login_identifier, User.email == login_identifier))
-        .first()
-    )
+    user = await run_in_threadpool(_cerca_utente, db, login_identifier)
 
     # Utente inesistente e password errata devono essere indistinguibili, sia nel
     # messaggio sia nel tempo di risposta: altrimenti /login diventa un oracolo per
     # scoprire quali email/username sono registrati. Se l'utente non c'è, verifichiamo
     # comunque la password contro un hash fittizio per pagare lo stesso costo bcrypt.
+    # bcrypt gira nel pool di passwords.py: l'attesa non occupa un thread del server.
     if user:
-        password_ok = auth.verify_password(form_data.password, user.hashed_password)
+        password_ok = await auth.verify_password_async(
+            form_data.password, user.hashed_password
+        )
     else:
-        auth.verify_password(form_data.password, _DUMMY_PASSWORD_HASH)
+        await auth.verify_password_async(form_data.password, _DUMMY_PASSWORD_HASH)
         password_ok = False
 
     if not password_ok:
@@ -129,19 +184,17 @@ def login(
             detail="Invalid credentials",
         )
 
-    # Sessione persistente del dispositivo: refresh token in cookie httpOnly
-    raw_refresh = auth.issue_refresh_token(
-        db, user.id, user_agent=request.headers.get("user-agent")
-    )
-    db.commit()
-    auth.set_refresh_cookie(response, raw_refresh)
+    # Password giusta ma hash con un costo diverso da BCRYPT_ROUNDS: è l'unico
+    # momento in cui abbiamo la password in chiaro, quindi lo aggiorniamo ora.
+    if auth.needs_rehash(user.hashed_password):
+        user.hashed_password = await auth.get_password_hash_async(form_data.password)
 
-    # Inseriamo la token_version nel JWT per validarla successivamente
-    access_token = auth.create_access_token(
-        data={"user_id": user.id, "token_version": user.token_version}
+    # Sessione persistente del dispositivo: refresh token in cookie httpOnly
+    sessione = await run_in_threadpool(
+        _token_di_sessione, db, user, request.headers.get("user-agent")
     )
-
-    return {"access_token": access_token, "username": user.username}
+    auth.set_refresh_cookie(response, sessione["refresh_token"])
+    return {"access_token": sessione["access_token"], "username": sessione["username"]}
 
 
 @router.get("/me", response_model=UserResponse)
@@ -15,6 +15,12 @@ from .conto import (
     ContoUpdate,
     ContoOut,
     ContoFilters,
+    ContoSaldoPunto,
+    ContoSaldoStorico,
+    ContoPrevisione,
+    ContoPrevisioni,
+    ContoDeriva,
+    ContoRiconciliazione,
 )
 from .categoria import (
     CategoriaBase,
@@ -76,6 +82,7 @@ from .bank_transaction import (
     BankConnectorConfigUpdate,
     BankConnectorSyncResponse,
     BankTransactionProposalImport,
+    BankTransactionProposalBatchImport,
     BankTransactionProposalOut,
 )
 from .open_banking import (
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 from datetime import datetime, date
 from decimal import Decimal
@@ -84,8 +84,21 @@ class BankTransactionProposalImport(BaseModel):
     descrizione: Optional[str] = None
 
 
+class BankTransactionProposalBatchItem(BankTransactionProposalImport):
+    proposal_id: int
+
+
+class BankTransactionProposalBatchImport(BaseModel):
+    # Proposte da importare, ognuna con la propria tassonomia e conto. Tetto
+    # alto ma finito: il batch gira in UNA transazione DB.
+    items: list[BankTransactionProposalBatchItem] = Field(min_length=1, max_length=500)
+
+
 class BankStatementImportResponse(BaseModel):
     # Esito dell'import di un estratto conto PDF.
     parsed: int  # movimenti riconosciuti nel PDF (dopo il filtro date)
     new_proposals: int  # proposte PENDING effettivamente create
     skipped: int  # scartati perché duplicati di proposte già esistenti
+    # Layout riconosciuto (chiave in statement_profiles.STATEMENT_PROFILES, o
+    # "LEARNED" per le colonne ricavate dall'euristica). None se non riconosciuto.
+    profile: Optional[str] = None
@@ -68,6 +68,49 @@ class ContoOut(ContoBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ContoSaldoPunto(BaseModel):
+    data: date
+    saldo: Decimal
+
+
+class ContoSaldoStorico(BaseModel):
+    conto_id: int
+    data_inizio: date
+    data_fine: date
+    punti: List[ContoSaldoPunto]
+
+
+class ContoPrevisione(BaseModel):
+    conto_id: int
+    nome: str
+    saldo_attuale: Decimal
+    saldo_finale: Decimal
+    saldo_minimo: Decimal
+    data_saldo_minimo: date
+    punti: List[ContoSaldoPunto]
+
+
+class ContoPrevisioni(BaseModel):
+    data_inizio: date
+    data_fine: date
+    conti: List[ContoPrevisione]
+
+
+class ContoDeriva(BaseModel):
+    conto_id: int
+    user_id: int
+    saldo: Decimal
+    saldo_atteso: Decimal
+    saldo_ledger: Decimal
+    differenza: Decimal
+    riparato: bool
+
+
+class ContoRiconciliazione(BaseModel):
+    conti_verificati: int
+    conti_sfasati: List[ContoDeriva]
+
+
 class ContoFilters:
     def __init__(
         self,
@@ -1,22 +1,67 @@
 import base64
 import io
 import os
-import re
 import time
 import requests
-import yfinance as yf
 from cryptography.fernet import Fernet, InvalidToken
 from jose import jwt
 from datetime import date, timedelta, datetime, timezone
 import logging
+import auth
 from database import SessionLocal
 import models
+import rate_limit
 from dateutil.relativedelta import relativedelta
-from sqlalchemy.orm import Query
-from sqlalchemy import asc, desc
+from sqlalchemy.orm import Query, Session
+from sqlalchemy import (
+    Select,
+    asc,
+    bindparam,
+    case,
+    desc,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
 from pydantic import BaseModel
-from decimal import Decimal, InvalidOperation
-from typing import Optional
+from decimal import Decimal
+from collections import defaultdict
+from itertools import chain, islice
+from typing import BinaryIO, Iterable, Iterator, Optional
+from forecast import avanza_ricorrenza
+from metrics import misura_sync_bancaria
+from ledger import (
+    TRANSAZIONE,
+    crea_snapshot_mensili,
+    effetti_transazione,
+    riconcilia_saldi,
+    registra_movimenti,
+    registra_transazione,
+)
+from statement_profiles import (
+    PDF,
+    SPREADSHEET,
+    detect_pdf_profile,
+    detect_spreadsheet_profile,
+    learn_spreadsheet_profile,
+    match_pdf_profile,
+    match_spreadsheet_profile,
+    normalize_header,
+)
+from statement_tokenizer import (
+    AMOUNT_RE,
+    DATE_RE,
+    DATE_START_RE,
+    clean_description,
+    coerce_amount,
+    coerce_date,
+    normalize_spaces,
+    parse_date_token,
+    parse_italian_amount,
+)
 
 # Configura il logging
 logging.basicConfig(level=logging.INFO)
@@ -78,6 +123,10 @@ def get_live_price(ticker_symbol: str, isin_code: str):
     if not search_term:
         return None
 
+    # Import locale: yfinance si porta dietro pandas e NumPy, che servono solo
+    # qui (task dei prezzi) e non devono rallentare l'avvio dell'API.
+    import yfinance as yf
+
     try:
         ticker = yf.Ticker(search_term)
         data = ticker.history(period="1d")
@@ -105,9 +154,11 @@ def task_aggiornamento_prezzi():
     """
     Questo task aggiorna solo il campo 'prezzo_attuale' nell'anagrafica Investimento.
     I calcoli di profitto e valore totale verranno fatti al volo dalle @property del modello.
+    Ritorna quanti titoli ha aggiornato (per lo storico dei job, vedi jobs.py).
     """
     logger.info("Avvio task aggiornamento prezzi investimenti...")
     db = SessionLocal()
+    aggiornati = 0
     try:
         # Recuperiamo solo i titoli che hanno un ticker o un ISIN
         investimenti = db.query(models.Investimento).all()
@@ -119,6 +170,7 @@ def task_aggiornamento_prezzi():
                 if prezzo_live:
                     inv.prezzo_attuale = prezzo_live
                     inv.data_ultimo_aggiornamento = date.today()
+                    aggiornati += 1
 
                     # OPZIONALE: Se vuoi loggare il profitto attuale usando la @property:
                     logger.info(
@@ -139,16 +191,165 @@ def task_aggiornamento_prezzi():
 
         db.commit()
         logger.info("Task aggiornamento prezzi completato.")
+        return aggiornati
     except Exception as e:
         db.rollback()
         logger.error(f"Errore fatale nel task investimenti: {e}")
+        raise
     finally:
         db.close()
 
 
+def _scrivi_transazioni_in_blocco(
+    db, rows: list[dict], movimenti: list[dict], **valori_conto
+) -> list[int]:
+    """Scrive in blocco transazioni ed effetti sui saldi.
+
+    Un INSERT multi-riga di `rows`, un UPDATE per conto col delta già aggregato dai
+    `movimenti` (calcolato dal DB, `saldo = saldo + :delta`, in ordine di id come
+    ogni scrittura su più conti, vedi ledger.py) e i movimenti del ledger in un
+    INSERT executemany. Ogni movimento indica in "riga" l'indice in `rows` della
+    sua transazione; `valori_conto` sono colonne in più da scrivere sui conti
+    toccati. Nessun commit. Ritorna gli id delle transazioni, nell'ordine di `rows`.
+    """
+    # RETURNING in ordine di parametro: su Postgres resta un INSERT multi-riga
+    # (sentinella implicita sulla SERIAL); SQLite, usato nei test, va riga per riga.
+    transazione_ids = list(
+        db.execute(
+            insert(models.Transazione).returning(
+                models.Transazione.id, sort_by_parameter_order=True
+            ),
+            rows,
+        ).scalars()
+    )
+
+    deltas: dict[int, Decimal] = defaultdict(Decimal)
+    for movimento in movimenti:
+        deltas[movimento["conto_id"]] += movimento["importo"]
+    conti = models.Conto.__table__
+    db.execute(
+        update(conti)
+        .where(conti.c.id == bindparam("b_conto_id"))
+        .values(saldo=conti.c.saldo + bindparam("b_delta"), **valori_conto),
+        [
+            {"b_conto_id": cid, "b_delta": delta}
+            for cid, delta in sorted(deltas.items())
+        ],
+    )
+    registra_movimenti(
+        db,
+        [
+            {
+                "conto_id": m["conto_id"],
+                "data": m["data"],
+                "importo": m["importo"],
+                "causale": TRANSAZIONE,
+                "transazione_id": transazione_ids[m["riga"]],
+            }
+            for m in movimenti
+        ],
+    )
+    return transazione_ids
+
+
+# Ricorrenze per commit: un errore fa ripetere solo il suo blocco, una alla volta
+_RICORRENZE_PER_BLOCCO = 100
+# Esecuzioni arretrate al massimo per ricorrenza e per giro: una ricorrenza
+# giornaliera rimasta indietro di anni (data sbagliata, conto ripristinato) non
+# genera migliaia di transazioni in un colpo; il resto lo recuperano i giri dopo.
+RICORRENZE_MAX_ARRETRATI = int(os.getenv("RICORRENZE_MAX_ARRETRATI", "62"))
+
+
+def _esegui_ricorrenze(
+    db, ricorrenze: list, conti: dict[int, models.Conto], today: date
+) -> int:
+    """Genera tutte le esecuzioni arretrate fino a oggi delle `ricorrenze` (i loro
+    `conti` già caricati, per id), ognuna alla sua data, e sposta in avanti
+    `prossima_esecuzione`. Al massimo RICORRENZE_MAX_ARRETRATI per ricorrenza:
+    oltre, `prossima_esecuzione` resta sulla prima non generata.
+
+    Le scritture vanno in blocco (`_scrivi_transazioni_in_blocco`). Nessun commit.
+    Ritorna le transazioni create.
+    """
+    rows = []
+    movimenti = []
+    for ric in ricorrenze:
+        conto = conti.get(ric.conto_id)
+        if conto is None:
+            logger.warning(
+                "Ricorrenza %s: conto %s inesistente, salto", ric.id, ric.conto_id
+            )
+            continue
+        # Conto in soft-delete: la ricorrenza resta sospesa finché il conto
+        # non viene ripristinato (niente transazioni fantasma su un conto nascosto).
+        if conto.deleted_at is not None:
+            continue
+
+        giorno = ric.prossima_esecuzione
+        eseguite = 0
+        while giorno <= today:
+            if eseguite == RICORRENZE_MAX_ARRETRATI:
+                logger.warning(
+                    "Ricorrenza %s: raggiunto il limite di %s esecuzioni arretrate, "
+                    "riprende dal %s al prossimo giro",
+                    ric.id,
+                    RICORRENZE_MAX_ARRETRATI,
+                    giorno,
+                )
+                break
+            eseguite += 1
+            rows.append(
+                {
+                    "importo": ric.importo,
+                    "importo_netto": ric.importo,
+                    "tipo": ric.tipo,
+                    "descrizione": f"Ricorrente: {ric.nome}",
+                    "data": giorno,
+                    "conto_id": ric.conto_id,
+                    "user_id": ric.user_id,
+                    "categoria_id": ric.categoria_id,
+                    "sottocategoria_id": ric.sottocategoria_id,
+                    "tag_id": ric.tag_id,
+                }
+            )
+            # Segni di `effetti_transazione`, come per le transazioni inserite a
+            # mano: un RIMBORSO ricorrente accredita il conto (prima del ledger
+            # veniva addebitato come un'uscita).
+            for conto_id, delta in effetti_transazione(
+                ric.tipo, ric.importo, ric.conto_id
+            ):
+                movimenti.append(
+                    {
+                        "conto_id": conto_id,
+                        "data": giorno,
+                        "importo": delta,
+                        "riga": len(rows) - 1,
+                    }
+                )
+            prossima = avanza_ricorrenza(giorno, ric.frequenza)
+            if prossima is None:
+                # Frequenza sconosciuta: una sola esecuzione e data invariata, come
+                # prima; senza avanzare, recuperare gli arretrati non finirebbe mai.
+                logger.warning(
+                    "Ricorrenza %s: frequenza %r sconosciuta", ric.id, ric.frequenza
+                )
+                break
+            giorno = prossima
+        ric.prossima_esecuzione = giorno
+
+    if rows:
+        _scrivi_transazioni_in_blocco(db, rows, movimenti)
+    return len(rows)
+
+
 def task_transazioni_ricorrenti():
+    """Esegue le ricorrenze scadute recuperando tutte le esecuzioni arretrate (se lo
+    scheduler è rimasto fermo una settimana, una ricorrenza giornaliera ne genera
+    sette in un solo giro), a blocchi di `_RICORRENZE_PER_BLOCCO` per commit.
+    Ritorna le transazioni create."""
     db = SessionLocal()
     today = date.today()
+    totale = 0
 
     try:
         # 1. Trova tutte le ricorrenze attive che devono essere eseguite oggi o prima
@@ -158,132 +359,292 @@ def task_transazioni_ricorrenti():
                 models.Ricorrenza.attiva,
                 models.Ricorrenza.prossima_esecuzione <= today,
             )
+            .order_by(models.Ricorrenza.id)
             .all()
         )
-
-        for ric in ricorrenze:
-            # Isoliamo ogni ricorrenza: un errore su una non deve bloccare le altre.
+        # 2. Tutti i conti coinvolti in una query, invece di un get per ricorrenza
+        conto_ids = {ric.conto_id for ric in ricorrenze}
+        conti = {
+            conto.id: conto
+            for conto in db.query(models.Conto).filter(models.Conto.id.in_(conto_ids))
+        }
+
+        for inizio in range(0, len(ricorrenze), _RICORRENZE_PER_BLOCCO):
+            blocco = ricorrenze[inizio : inizio + _RICORRENZE_PER_BLOCCO]
             try:
-                conto = db.query(models.Conto).get(ric.conto_id)
-                if conto is None:
-                    logger.warning(
-                        "Ricorrenza %s: conto %s inesistente, salto",
-                        ric.id,
-                        ric.conto_id,
-                    )
-                    continue
-
-                # Conto in soft-delete: la ricorrenza resta sospesa finché il conto
-                # non viene ripristinato (niente transazioni fantasma su un conto nascosto).
-                if conto.deleted_at is not None:
-                    continue
-
-                # 2. Crea la transazione reale
-                nuova_trans = models.Transazione(
-                    importo=ric.importo,
-                    importo_netto=ric.importo,
-                    tipo=ric.tipo,
-                    descrizione=f"Ricorrente: {ric.nome}",
-                    data=today,
-                    conto_id=ric.conto_id,
-                    user_id=ric.user_id,
-                    categoria_id=ric.categoria_id,
-                    sottocategoria_id=ric.sottocategoria_id,
-                    tag_id=ric.tag_id,
-                )
-
-                # 3. Aggiorna il saldo del conto associato
-                if str(ric.tipo).upper() == "ENTRATA":
-                    conto.saldo += ric.importo
-                else:
-                    conto.saldo -= ric.importo
-
-                # 4. Calcola la prossima data di esecuzione
-                if ric.frequenza == "GIORNALIERA":
-                    ric.prossima_esecuzione += timedelta(days=1)
-                elif ric.frequenza == "SETTIMANALE":
-                    ric.prossima_esecuzione += timedelta(weeks=1)
-                elif ric.frequenza == "MENSILE":
-                    ric.prossima_esecuzione += relativedelta(months=1)
-                elif ric.frequenza == "ANNUALE":
-                    ric.prossima_esecuzione += relativedelta(years=1)
-
-                db.add(nuova_trans)
-                # Commit per-ricorrenza: una riga rotta non perde le altre.
+                create = _esegui_ricorrenze(db, blocco, conti, today)
                 db.commit()
+                totale += create
+                logger.info("Ricorrenze eseguite: %s transazioni create", create)
             except Exception as e:
                 db.rollback()
-                logger.error("Errore eseguendo la ricorrenza %s: %s", ric.id, e)
+                logger.error(
+                    "Errore eseguendo un blocco di ricorrenze, riprovo una per una: %s",
+                    e,
+                )
+                # Isoliamo ogni ricorrenza: un errore su una non deve bloccare le altre.
+                for ric in blocco:
+                    try:
+                        totale += _esegui_ricorrenze(db, [ric], conti, today)
+                        db.commit()
+                    except Exception as e:
+                        db.rollback()
+                        logger.error(
+                            "Errore eseguendo la ricorrenza %s: %s", ric.id, e
+                        )
+        return totale
     finally:
         db.close()
 
 
-def task_ricarica_automatica_conti():
+def task_snapshot_saldi():
+    """Snapshot dei saldi a fine mese precedente (vedi ledger.py): tengono corte
+    le somme del ledger per saldo a una data e storico."""
     db = SessionLocal()
-    today = date.today()
+    fine_mese = date.today().replace(day=1) - timedelta(days=1)
+    try:
+        creati = crea_snapshot_mensili(db, fine_mese)
+        db.commit()
+        logger.info("Snapshot saldi al %s: %s conti", fine_mese, creati)
+        return creati
+    except Exception as e:
+        db.rollback()
+        logger.error("Errore creando gli snapshot dei saldi: %s", e)
+        raise
+    finally:
+        db.close()
 
+
+def task_pulizia_refresh_token():
+    """Elimina i refresh token scaduti, revocati o ruotati da tempo (vedi
+    auth.delete_stale_refresh_tokens): la tabella resta proporzionale alle
+    sessioni attive."""
+    db = SessionLocal()
     try:
-        # Trova i conti con ricarica attiva che devono essere controllati oggi
-        conti_da_controllare = (
-            db.query(models.Conto)
-            .filter(
+        eliminati = auth.delete_stale_refresh_tokens(db)
+        logger.info("Pulizia refresh token: %s righe eliminate", eliminati)
+        return eliminati
+    except Exception as e:
+        db.rollback()
+        logger.error("Errore nella pulizia dei refresh token: %s", e)
+        raise
+    finally:
+        db.close()
+
+
+def task_pulizia_rate_limit():
+    """Elimina i contatori del rate limit scaduti da più della finestra più lunga
+    (vedi rate_limit.elimina_contatori_scaduti); con lo storage in memoria o su
+    Redis non fa nulla."""
+    try:
+        eliminati = rate_limit.elimina_contatori_scaduti()
+        logger.info("Pulizia rate limit: %s contatori eliminati", eliminati)
+        return eliminati
+    except Exception as e:
+        logger.error("Errore nella pulizia del rate limit: %s", e)
+        raise
+
+
+def task_riconciliazione_saldi():
+    """Ricalcola ogni notte i saldi dalle transazioni e segnala le derive (vedi
+    ledger.riconcilia_saldi); le corregge solo con RICONCILIAZIONE_RIPARA=true."""
+    db = SessionLocal()
+    ripara = os.getenv("RICONCILIAZIONE_RIPARA", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    try:
+        report = riconcilia_saldi(db, ripara=ripara)
+        db.commit()
+        for deriva in report["conti_sfasati"]:
+            logger.warning(
+                "Saldo sfasato sul conto %s: saldo %s, atteso %s%s",
+                deriva["conto_id"],
+                deriva["saldo"],
+                deriva["saldo_atteso"],
+                " (riparato)" if deriva["riparato"] else "",
+            )
+        logger.info(
+            "Riconciliazione saldi: %s conti verificati, %s sfasati",
+            report["conti_verificati"],
+            len(report["conti_sfasati"]),
+        )
+        return report["conti_verificati"]
+    except Exception as e:
+        db.rollback()
+        logger.error("Errore nella riconciliazione dei saldi: %s", e)
+        raise
+    finally:
+        db.close()
+
+
+def _prossimo_controllo(frequenza: Optional[str], today: date) -> Optional[date]:
+    if frequenza == "SETTIMANALE":
+        return today + timedelta(weeks=1)
+    if frequenza == "MENSILE":
+        return today + relativedelta(months=1)
+    return None
+
+
+def _esegui_ricariche(db, today: date) -> int:
+    """Ricarica i conti sotto soglia dalle rispettive sorgenti, in blocco per sorgente.
+
+    Destinazioni e sorgenti si leggono e si bloccano in una sola query, in ordine
+    di id; le destinazioni si elaborano raggruppate per sorgente con saldi correnti
+    in memoria, così due conti alimentati dalla stessa sorgente non la vanno
+    entrambi a leggere piena. Ogni gruppo scrive in un savepoint
+    (`_ricarica_da_sorgente`): se fallisce si annullano solo le sue ricariche e i
+    suoi controlli, che si riprovano al giro dopo, e gli altri gruppi proseguono.
+    Nessun commit. Ritorna le ricariche create.
+    """
+    # Trova i conti con ricarica attiva che devono essere controllati oggi
+    da_controllare = list(
+        db.execute(
+            select(models.Conto.id, models.Conto.conto_sorgente_id)
+            .where(
                 models.Conto.ricarica_automatica,
                 models.Conto.prossimo_controllo <= today,
                 models.Conto.deleted_at.is_(None),
             )
-            .all()
+            .order_by(models.Conto.id)
         )
+    )
+    if not da_controllare:
+        return 0
+    ids = {riga.id for riga in da_controllare} | {
+        riga.conto_sorgente_id
+        for riga in da_controllare
+        if riga.conto_sorgente_id is not None
+    }
+    conti = {
+        conto.id: conto
+        for conto in db.query(models.Conto)
+        .filter(models.Conto.id.in_(ids))
+        .order_by(models.Conto.id)
+        .with_for_update()
+        .populate_existing()
+    }
+    saldi = {conto_id: conto.saldo for conto_id, conto in conti.items()}
 
-        for conto in conti_da_controllare:
-            try:
-                # Se il saldo è sceso sotto la soglia minima
-                if (
-                    conto.soglia_minima is not None
-                    and conto.budget_obiettivo is not None
-                    and conto.saldo < conto.soglia_minima
-                ):
-                    importo_ricarica = (
-                        conto.budget_obiettivo - conto.saldo
-                    ).quantize(Decimal("0.01"))
-                    conto_sorgente = db.query(models.Conto).get(
-                        conto.conto_sorgente_id
-                    )
+    per_sorgente: dict[Optional[int], list[models.Conto]] = defaultdict(list)
+    for riga in da_controllare:
+        per_sorgente[riga.conto_sorgente_id].append(conti[riga.id])
 
-                    if (
-                        conto_sorgente
-                        and conto_sorgente.deleted_at is None
-                        and conto_sorgente.saldo >= importo_ricarica
-                    ):
-                        # Giroconto interno: una sola transazione RICARICA dalla
-                        # sorgente alla destinazione (esclusa dai totali entrate/uscite).
-                        ricarica = models.Transazione(
-                            importo=importo_ricarica,
-                            importo_netto=importo_ricarica,
-                            tipo="RICARICA",
-                            descrizione=f"Ricarica automatica da {conto_sorgente.nome}",
-                            data=today,
-                            conto_id=conto_sorgente.id,
-                            conto_destinazione_id=conto.id,
-                            user_id=conto.user_id,
-                        )
-                        db.add(ricarica)
+    create = 0
+    for sorgente_id in sorted(per_sorgente, key=lambda i: (i is None, i)):
+        # Una sorgente può essere a sua volta destinazione di un altro gruppo:
+        # se il gruppo fallisce, i saldi in memoria tornano a prima del gruppo
+        saldi_prima = dict(saldi)
+        try:
+            with db.begin_nested():
+                create += _ricarica_da_sorgente(
+                    db,
+                    today,
+                    conti.get(sorgente_id),
+                    per_sorgente[sorgente_id],
+                    saldi,
+                )
+        except Exception as e:
+            saldi = saldi_prima
+            logger.error(
+                "Ricariche dalla sorgente %s annullate (conti %s): %s",
+                sorgente_id,
+                [conto.id for conto in per_sorgente[sorgente_id]],
+                e,
+            )
+    return create
 
-                        # Aggiorna i saldi
-                        conto_sorgente.saldo -= importo_ricarica
-                        conto.saldo += importo_ricarica
 
-                # 4. Calcola il prossimo controllo
-                if conto.frequenza_controllo == "SETTIMANALE":
-                    conto.prossimo_controllo = today + timedelta(weeks=1)
-                elif conto.frequenza_controllo == "MENSILE":
-                    conto.prossimo_controllo = today + relativedelta(months=1)
+def _ricarica_da_sorgente(
+    db,
+    today: date,
+    sorgente: Optional[models.Conto],
+    destinazioni: list[models.Conto],
+    saldi: dict[int, Decimal],
+) -> int:
+    """Le ricariche di un gruppo di destinazioni dalla stessa sorgente.
 
-                db.commit()
-            except Exception as e:
-                db.rollback()
-                logger.error(
-                    "Errore nella ricarica automatica del conto %s: %s", conto.id, e
-                )
+    RICARICA, saldi e ledger in blocco (`_scrivi_transazioni_in_blocco`) e un
+    UPDATE executemany dei prossimi controlli; aggiorna `saldi`. Ritorna le
+    ricariche create.
+    """
+    rows = []
+    movimenti = []
+    controlli = []
+    for conto in destinazioni:
+        prossimo = _prossimo_controllo(conto.frequenza_controllo, today)
+        if prossimo is not None:
+            controlli.append({"id": conto.id, "prossimo_controllo": prossimo})
+
+        # Se il saldo è sceso sotto la soglia minima
+        if (
+            conto.soglia_minima is None
+            or conto.budget_obiettivo is None
+            or saldi[conto.id] >= conto.soglia_minima
+            or sorgente is None
+            or sorgente.id == conto.id
+            or sorgente.deleted_at is not None
+        ):
+            continue
+        importo = (conto.budget_obiettivo - saldi[conto.id]).quantize(
+            Decimal("0.01")
+        )
+        if saldi[sorgente.id] < importo:
+            logger.info(
+                "Ricarica del conto %s saltata: sorgente %s senza fondi",
+                conto.id,
+                sorgente.id,
+            )
+            continue
+
+        # Giroconto interno: una sola transazione RICARICA dalla sorgente
+        # alla destinazione (esclusa dai totali entrate/uscite).
+        rows.append(
+            {
+                "importo": importo,
+                "importo_netto": importo,
+                "tipo": "RICARICA",
+                "descrizione": f"Ricarica automatica da {sorgente.nome}",
+                "data": today,
+                "conto_id": sorgente.id,
+                "conto_destinazione_id": conto.id,
+                "user_id": conto.user_id,
+            }
+        )
+        for conto_id, delta in effetti_transazione(
+            "RICARICA", importo, sorgente.id, conto.id
+        ):
+            saldi[conto_id] += delta
+            movimenti.append(
+                {
+                    "conto_id": conto_id,
+                    "data": today,
+                    "importo": delta,
+                    "riga": len(rows) - 1,
+                }
+            )
+
+    if rows:
+        _scrivi_transazioni_in_blocco(db, rows, movimenti)
+    if controlli:
+        db.execute(update(models.Conto), controlli)
+    return len(rows)
+
+
+def task_ricarica_automatica_conti():
+    db = SessionLocal()
+    today = date.today()
+
+    try:
+        create = _esegui_ricariche(db, today)
+        db.commit()
+        logger.info("Ricariche automatiche: %s create", create)
+        return create
+    except Exception as e:
+        db.rollback()
+        logger.error("Errore nella ricarica automatica dei conti: %s", e)
+        raise
     finally:
         db.close()
 
@@ -512,6 +873,8 @@ def fetch_nordigen_transactions(
     return transactions
 
 
+# Latenza per provider e 429 della banca finiscono nelle metriche (metrics.py)
+@misura_sync_bancaria
 def fetch_bank_transactions_for_conto(db, conto):
     if not conto.bank_connector_provider:
         raise ValueError("Bank connector provider not configured")
@@ -682,8 +1045,7 @@ def import_bank_transaction_proposal(db, proposal, import_data, current_user_id)
         tag_id=import_data.tag_id,
     )
 
-    modifier = Decimal("-1") if tipo == "USCITA" else Decimal("1")
-    conto.saldo += importo * modifier
+    registra_transazione(db, new_trans, conto)
 
     db.add(new_trans)
     db.flush()
@@ -695,8 +1057,105 @@ def import_bank_transaction_proposal(db, proposal, import_data, current_user_id)
     return new_trans
 
 
+def find_owned_tassonomia(
+    db,
+    user_id: int,
+    categoria_ids: set[int],
+    sottocategoria_ids: set[int],
+    tag_ids: set[int],
+) -> set[tuple[str, int]]:
+    """Quali tra gli id richiesti appartengono davvero all'utente, in UNA query.
+
+    Ritorna coppie ("categoria" | "sottocategoria" | "tag", id): un id richiesto
+    che non compare qui è di un altro utente (o non esiste).
+    """
+    parts = []
+    for kind, model, ids in (
+        ("categoria", models.Categoria, categoria_ids),
+        ("sottocategoria", models.Sottocategoria, sottocategoria_ids),
+        ("tag", models.Tag, tag_ids),
+    ):
+        if ids:
+            parts.append(
+                select(literal(kind), model.id).where(
+                    model.id.in_(ids), model.user_id == user_id
+                )
+            )
+    if not parts:
+        return set()
+    stmt = parts[0] if len(parts) == 1 else parts[0].union_all(*parts[1:])
+    return {(kind, id_) for kind, id_ in db.execute(stmt)}
+
+
+def import_bank_transaction_proposals_batch(
+    db, proposals: list, items: list, current_user_id: int
+) -> list[int]:
+    """Importa in blocco proposte PENDING già verificate (proprietà, stato, conti e
+    tassonomia li controlla il chiamante). `proposals[i]` va con `items[i]`.
+
+    Invece di N giri di `import_bank_transaction_proposal` (lookup del conto,
+    flush e `saldo +=` per ognuna): transazioni, saldi e ledger in blocco
+    (`_scrivi_transazioni_in_blocco`) e un UPDATE executemany delle proposte.
+    Nessun commit: tutto resta nella transazione del chiamante.
+
+    Ritorna gli id delle nuove transazioni, nello stesso ordine di `items`.
+    """
+    now = datetime.now(timezone.utc)
+    rows = []
+    movimenti = []
+    for proposal, item in zip(proposals, items):
+        conto_id = item.conto_id or proposal.conto_id
+        tipo = proposal.tipo
+        if tipo not in ["USCITA", "ENTRATA", "RIMBORSO"]:
+            tipo = "USCITA"
+        rows.append(
+            {
+                "importo": proposal.importo,
+                "importo_netto": proposal.importo,
+                "tipo": tipo,
+                "data": proposal.data,
+                # La descrizione la decide l'utente, come nell'import singolo
+                "descrizione": item.descrizione,
+                "conto_id": conto_id,
+                "user_id": current_user_id,
+                "categoria_id": item.categoria_id,
+                "sottocategoria_id": item.sottocategoria_id,
+                "tag_id": item.tag_id,
+            }
+        )
+        for effetto_conto_id, delta in effetti_transazione(
+            tipo, proposal.importo, conto_id
+        ):
+            movimenti.append(
+                {
+                    "conto_id": effetto_conto_id,
+                    "data": proposal.data,
+                    "importo": delta,
+                    "riga": len(rows) - 1,
+                }
+            )
+
+    transazione_ids = _scrivi_transazioni_in_blocco(
+        db, rows, movimenti, lastImport=now
+    )
+
+    db.execute(
+        update(models.BankTransactionProposal),
+        [
+            {
+                "id": proposal.id,
+                "status": "IMPORTED",
+                "imported_transaction_id": transazione_id,
+            }
+            for proposal, transazione_id in zip(proposals, transazione_ids)
+        ],
+    )
+    return transazione_ids
+
+
 def task_sync_bank_connectors():
     db = SessionLocal()
+    totale_proposte = 0
     try:
         conti = (
             db.query(models.Conto)
@@ -725,6 +1184,7 @@ def task_sync_bank_connectors():
                         db, conto.user_id, conto, candidate
                     ):
                         proposals_created += 1
+                totale_proposte += proposals_created
                 if proposals_created:
                     logger.info(
                         f"Bank sync for conto {conto.id}: created {proposals_created} proposals"
@@ -737,9 +1197,11 @@ def task_sync_bank_connectors():
                 continue
 
         db.commit()
+        return totale_proposte
     except Exception as e:
         db.rollback()
         logger.error(f"Fatal error in task_sync_bank_connectors: {e}")
+        raise
     finally:
         db.close()
 
@@ -758,12 +1220,6 @@ def discard_bank_transaction_proposal(db, proposal):
 # prima dell'import, quindi l'obiettivo è un baseline ragionevole, facile da
 # ritarare (vedi il parametro `balance_column`).
 
-# Importi in formato italiano: 1.234,56 / 12,00 / -45,90 / 1.234,56- (segno in coda)
-_AMOUNT_RE = re.compile(r"[-+]?(?:\d{1,3}(?:\.\d{3})+|\d+),\d{2}-?")
-# Date: 01/02/2026, 01-02-26, 01.02.2026
-_DATE_RE = re.compile(r"\b(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})\b")
-# Data a inizio riga: segnala l'inizio di un nuovo movimento.
-_DATE_START_RE = re.compile(r"^\s*\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}\b")
 # Cap di righe accumulabili in un singolo movimento multi-riga (anti-runaway).
 _MAX_RECORD_LINES = 8
 # Righe che NON sono movimenti (intestazioni, riepiloghi, piè di pagina...)
@@ -780,39 +1236,6 @@ _SKIP_HINTS = (
 )
 
 
-def _parse_italian_amount(token: str) -> Optional[Decimal]:
-    """"1.234,56" / "-45,90" / "12,00-" -> Decimal. None se non parsabile."""
-    t = token.strip()
-    negative = False
-    if t.endswith("-"):
-        negative = True
-        t = t[:-1]
-    if t.startswith("-"):
-        negative = True
-        t = t[1:]
-    elif t.startswith("+"):
-        t = t[1:]
-    t = t.replace(".", "").replace(",", ".")
-    try:
-        value = Decimal(t)
-    except InvalidOperation:
-        return None
-    return -value if negative else value
-
-
-def _parse_statement_date(day: str, month: str, year: str) -> Optional[date]:
-    try:
-        d, m, y = int(day), int(month), int(year)
-    except ValueError:
-        return None
-    if y < 100:
-        y += 2000
-    try:
-        return date(y, m, d)
-    except ValueError:
-        return None
-
-
 def _record_to_movimento(
     text: str,
     data_da: Optional[date],
@@ -821,15 +1244,15 @@ def _record_to_movimento(
 ) -> Optional[dict]:
     """Trasforma il testo di UN movimento (anche accorpato da più righe) in un
     candidato proposta. None se non contiene data+importo validi."""
-    date_match = _DATE_RE.search(text)
+    date_match = DATE_RE.search(text)
     if not date_match:
         return None
-    data = _parse_statement_date(*date_match.groups())
+    data = parse_date_token(date_match.group(0))
     if data is None:
         return None
 
-    amount_tokens = _AMOUNT_RE.findall(text)
-    parsed_amounts = [(_parse_italian_amount(tok), tok) for tok in amount_tokens]
+    amount_tokens = AMOUNT_RE.findall(text)
+    parsed_amounts = [(parse_italian_amount(tok), tok) for tok in amount_tokens]
     parsed_amounts = [(v, tok) for v, tok in parsed_amounts if v is not None]
     if not parsed_amounts:
         return None
@@ -856,12 +1279,11 @@ def _record_to_movimento(
     if not descrizione:
         descrizione = text[date_match.end() :].strip(" \t-–—.€")
     # Se in testa resta una seconda data (la "valuta"), la togliamo.
-    lead_date = _DATE_RE.match(descrizione)
+    lead_date = DATE_RE.match(descrizione)
     if lead_date:
         descrizione = descrizione[lead_date.end() :].strip(" \t-–—.€")
     # Toglie una valuta rimasta in coda (es. "... Altre uscite €" / "EUR").
-    descrizione = re.sub(r"\s*(?:€|eur|usd)\s*$", "", descrizione, flags=re.IGNORECASE)
-    descrizione = re.sub(r"\s+", " ", descrizione).strip()
+    descrizione = clean_description(descrizione)
 
     return {
         "provider": "PDF",
@@ -873,13 +1295,14 @@ def _record_to_movimento(
     }
 
 
-def parse_statement_text(
-    text: str,
+def iter_statement_movimenti(
+    lines: Iterable[str],
     data_da: Optional[date] = None,
     data_a: Optional[date] = None,
     balance_column: bool = False,
-) -> list[dict]:
-    """Estrae i movimenti dal testo grezzo di un estratto conto.
+    skip_hints: tuple[str, ...] = _SKIP_HINTS,
+) -> Iterator[dict]:
+    """Estrae i movimenti da un flusso di righe di un estratto conto.
 
     Un movimento INIZIA a una riga che parte con una data e si chiude quando
     incontra un importo in formato italiano, anche parecchie righe più sotto:
@@ -888,70 +1311,118 @@ def parse_statement_text(
     in "record" invece di trattarle una per una. Il tipo si deduce dal segno
     dell'importo (negativo -> USCITA, positivo -> ENTRATA).
 
-    Funzione pura (nessun I/O): testabile con testo di esempio senza PDF.
+    Le righe vengono consumate una alla volta e ogni movimento è restituito
+    appena il suo record si chiude: alimentato pagina per pagina (vedi
+    `iter_pdf_lines`) non tiene mai in memoria l'intero documento, e le prime
+    proposte sono disponibili prima che l'estrazione finisca.
     """
-    movimenti: list[dict] = []
     buffer: list[str] = []
 
-    def flush_if_complete() -> bool:
-        nonlocal buffer
-        joined = " ".join(buffer)
-        if _AMOUNT_RE.search(joined):
-            mov = _record_to_movimento(joined, data_da, data_a, balance_column)
-            if mov:
-                movimenti.append(mov)
-            buffer = []
-            return True
-        return False
-
-    for raw_line in text.splitlines():
+    for raw_line in lines:
         line = raw_line.strip()
         if not line:
             continue
-        low = line.lower()
-        is_date_start = _DATE_START_RE.match(line) is not None
+        is_date_start = DATE_START_RE.match(line) is not None
 
         # Righe di intestazione/riepilogo (saldo, totale...) ignorate SOLO se non
         # stiamo già componendo un movimento multi-riga.
-        if not buffer and not is_date_start and any(h in low for h in _SKIP_HINTS):
-            continue
+        if not buffer and not is_date_start:
+            low = line.lower()
+            if any(h in low for h in skip_hints):
+                continue
 
         if is_date_start:
             # Nuovo movimento: se in buffer c'era un record non chiuso, era
             # rumore d'intestazione (nessun importo) e viene scartato.
             buffer = [line]
-            flush_if_complete()  # se la riga contiene già l'importo, chiude subito
         elif buffer:
             buffer.append(line)
-            if not flush_if_complete() and len(buffer) > _MAX_RECORD_LINES:
-                buffer = []
-        # else: fuori da un movimento -> riga ignorata
+        else:
+            continue  # fuori da un movimento -> riga ignorata
+
+        # Le righe già in buffer non contenevano importi (altrimenti il record
+        # sarebbe già chiuso): basta cercarlo nella riga nuova. Senza virgola
+        # non può esserci un importo italiano, e la regex non serve.
+        if "," in line and AMOUNT_RE.search(line):
+            # Record chiuso (se la riga di data contiene già l'importo, subito).
+            joined = " ".join(buffer)
+            buffer = []
+            mov = _record_to_movimento(joined, data_da, data_a, balance_column)
+            if mov:
+                yield mov
+        elif len(buffer) > _MAX_RECORD_LINES:
+            buffer = []
 
-    return movimenti
 
+def parse_statement_text(
+    text: str,
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+    balance_column: bool = False,
+) -> list[dict]:
+    """Estrae i movimenti dal testo grezzo di un estratto conto.
 
-def extract_pdf_text(file_bytes: bytes) -> str:
-    """Estrae tutto il testo da un PDF (import locale via pdfplumber)."""
+    Funzione pura (nessun I/O): testabile con testo di esempio senza PDF. Le
+    regole di accorpamento sono quelle di `iter_statement_movimenti`.
+    """
+    return list(
+        iter_statement_movimenti(
+            text.splitlines(),
+            data_da=data_da,
+            data_a=data_a,
+            balance_column=balance_column,
+        )
+    )
+
+
+def _as_binary_stream(file: bytes | BinaryIO) -> BinaryIO:
+    return io.BytesIO(file) if isinstance(file, (bytes, bytearray)) else file
+
+
+def iter_pdf_pages(file: bytes | BinaryIO) -> Iterator[str]:
+    """Testo di un PDF, una pagina alla volta (import locale via pdfplumber).
+
+    Dopo l'estrazione la cache di layout della pagina viene liberata: in memoria
+    resta al più il testo di una pagina, non quello dell'intero estratto.
+    """
     import pdfplumber
 
-    parts: list[str] = []
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+    with pdfplumber.open(_as_binary_stream(file)) as pdf:
         for page in pdf.pages:
-            parts.append(page.extract_text() or "")
-    return "\n".join(parts)
+            text = page.extract_text() or ""
+            page.close()
+            yield text
 
 
-def parse_bank_statement_pdf(
-    file_bytes: bytes,
-    data_da: Optional[date] = None,
-    data_a: Optional[date] = None,
-    balance_column: bool = False,
-) -> list[dict]:
-    """PDF (bytes) -> lista di candidati proposta {provider, tipo, data, importo, descrizione}."""
-    text = extract_pdf_text(file_bytes)
-    return parse_statement_text(
-        text, data_da=data_da, data_a=data_a, balance_column=balance_column
+def _open_pdf_statement(
+    file: bytes | BinaryIO,
+    cached: Optional[dict],
+    data_da: Optional[date],
+    data_a: Optional[date],
+    balance_column: Optional[bool],
+) -> tuple[dict, Iterator[dict]]:
+    pages = iter_pdf_pages(file)
+    first_page = next(pages, "")
+    # Il profilo salvato vale solo se la prima pagina è ancora della sua banca
+    if cached is not None and match_pdf_profile(first_page, cached):
+        profile = cached
+    else:
+        profile = detect_pdf_profile(first_page)
+    # Scelta esplicita dell'utente: vince sul profilo e viene ricordata.
+    if balance_column is not None and balance_column != profile["balance_column"]:
+        profile = {**profile, "balance_column": balance_column}
+
+    lines = chain.from_iterable(
+        page.splitlines() for page in chain([first_page], pages)
     )
+    movimenti = iter_statement_movimenti(
+        lines,
+        data_da=data_da,
+        data_a=data_a,
+        balance_column=profile["balance_column"],
+        skip_hints=_SKIP_HINTS + tuple(profile["skip_hints"]),
+    )
+    return profile, movimenti
 
 
 # --- Import estratto conto Excel/CSV -> proposte -----------------------------
@@ -964,41 +1435,9 @@ def parse_bank_statement_pdf(
 _COL_DESCR = ("operazione", "descrizione", "causale", "dettaglio")
 _COL_ENTRATE = ("entrate", "accrediti", "avere")
 _COL_USCITE = ("uscite", "addebiti", "dare")
-
-
-def _coerce_date(value) -> Optional[date]:
-    """Cella -> date. Gestisce datetime/date nativi (Excel) e stringhe."""
-    if value is None:
-        return None
-    if isinstance(value, datetime):
-        return value.date()
-    if isinstance(value, date):
-        return value
-    match = _DATE_RE.search(str(value))
-    if match:
-        return _parse_statement_date(*match.groups())
-    return None
-
-
-def _coerce_amount(value) -> Optional[Decimal]:
-    """Cella -> Decimal. Gestisce numeri nativi (Excel) e stringhe italiane."""
-    if value is None or value == "":
-        return None
-    if isinstance(value, (int, float)):
-        try:
-            return Decimal(str(value))
-        except InvalidOperation:
-            return None
-    text = str(value)
-    match = _AMOUNT_RE.search(text)
-    if match:
-        return _parse_italian_amount(match.group(0))
-    # Fallback: formato con punto decimale (es. "-30.00") o solo cifre.
-    cleaned = text.strip().replace("€", "").replace(" ", "")
-    try:
-        return Decimal(cleaned)
-    except InvalidOperation:
-        return None
+# L'intestazione si cerca solo nelle prime righe (sopra ci sono al più titolo,
+# intestatario e IBAN): il resto del file viene letto in streaming.
+_HEADER_SCAN_ROWS = 50
 
 
 def _cell(row: list, idx: Optional[int]):
@@ -1010,7 +1449,7 @@ def _cell(row: list, idx: Optional[int]):
 def _detect_columns(header: list) -> Optional[dict]:
     """Dato l'elenco delle intestazioni, ritorna gli indici di data/descrizione/
     importo (o entrate+uscite). None se la riga non è un'intestazione valida."""
-    norm = [str(c or "").strip().lower() for c in header]
+    norm = normalize_header(header)
     cols = {
         "date": None,
         "descr": None,
@@ -1039,39 +1478,64 @@ def _detect_columns(header: list) -> Optional[dict]:
     return cols
 
 
-def parse_statement_rows(
-    rows: list,
-    provider: str = "IMPORT",
-    data_da: Optional[date] = None,
-    data_a: Optional[date] = None,
-) -> list[dict]:
-    """Righe (liste di celle grezze) -> movimenti. Trova l'intestazione dai nomi
-    delle colonne e mappa data / importo / descrizione. Formato-agnostico."""
-    header_idx = None
-    cols = None
-    for i, row in enumerate(rows):
-        detected = _detect_columns(row)
-        if detected:
-            header_idx, cols = i, detected
-            break
-    if cols is None:
-        return []
+def _find_statement_header(
+    rows: Iterator[list], cached: Optional[dict]
+) -> tuple[Optional[dict], Optional[dict], Iterator[list]]:
+    """Cerca l'intestazione tra le prime `_HEADER_SCAN_ROWS` righe.
 
-    movimenti: list[dict] = []
-    for row in rows[header_idx + 1 :]:
+    Ritorna (profilo, indici delle colonne, righe successive all'intestazione).
+    Il profilo salvato sul conto si prova per primo: se combacia il rilevamento
+    è saltato. Poi i profili registrati e infine l'euristica a parole chiave, da
+    cui si ricava un profilo da ricordare per i prossimi import.
+    """
+    prefix = list(islice(rows, _HEADER_SCAN_ROWS))
+    headers = [normalize_header(row) for row in prefix]
+
+    def rest(i: int) -> Iterator[list]:
+        return chain(prefix[i + 1 :], rows)
+
+    if cached is not None:
+        for i, header in enumerate(headers):
+            cols = match_spreadsheet_profile(header, cached)
+            if cols is not None:
+                return cached, cols, rest(i)
+    for i, header in enumerate(headers):
+        detected = detect_spreadsheet_profile(header)
+        if detected is not None:
+            profile, cols = detected
+            return profile, cols, rest(i)
+        cols = _detect_columns(header)
+        if cols is not None:
+            return learn_spreadsheet_profile(header, cols), cols, rest(i)
+    return None, None, iter(())
+
+
+def _iter_profile_rows(
+    rows: Iterable[list],
+    cols: dict,
+    date_format: Optional[str],
+    provider: str,
+    data_da: Optional[date],
+    data_a: Optional[date],
+) -> Iterator[dict]:
+    """Righe dopo l'intestazione -> movimenti, con le colonne già risolte."""
+    i_date, i_descr = cols["date"], cols["descr"]
+    i_amount, i_entrate, i_uscite = cols["amount"], cols["entrate"], cols["uscite"]
+
+    for row in rows:
         if not any(c not in (None, "") for c in row):
             continue  # riga vuota
 
-        data = _coerce_date(_cell(row, cols["date"]))
+        data = coerce_date(_cell(row, i_date), date_format)
         if data is None:
             continue
 
         importo_val = None
-        if cols["amount"] is not None:
-            importo_val = _coerce_amount(_cell(row, cols["amount"]))
+        if i_amount is not None:
+            importo_val = coerce_amount(_cell(row, i_amount))
         if importo_val is None:
-            entrata = _coerce_amount(_cell(row, cols["entrate"]))
-            uscita = _coerce_amount(_cell(row, cols["uscite"]))
+            entrata = coerce_amount(_cell(row, i_entrate))
+            uscita = coerce_amount(_cell(row, i_uscite))
             if entrata:
                 importo_val = abs(entrata)
             elif uscita:
@@ -1085,63 +1549,117 @@ def parse_statement_rows(
         if (data_da and data < data_da) or (data_a and data > data_a):
             continue
 
-        descr_val = _cell(row, cols["descr"])
-        descrizione = re.sub(r"\s+", " ", str(descr_val or "")).strip()
+        descrizione = normalize_spaces(str(_cell(row, i_descr) or ""))
+
+        yield {
+            "provider": provider,
+            "external_id": None,
+            "tipo": "USCITA" if importo_val < 0 else "ENTRATA",
+            "data": data,
+            "importo": importo,
+            "descrizione": descrizione or None,
+        }
 
-        movimenti.append(
-            {
-                "provider": provider,
-                "external_id": None,
-                "tipo": "USCITA" if importo_val < 0 else "ENTRATA",
-                "data": data,
-                "importo": importo,
-                "descrizione": descrizione or None,
-            }
-        )
 
-    return movimenti
+def iter_statement_rows(
+    rows: Iterable[list],
+    provider: str = "IMPORT",
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+) -> Iterator[dict]:
+    """Righe (liste di celle grezze) -> movimenti. Trova l'intestazione dai nomi
+    delle colonne e mappa data / importo / descrizione. Formato-agnostico.
 
+    Le righe sono consumate in streaming: l'intestazione si cerca solo tra le
+    prime `_HEADER_SCAN_ROWS` e le righe successive diventano candidati una alla
+    volta, quindi la memoria non cresce con la lunghezza dell'export.
+    """
+    profile, cols, rest = _find_statement_header(iter(rows), None)
+    if profile is None:
+        return iter(())
+    return _iter_profile_rows(
+        rest, cols, profile["date_format"], provider, data_da, data_a
+    )
 
-def _read_xlsx_rows(file_bytes: bytes) -> list:
+
+def parse_statement_rows(
+    rows: Iterable[list],
+    provider: str = "IMPORT",
+    data_da: Optional[date] = None,
+    data_a: Optional[date] = None,
+) -> list[dict]:
+    """Versione a lista di `iter_statement_rows` (comoda nei test)."""
+    return list(
+        iter_statement_rows(rows, provider=provider, data_da=data_da, data_a=data_a)
+    )
+
+
+def _iter_xlsx_rows(file: bytes | BinaryIO) -> Iterator[list]:
     import openpyxl
 
+    # read_only: openpyxl legge il foglio in streaming invece di caricarlo tutto.
     wb = openpyxl.load_workbook(
-        io.BytesIO(file_bytes), read_only=True, data_only=True
+        _as_binary_stream(file), read_only=True, data_only=True
     )
     try:
         ws = wb.active
-        return [list(r) for r in ws.iter_rows(values_only=True)]
+        for r in ws.iter_rows(values_only=True):
+            yield list(r)
     finally:
         wb.close()
 
 
-def _read_csv_rows(file_bytes: bytes) -> list:
+def _iter_csv_rows(file: bytes | BinaryIO) -> Iterator[list]:
     import csv
 
-    text = file_bytes.decode("utf-8-sig", errors="replace")
-    sample = text[:4096]
-    # Le banche italiane usano spesso ';' (la ',' è il separatore decimale).
-    delimiter = ";" if sample.count(";") >= sample.count(",") else ","
-    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
-    return [list(r) for r in reader]
+    text = io.TextIOWrapper(
+        _as_binary_stream(file), encoding="utf-8-sig", errors="replace", newline=""
+    )
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        # Le banche italiane usano spesso ';' (la ',' è il separatore decimale).
+        delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+        yield from csv.reader(text, delimiter=delimiter)
+    finally:
+        # Lo stream sottostante appartiene al chiamante: non chiuderlo con il wrapper.
+        text.detach()
 
 
-def parse_bank_statement_spreadsheet(
-    file_bytes: bytes,
+def open_bank_statement(
+    file: bytes | BinaryIO,
     filename: str,
+    profiles: Optional[dict] = None,
     data_da: Optional[date] = None,
     data_a: Optional[date] = None,
-) -> list[dict]:
-    """Excel (.xlsx) o CSV (bytes) -> lista di candidati proposta."""
+    balance_column: Optional[bool] = None,
+) -> tuple[Optional[dict], Iterator[dict]]:
+    """Apre un estratto conto (PDF, Excel .xlsx o CSV; bytes o file binario).
+
+    `profiles` è la cache del conto (`Conto.statement_profiles`, tipo -> profilo).
+    Ritorna (profilo usato, candidati proposta in streaming): il riconoscimento
+    del layout legge solo l'inizio del file (prima pagina / prime righe), il
+    resto viene parsato man mano che i movimenti sono consumati. Il profilo è
+    None se nel foglio non c'è un'intestazione riconoscibile.
+    """
     name = (filename or "").lower()
+    profiles = profiles or {}
+    if name.endswith(".pdf"):
+        return _open_pdf_statement(
+            file, profiles.get(PDF), data_da, data_a, balance_column
+        )
+
     if name.endswith(".csv"):
-        rows = _read_csv_rows(file_bytes)
+        rows = _iter_csv_rows(file)
         provider = "CSV"
     else:
-        rows = _read_xlsx_rows(file_bytes)
+        rows = _iter_xlsx_rows(file)
         provider = "EXCEL"
-    return parse_statement_rows(
-        rows, provider=provider, data_da=data_da, data_a=data_a
+    profile, cols, rest = _find_statement_header(rows, profiles.get(SPREADSHEET))
+    if profile is None:
+        return None, iter(())
+    return profile, _iter_profile_rows(
+        rest, cols, profile["date_format"], provider, data_da, data_a
     )
 
 
@@ -1226,3 +1744,63 @@ def apply_filters_and_sort(query: Query, model, filters):
         query = query.order_by(desc(model.id))
 
     return query
+
+
+def _escape_like(term: str) -> str:
+    """`term` per un pattern LIKE, con `%`, `_` e `\\` presi alla lettera."""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Caratteri non vuoti minimi di un termine di ricerca: con meno di tre pg_trgm
+# non estrae trigrammi, e l'ILIKE scorrerebbe tutte le transazioni dell'utente.
+RICERCA_MIN_CARATTERI = 3
+
+
+def build_transazioni_search_query(
+    user_id: int, term: str, dialect_name: str, limit: int = 20
+) -> Select:
+    """Query di ricerca nelle descrizioni, dalla transazione più pertinente.
+
+    Su Postgres sfrutta pg_trgm (indice GIN `ix_transazioni_descrizione_trgm`):
+    trova le sottostringhe (ILIKE, servito dall'indice) e anche le parole scritte
+    in modo simile (`<%`, es. "amazn" -> "AMAZON"), in ordine di
+    `word_similarity`. Altrove (SQLite nei test) ripiega su ILIKE e mette prima
+    le descrizioni che iniziano col termine. A parità, le più recenti.
+
+    Un termine con meno di RICERCA_MIN_CARATTERI caratteri non vuoti è un
+    ValueError: un termine vuoto troverebbe tutto.
+    """
+    term = normalize_spaces(term)
+    if len(term.replace(" ", "")) < RICERCA_MIN_CARATTERI:
+        raise ValueError(
+            f"Search term must have at least {RICERCA_MIN_CARATTERI} "
+            "non-blank characters"
+        )
+    descrizione = models.Transazione.descrizione
+    escaped = _escape_like(term)
+    contains = descrizione.ilike(f"%{escaped}%", escape="\\")
+
+    query = select(models.Transazione).where(
+        models.Transazione.user_id == user_id,
+        models.Transazione.deleted_at.is_(None),
+    )
+    if dialect_name == "postgresql":
+        query = query.where(
+            or_(contains, literal(term).op("<%")(descrizione))
+        ).order_by(desc(func.word_similarity(term, descrizione)))
+    else:
+        starts_with = descrizione.ilike(f"{escaped}%", escape="\\")
+        query = query.where(contains).order_by(case((starts_with, 0), else_=1))
+
+    return query.order_by(
+        desc(models.Transazione.data), desc(models.Transazione.id)
+    ).limit(limit)
+
+
+def search_transazioni(
+    db: Session, user_id: int, term: str, limit: int = 20
+) -> list[models.Transazione]:
+    query = build_transazioni_search_query(
+        user_id, term, db.get_bind().dialect.name, limit
+    )
+    return list(db.scalars(query))
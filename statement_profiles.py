@@ -0,0 +1,131 @@
+"""Registro dei layout di estratto conto per banca (profili).
+
+Un profilo descrive come leggere l'export di una banca senza euristiche:
+
+- fogli di calcolo (`kind="SPREADSHEET"`): il nome normalizzato della colonna per
+  ogni ruolo (`date`, `descr`, `amount` oppure `entrate`/`uscite`) e, se le date
+  sono stringhe, il loro formato `strptime`;
+- PDF (`kind="PDF"`): i marcatori testuali della prima pagina che identificano la
+  banca, se l'ultima colonna è il saldo progressivo e le righe extra da ignorare.
+
+Il profilo riconosciuto (o, per i fogli, quello "imparato" dall'euristica
+generica) viene salvato sul conto (`Conto.statement_profiles`): agli import
+successivi si parte da lì e il rilevamento viene saltato, purché il file combaci
+col profilo salvato (intestazione per i fogli, marcatori per il PDF). Se non
+combacia (la banca ha cambiato layout, un estratto di un'altra banca) si rileva
+di nuovo e il nuovo profilo prende il posto di quello salvato.
+
+I profili sono dict semplici (serializzabili in JSON così come sono): aggiungere
+una banca vuol dire aggiungere una voce a `STATEMENT_PROFILES`.
+"""
+
+from typing import Optional
+
+SPREADSHEET = "SPREADSHEET"
+PDF = "PDF"
+
+# Profilo di ripiego per il PDF: l'euristica generica del parser.
+GENERIC_PDF = "GENERIC_PDF"
+# Chiave dei profili per fogli di calcolo ricavati dall'euristica a parole chiave.
+LEARNED_SPREADSHEET = "LEARNED"
+
+_ROLES = ("date", "descr", "amount", "entrate", "uscite")
+
+STATEMENT_PROFILES: dict[str, dict] = {
+    GENERIC_PDF: {
+        "key": GENERIC_PDF,
+        "kind": PDF,
+        "markers": [],
+        "balance_column": False,
+        "skip_hints": [],
+    },
+    "ISYBANK": {
+        # Celle (categoria, descrizione) mandate a capo su più righe: il parser
+        # a record multi-riga le gestisce già, serve solo riconoscerla.
+        "key": "ISYBANK",
+        "kind": PDF,
+        "markers": ["isybank"],
+        "balance_column": False,
+        "skip_hints": [],
+    },
+    "FINECO_XLSX": {
+        "key": "FINECO_XLSX",
+        "kind": SPREADSHEET,
+        "columns": {
+            "date": "data",
+            "descr": "descrizione_completa",
+            "entrate": "entrate",
+            "uscite": "uscite",
+        },
+        "date_format": "%d/%m/%Y",
+    },
+    "INTESA_XLSX": {
+        "key": "INTESA_XLSX",
+        "kind": SPREADSHEET,
+        "columns": {
+            "date": "data",
+            "descr": "operazione",
+            "amount": "importo",
+        },
+        "date_format": None,
+    },
+}
+
+
+def normalize_header(row: list) -> list[str]:
+    return [str(c or "").strip().lower() for c in row]
+
+
+def match_spreadsheet_profile(header: list[str], profile: dict) -> Optional[dict]:
+    """Indici delle colonne se `header` (già normalizzato) è l'intestazione del
+    profilo, altrimenti None. Servono TUTTE le colonne dichiarate dal profilo."""
+    cols = dict.fromkeys(_ROLES)
+    for role, name in profile["columns"].items():
+        if name is None:
+            continue
+        try:
+            cols[role] = header.index(name)
+        except ValueError:
+            return None
+    return cols
+
+
+def detect_spreadsheet_profile(header: list[str]) -> Optional[tuple[dict, dict]]:
+    """(profilo, indici) del primo profilo registrato che riconosce `header`."""
+    for profile in STATEMENT_PROFILES.values():
+        if profile["kind"] != SPREADSHEET:
+            continue
+        cols = match_spreadsheet_profile(header, profile)
+        if cols is not None:
+            return profile, cols
+    return None
+
+
+def learn_spreadsheet_profile(header: list[str], cols: dict) -> dict:
+    """Profilo ricavato dalle colonne trovate dall'euristica: i nomi delle colonne
+    sostituiscono gli indici, così il profilo vale anche se l'ordine cambia."""
+    return {
+        "key": LEARNED_SPREADSHEET,
+        "kind": SPREADSHEET,
+        "columns": {role: header[idx] for role, idx in cols.items() if idx is not None},
+        "date_format": None,
+    }
+
+
+def match_pdf_profile(first_page: str, profile: dict) -> bool:
+    """Se la prima pagina è della banca del profilo: ne contiene un marcatore o,
+    per un profilo senza marcatori, nessun profilo registrato la riconosce."""
+    if profile["markers"]:
+        low = first_page.lower()
+        return any(marker in low for marker in profile["markers"])
+    return detect_pdf_profile(first_page)["key"] == profile["key"]
+
+
+def detect_pdf_profile(first_page: str) -> dict:
+    """Profilo PDF dai marcatori della prima pagina; generico se nessuno combacia."""
+    low = first_page.lower()
+    for profile in STATEMENT_PROFILES.values():
+        if profile["kind"] == PDF and profile["markers"]:
+            if any(marker in low for marker in profile["markers"]):
+                return profile
+    return STATEMENT_PROFILES[GENERIC_PDF]
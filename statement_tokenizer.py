@@ -0,0 +1,124 @@
+"""Tokenizzazione di importi e date in formato italiano per i parser degli estratti conto.
+
+Le funzioni qui sono chiamate una volta per cella o per movimento, quindi decine
+di migliaia di volte per ogni estratto: i pattern sono compilati una sola volta a
+livello di modulo, le conversioni evitano catene di `replace`/`re.sub`, e le date
+(che in un estratto si ripetono di continuo) passano da una cache.
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Optional
+
+# Importi in formato italiano: 1.234,56 / 12,00 / -45,90 / 1.234,56- (segno in coda)
+AMOUNT_RE = re.compile(r"[-+]?(?:\d{1,3}(?:\.\d{3})+|\d+),\d{2}-?")
+# Stesso formato, a pezzi: segno, parte intera, decimali, segno in coda.
+_AMOUNT_PARTS_RE = re.compile(r"\s*([-+]?)(\d{1,3}(?:\.\d{3})+|\d+),(\d{2})(-?)\s*")
+# Date: 01/02/2026, 01-02-26, 01.02.2026
+DATE_RE = re.compile(r"\b(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})\b")
+# Data a inizio riga: segnala l'inizio di un nuovo movimento.
+DATE_START_RE = re.compile(r"^\s*\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}\b")
+# Valuta rimasta in coda alla descrizione (es. "... Altre uscite €" / "EUR").
+_TRAILING_CURRENCY_RE = re.compile(r"\s*(?:€|eur|usd)\s*$", re.IGNORECASE)
+_CURRENCY_CODES = ("eur", "usd")
+# Fallback per importi con il punto decimale (es. "-30.00"): via € e spazi.
+_AMOUNT_NOISE = str.maketrans("", "", "€ ")
+
+
+def parse_italian_amount(token: str) -> Optional[Decimal]:
+    """ "1.234,56" / "-45,90" / "12,00-" -> Decimal. None se non parsabile."""
+    match = _AMOUNT_PARTS_RE.fullmatch(token)
+    if match is None:
+        return None
+    sign, intero, decimali, trailing = match.groups()
+    negative = sign == "-" or trailing == "-"
+    return Decimal(f"{'-' if negative else ''}{intero.replace('.', '')}.{decimali}")
+
+
+def parse_date_parts(day: str, month: str, year: str) -> Optional[date]:
+    try:
+        d, m, y = int(day), int(month), int(year)
+    except ValueError:
+        return None
+    if y < 100:
+        y += 2000
+    try:
+        return date(y, m, d)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def parse_date_token(token: str) -> Optional[date]:
+    """Prima data trovata in `token` (es. "01/02/2026"). Memoizzata: in un estratto
+    le stesse poche centinaia di date ricorrono su migliaia di righe."""
+    match = DATE_RE.search(token)
+    if match is None:
+        return None
+    return parse_date_parts(*match.groups())
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_format(token: str, date_format: str) -> Optional[date]:
+    try:
+        return datetime.strptime(token, date_format).date()
+    except ValueError:
+        return None
+
+
+def coerce_date(value, date_format: Optional[str] = None) -> Optional[date]:
+    """Cella -> date. Gestisce datetime/date nativi (Excel) e stringhe.
+
+    Con `date_format` (noto dal profilo della banca) la stringa è letta con quel
+    formato; se non combacia si ripiega sulla ricerca generica.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    token = str(value)
+    if date_format:
+        parsed = _parse_date_format(token.strip(), date_format)
+        if parsed is not None:
+            return parsed
+    return parse_date_token(token)
+
+
+def coerce_amount(value) -> Optional[Decimal]:
+    """Cella -> Decimal. Gestisce numeri nativi (Excel) e stringhe italiane."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        try:
+            return Decimal(str(value))
+        except InvalidOperation:
+            return None
+    text = str(value)
+    parsed = parse_italian_amount(text)
+    if parsed is not None:
+        return parsed
+    match = AMOUNT_RE.search(text)
+    if match:
+        return parse_italian_amount(match.group(0))
+    # Fallback: formato con punto decimale (es. "-30.00") o solo cifre.
+    try:
+        return Decimal(text.translate(_AMOUNT_NOISE))
+    except InvalidOperation:
+        return None
+
+
+def normalize_spaces(text: str) -> str:
+    """Spazi multipli, tab e a capo -> un solo spazio, senza spazi ai bordi."""
+    return " ".join(text.split())
+
+
+def clean_description(text: str) -> str:
+    """Toglie la valuta in coda e normalizza gli spazi."""
+    tail = text.rstrip()[-3:].lower()
+    if tail.endswith("€") or tail in _CURRENCY_CODES:
+        text = _TRAILING_CURRENCY_RE.sub("", text)
+    return normalize_spaces(text)
@@ -3,15 +3,30 @@
 Usa un DB SQLite in-memory ricreato per ogni test: veloce e isolato, senza
 toccare il Postgres di sviluppo. I modelli non usano tipi PG-specifici né
 `server_default`, quindi `create_all` gira pulito su SQLite.
+
+Quello che SQLite non sa dire (piani con gli indici parziali e GIN, `FOR
+UPDATE`, `ON CONFLICT` e advisory lock sotto concorrenza) si verifica con
+`pg_engine`: un Postgres vero, con lo schema dei modelli. È opzionale e i test che lo
+usano (marcati `postgres`) vengono saltati se non c'è.
 """
 
+import glob
+import os
+import shutil
+import socket
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from database import Base
 import models  # noqa: F401 — l'import registra i modelli su Base.metadata
+from instrumentation import misura_query
 
 
 @pytest.fixture()
@@ -32,3 +47,114 @@ def db_session():
         session.close()
         Base.metadata.drop_all(engine)
         engine.dispose()
+
+
+@pytest.fixture()
+def max_queries():
+    """Fallisce se il blocco esegue più di `limite` statement SQL.
+
+        with max_queries(3):
+            get_forecast(months=12, db=db_session, current_user_id=user.id)
+
+    Un N+1 (lazy load in un ciclo) fa crescere il conteggio coi dati: il limite
+    va scelto con più righe di quante ne servano a una query sola.
+    """
+
+    @contextmanager
+    def verifica(limite: int):
+        with misura_query() as stats:
+            yield stats
+        assert stats.query <= limite, (
+            f"{stats.query} query eseguite, massimo {limite}; "
+            f"la più lenta: {stats.piu_lenta_sql}"
+        )
+
+    return verifica
+
+
+# --- Postgres vero (opzionale) -----------------------------------------------
+# Con `TEST_POSTGRES_URL` si usa quel database, che deve essere vuoto e usa e
+# getta (lo schema viene ricreato e a ogni test si svuotano le tabelle).
+# Altrimenti, se trova initdb e pg_ctl (in `PG_BIN`, nel PATH o in
+# /usr/lib/postgresql/*/bin), avvia un server temporaneo in una cartella della
+# sessione di test, senza fsync, e lo ferma alla fine. Postgres non parte come
+# root: in quel caso i test vengono saltati.
+
+def _bin_postgres() -> Optional[Path]:
+    candidati = [os.getenv("PG_BIN")] if os.getenv("PG_BIN") else []
+    if shutil.which("initdb"):
+        candidati.append(str(Path(shutil.which("initdb")).parent))
+    candidati += sorted(glob.glob("/usr/lib/postgresql/*/bin"), reverse=True)
+    for cartella in map(Path, candidati):
+        if (cartella / "initdb").exists() and (cartella / "pg_ctl").exists():
+            return cartella
+    return None
+
+
+def _porta_libera() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def _postgres_url(tmp_path_factory):
+    url = os.getenv("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    cartella_bin = _bin_postgres()
+    if cartella_bin is None:
+        pytest.skip("Postgres non trovato (PG_BIN, PATH o TEST_POSTGRES_URL)")
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        pytest.skip("Postgres non si avvia come root: usare TEST_POSTGRES_URL")
+
+    cartella = tmp_path_factory.mktemp("postgres")
+    dati = cartella / "dati"
+    subprocess.run(
+        [cartella_bin / "initdb", "-D", dati, "-U", "postgres", "-A", "trust"]
+        + ["-E", "UTF8", "--no-sync"],
+        check=True,
+        capture_output=True,
+    )
+    porta = _porta_libera()
+    opzioni = (
+        f"-p {porta} -k {cartella} -c listen_addresses=localhost "
+        "-c fsync=off -c synchronous_commit=off -c full_page_writes=off"
+    )
+    pg_ctl = [cartella_bin / "pg_ctl", "-D", dati]
+    subprocess.run(
+        pg_ctl + ["-l", cartella / "postgres.log", "-o", opzioni, "-w", "start"],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        yield f"postgresql://postgres@localhost:{porta}/postgres"
+    finally:
+        subprocess.run(pg_ctl + ["-m", "immediate", "stop"], capture_output=True)
+
+
+@pytest.fixture(scope="session")
+def _pg_schema(_postgres_url):
+    # Lo schema viene dai modelli, che dichiarano anche gli indici parziali e
+    # GIN: la catena di migrazioni non parte da un DB vuoto (a1b2c3d4e5f6 e
+    # 4a9299ada80f creano entrambe bank_transaction_proposals).
+    engine = create_engine(_postgres_url, pool_size=10, max_overflow=10)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture()
+def pg_engine(_pg_schema):
+    """Engine su Postgres con lo schema dei modelli; i dati scritti dal test
+    vengono cancellati alla fine."""
+    yield _pg_schema
+    tabelle = ", ".join(t.name for t in Base.metadata.sorted_tables)
+    with _pg_schema.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tabelle} RESTART IDENTITY CASCADE"))
@@ -6,15 +6,23 @@ rinnovi l'access token senza credenziali, e che /login non riveli quali account
 esistono.
 """
 
+import asyncio
+import threading
+import time
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 import auth
+import passwords
 from database import Base, get_db
 from main import app
+from models import User
+from rate_limit import limiter
 
 
 @pytest.fixture()
@@ -125,3 +133,108 @@ def test_logout_invalida_la_sessione(client):
 
 def test_refresh_senza_cookie_rifiutato(client):
     assert client.post("/auth/refresh").status_code == 401
+
+
+def test_login_aggiorna_lhash_col_nuovo_costo(client, monkeypatch):
+    limiter.reset()
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 4)
+    _register(client)
+    db = next(app.dependency_overrides[get_db]())
+    assert db.query(User).one().hashed_password.startswith("$2b$04$")
+
+    # Il costo configurato sale: al login l'hash vecchio viene rifatto
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 5)
+    login = client.post("/login", data={"username": "mario", "password": "password123"})
+    assert login.status_code == 200
+    db.expire_all()
+    nuovo_hash = db.query(User).one().hashed_password
+    assert nuovo_hash.startswith("$2b$05$")
+    assert passwords.verify_password("password123", nuovo_hash)
+
+
+def test_registrazione_rifiuta_i_duplicati_senza_distinguere_maiuscole(client):
+    limiter.reset()
+    assert _register(client).status_code == 200
+
+    stessa_email = _register(client, username="luigi", email="Mario@Example.it")
+    stesso_username = _register(client, username="MARIO", email="altro@example.it")
+
+    assert stessa_email.status_code == stesso_username.status_code == 400
+    assert "email" in stessa_email.json()["detail"]
+    assert "username" in stesso_username.json()["detail"]
+
+
+def test_login_cerca_lutente_sugli_indici_lower(client):
+    limiter.reset()
+    _register(client)
+    engine = next(app.dependency_overrides[get_db]()).get_bind()
+    select_users = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement and "lower(" in statement:
+            select_users.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        login = client.post("/login", data={"username": "MARIO", "password": "password123"})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert login.status_code == 200
+    [(statement, parameters)] = select_users
+    with engine.connect() as conn:
+        piano = " ".join(
+            row[-1]
+            for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        )
+    assert "ux_users_username_lower" in piano
+    assert "ux_users_email_lower" in piano
+    assert "SCAN users" not in piano
+
+
+def test_raffica_di_login_non_blocca_le_altre_richieste(client, monkeypatch):
+    """Query lente (0.3 s l'una) durante una raffica di login: se girassero
+    nell'event loop, anche `/` aspetterebbe. Lo stesso per il controllo del rate
+    limit, che con `db://` è un upsert sincrono."""
+    limiter.reset()
+    engine = next(app.dependency_overrides[get_db]()).get_bind()
+    thread_limite = []
+    controllo = limiter._check_request_limit
+
+    def controllo_registrato(*args, **kwargs):
+        thread_limite.append(threading.current_thread())
+        return controllo(*args, **kwargs)
+
+    def query_lenta(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(0.3)
+
+    monkeypatch.setattr(limiter, "_check_request_limit", controllo_registrato)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as ac:
+
+            async def login(i):
+                return await ac.post(
+                    "/login", data={"username": f"nessuno{i}", "password": "x"}
+                )
+
+            async def root():
+                inizio = time.perf_counter()
+                await asyncio.sleep(0.1)  # a raffica già partita
+                risposta = await ac.get("/")
+                return risposta, time.perf_counter() - inizio
+
+            return await asyncio.gather(root(), *(login(i) for i in range(5)))
+
+    event.listen(engine, "before_cursor_execute", query_lenta)
+    try:
+        (risposta_root, attesa), *logins = asyncio.run(scenario())
+    finally:
+        event.remove(engine, "before_cursor_execute", query_lenta)
+
+    assert risposta_root.status_code == 200
+    assert attesa < 0.3
+    assert [r.status_code for r in logins] == [401] * 5
+    assert len(thread_limite) == 5
+    assert threading.main_thread() not in thread_limite
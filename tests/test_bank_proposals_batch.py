@@ -0,0 +1,188 @@
+"""Import in blocco delle proposte bancarie: tutte o nessuna, un solo delta di
+saldo per conto, e le stesse verifiche di proprietà dell'import singolo.
+
+Le funzioni endpoint sono chiamate direttamente (niente HTTP).
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from ledger import saldo_al
+from models import (
+    BankTransactionProposal,
+    Categoria,
+    Conto,
+    Transazione,
+    User,
+)
+from routers.bank_proposals import import_bank_transaction_proposals_batch_endpoint
+from schemas.bank_transaction import BankTransactionProposalBatchImport
+
+
+def _make_user(db, username, email):
+    user = User(username=username, email=email, hashed_password="x")
+    db.add(user)
+    db.flush()
+    return user
+
+
+def _proposal(db, user, conto, importo, tipo="USCITA"):
+    proposal = BankTransactionProposal(
+        user_id=user.id,
+        conto_id=conto.id,
+        provider="CSV",
+        tipo=tipo,
+        data=date(2026, 3, 1),
+        importo=Decimal(importo),
+        descrizione="dalla banca",
+        status="PENDING",
+    )
+    db.add(proposal)
+    db.flush()
+    return proposal
+
+
+def _batch(*items):
+    return BankTransactionProposalBatchImport(items=list(items))
+
+
+@pytest.fixture()
+def setup(db_session):
+    user = _make_user(db_session, "u", "u@example.it")
+    conto_a = Conto(nome="A", saldo=Decimal("100.00"), user_id=user.id)
+    conto_b = Conto(nome="B", saldo=Decimal("50.00"), user_id=user.id)
+    cat = Categoria(nome="Spesa", user_id=user.id)
+    db_session.add_all([conto_a, conto_b, cat])
+    db_session.flush()
+    return user, conto_a, conto_b, cat
+
+
+def test_import_batch_crea_transazioni_e_aggrega_i_saldi(db_session, setup):
+    user, conto_a, conto_b, cat = setup
+    p1 = _proposal(db_session, user, conto_a, "10.00")
+    p2 = _proposal(db_session, user, conto_a, "5.50")
+    p3 = _proposal(db_session, user, conto_a, "30.00", tipo="ENTRATA")
+    db_session.commit()
+
+    result = import_bank_transaction_proposals_batch_endpoint(
+        _batch(
+            {"proposal_id": p1.id, "categoria_id": cat.id, "descrizione": "Spesa"},
+            {"proposal_id": p2.id},
+            # Importata su un altro conto dell'utente
+            {"proposal_id": p3.id, "conto_id": conto_b.id},
+        ),
+        db=db_session,
+        current_user_id=user.id,
+    )
+
+    assert [t.importo for t in result] == [
+        Decimal("10.00"),
+        Decimal("5.50"),
+        Decimal("30.00"),
+    ]
+    assert result[0].categoria_id == cat.id
+    assert result[0].descrizione == "Spesa"
+    assert result[2].conto_id == conto_b.id
+
+    db_session.expire_all()
+    assert db_session.get(Conto, conto_a.id).saldo == Decimal("84.50")
+    assert db_session.get(Conto, conto_b.id).saldo == Decimal("80.00")
+    # Il ledger riceve un movimento per transazione (saldi iniziali esclusi:
+    # i conti del test sono creati senza passare dall'endpoint)
+    assert saldo_al(db_session, conto_a.id) == Decimal("-15.50")
+    assert saldo_al(db_session, conto_b.id) == Decimal("30.00")
+    for proposal, trans in zip((p1, p2, p3), result):
+        proposal = db_session.get(BankTransactionProposal, proposal.id)
+        assert proposal.status == "IMPORTED"
+        assert proposal.imported_transaction_id == trans.id
+
+
+def test_import_batch_rifiuta_la_tassonomia_altrui_senza_importare_nulla(
+    db_session, setup
+):
+    user, conto_a, _conto_b, _cat = setup
+    other = _make_user(db_session, "o", "o@example.it")
+    cat_other = Categoria(nome="Altrui", user_id=other.id)
+    db_session.add(cat_other)
+    p1 = _proposal(db_session, user, conto_a, "10.00")
+    p2 = _proposal(db_session, user, conto_a, "20.00")
+    db_session.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        import_bank_transaction_proposals_batch_endpoint(
+            _batch(
+                {"proposal_id": p1.id},
+                {"proposal_id": p2.id, "categoria_id": cat_other.id},
+            ),
+            db=db_session,
+            current_user_id=user.id,
+        )
+
+    assert exc.value.status_code == 400
+    assert db_session.query(Transazione).count() == 0
+    assert db_session.get(Conto, conto_a.id).saldo == Decimal("100.00")
+
+
+def test_import_batch_rifiuta_proposte_altrui_o_gia_importate(db_session, setup):
+    user, conto_a, _conto_b, _cat = setup
+    other = _make_user(db_session, "o", "o@example.it")
+    conto_other = Conto(nome="X", saldo=Decimal("0"), user_id=other.id)
+    db_session.add(conto_other)
+    db_session.flush()
+    altrui = _proposal(db_session, other, conto_other, "10.00")
+    importata = _proposal(db_session, user, conto_a, "10.00")
+    importata.status = "IMPORTED"
+    db_session.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        import_bank_transaction_proposals_batch_endpoint(
+            _batch({"proposal_id": altrui.id}),
+            db=db_session,
+            current_user_id=user.id,
+        )
+    assert exc.value.status_code == 404
+
+    with pytest.raises(HTTPException) as exc:
+        import_bank_transaction_proposals_batch_endpoint(
+            _batch({"proposal_id": importata.id}),
+            db=db_session,
+            current_user_id=user.id,
+        )
+    assert exc.value.status_code == 400
+
+
+def test_import_batch_concorrente_risponde_409(db_session, setup, monkeypatch):
+    import routers.bank_proposals as bank_proposals
+
+    user, conto_a, _conto_b, _cat = setup
+    p1 = _proposal(db_session, user, conto_a, "10.00")
+    p2 = _proposal(db_session, user, conto_a, "20.00")
+    db_session.commit()
+    verifica = bank_proposals.find_owned_tassonomia
+
+    def importata_nel_frattempo(db, *args):
+        # Un'altra richiesta importa p2 dopo le verifiche di questa
+        db.query(BankTransactionProposal).filter_by(id=p2.id).update(
+            {"status": "IMPORTED"}
+        )
+        db.commit()
+        return verifica(db, *args)
+
+    monkeypatch.setattr(
+        bank_proposals, "find_owned_tassonomia", importata_nel_frattempo
+    )
+
+    with pytest.raises(HTTPException) as exc:
+        import_bank_transaction_proposals_batch_endpoint(
+            _batch({"proposal_id": p1.id}, {"proposal_id": p2.id}),
+            db=db_session,
+            current_user_id=user.id,
+        )
+
+    assert exc.value.status_code == 409
+    assert db_session.query(Transazione).count() == 0
+    assert db_session.get(Conto, conto_a.id).saldo == Decimal("100.00")
+    assert db_session.get(BankTransactionProposal, p1.id).status == "PENDING"
@@ -0,0 +1,116 @@
+"""Il generatore dei benchmark (`benchmarks/dataset.py`) e il confronto con la
+baseline (`benchmarks/api.py`)."""
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from benchmarks.api import confronta
+from benchmarks.dataset import genera_dataset
+from models import (
+    Conto,
+    Investimento,
+    MovimentoSaldo,
+    Ricorrenza,
+    StoricoInvestimento,
+    Transazione,
+)
+
+OGGI = date(2026, 10, 19)
+
+
+def _transazioni(db):
+    return db.execute(
+        select(
+            Transazione.tipo,
+            Transazione.data,
+            Transazione.importo,
+            Transazione.importo_netto,
+            Transazione.conto_id,
+            Transazione.categoria_id,
+            Transazione.parent_transaction_id,
+            Transazione.split_group_id,
+        ).order_by(Transazione.id)
+    ).all()
+
+
+def test_dataset_deterministico_e_coerente(db_session):
+    dataset = genera_dataset(db_session, transazioni=2_000, anni=2, oggi=OGGI)
+    righe = _transazioni(db_session)
+
+    assert dataset.transazioni == len(righe) == 2_000
+    assert min(r.data for r in righe) == dataset.inizio == date(2024, 10, 19)
+    assert max(r.data for r in righe) <= OGGI
+    assert {r.tipo for r in righe} == {
+        "ENTRATA",
+        "USCITA",
+        "RIMBORSO",
+        "RICARICA",
+        "ACCANTONAMENTO",
+    }
+
+    # Ogni rimborso scala l'importo netto della sua spesa
+    rimborsati = db_session.query(Transazione).filter(Transazione.rimborsi.any()).all()
+    assert rimborsati
+    for spesa in rimborsati:
+        assert spesa.tipo == "USCITA"
+        assert spesa.importo_netto == spesa.importo - sum(
+            r.importo for r in spesa.rimborsi
+        )
+    gruppi = db_session.execute(
+        select(Transazione.split_group_id, func.count())
+        .where(Transazione.split_group_id.is_not(None))
+        .group_by(Transazione.split_group_id)
+    ).all()
+    assert gruppi and all(parti >= 2 for _, parti in gruppi)
+
+    # Saldi e ledger tornano con le transazioni (a meno delle somme in virgola
+    # mobile di SQLite)
+    for conto in db_session.query(Conto).filter(Conto.id.in_(dataset.conto_ids)):
+        ledger = db_session.scalar(
+            select(func.sum(MovimentoSaldo.importo)).where(
+                MovimentoSaldo.conto_id == conto.id
+            )
+        )
+        assert abs(conto.saldo - Decimal(str(ledger))) < Decimal("0.05")
+
+    assert db_session.query(Ricorrenza).count() == 20
+    assert db_session.query(Investimento).count() == 5
+    # PAC mensile: un acquisto al mese per titolo, per 2 anni (inizio e oggi inclusi)
+    assert db_session.query(StoricoInvestimento).count() == 5 * 25
+
+    # Stesso seme e stessa data: stesse righe, anche in un altro database
+    db_session.rollback()
+    for tabella in reversed(Transazione.metadata.sorted_tables):
+        db_session.execute(tabella.delete())
+    db_session.commit()
+    genera_dataset(db_session, transazioni=2_000, anni=2, oggi=OGGI)
+    assert _transazioni(db_session) == righe
+
+
+def test_confronto_con_la_baseline():
+    baseline = {
+        "environment": {"database": "sqlite", "transactions": 100, "seed": 42},
+        "endpoints": {"lista": {"median_ms": 10.0, "queries": 2}},
+        "tasks": {"task": {"ms": 100.0, "rows": 5}},
+    }
+    uguale = {
+        **baseline,
+        "environment": {**baseline["environment"], "python": "3.12.0"},
+    }
+    assert confronta(uguale, baseline, tolleranza=0.5) == []
+
+    peggio = {
+        "environment": baseline["environment"],
+        "endpoints": {"lista": {"median_ms": 16.0, "queries": 3}},
+        "tasks": {"task": {"ms": 140.0, "rows": 5}},
+    }
+    assert confronta(peggio, baseline, tolleranza=0.5) == [
+        "lista: 16.0 ms contro 10.0 ms",
+        "lista: 3 query contro 2",
+    ]
+
+    # Dati diversi: i numeri non sono confrontabili
+    altro = {**peggio, "environment": {**baseline["environment"], "seed": 1}}
+    assert confronta(altro, baseline, tolleranza=0.5) == []
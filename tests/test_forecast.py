@@ -0,0 +1,154 @@
+"""Previsione dei saldi: espansione delle ricorrenze, `/conti/forecast` e le
+ricorrenze future in `/conti/currentMonthExpenses`.
+"""
+
+import calendar
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from forecast import espandi_ricorrenza
+from models import Conto, Ricorrenza, User
+from routers.conti import get_current_month_expenses, get_forecast
+
+
+@pytest.fixture()
+def user(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _ricorrenza(db, user, conto, frequenza, prossima, importo, tipo="USCITA"):
+    db.add(
+        Ricorrenza(
+            nome=frequenza,
+            importo=Decimal(importo),
+            tipo=tipo,
+            frequenza=frequenza,
+            prossima_esecuzione=prossima,
+            attiva=True,
+            conto_id=conto.id,
+            user_id=user.id,
+        )
+    )
+
+
+def test_espandi_ricorrenza():
+    inizio = date(2026, 1, 31)
+    assert espandi_ricorrenza(inizio, "GIORNALIERA", date(2026, 2, 2)) == [
+        date(2026, 1, 31),
+        date(2026, 2, 1),
+        date(2026, 2, 2),
+    ]
+    assert espandi_ricorrenza(inizio, "SETTIMANALE", date(2026, 2, 20)) == [
+        date(2026, 1, 31),
+        date(2026, 2, 7),
+        date(2026, 2, 14),
+    ]
+    # Come il task: da un 31 si avanza di un mese alla volta
+    assert espandi_ricorrenza(inizio, "MENSILE", date(2026, 4, 30)) == [
+        date(2026, 1, 31),
+        date(2026, 2, 28),
+        date(2026, 3, 28),
+        date(2026, 4, 28),
+    ]
+    assert espandi_ricorrenza(inizio, "ANNUALE", date(2027, 12, 31)) == [
+        date(2026, 1, 31),
+        date(2027, 1, 31),
+    ]
+    assert espandi_ricorrenza(inizio, "BOH", date(2027, 1, 1)) == [inizio]
+    assert espandi_ricorrenza(inizio, "GIORNALIERA", date(2026, 1, 30)) == []
+
+
+def test_forecast_proietta_i_saldi_giornalieri(db_session, user):
+    today = date.today()
+    conto = Conto(nome="Corrente", saldo=Decimal("100.00"), user_id=user.id)
+    nascosto = Conto(
+        nome="Nascosto", saldo=Decimal("5.00"), user_id=user.id, deleted_at=today
+    )
+    db_session.add_all([conto, nascosto])
+    db_session.flush()
+    _ricorrenza(
+        db_session, user, conto, "SETTIMANALE", today + timedelta(days=1), "30.00"
+    )
+    _ricorrenza(
+        db_session,
+        user,
+        conto,
+        "MENSILE",
+        today + timedelta(days=10),
+        "200.00",
+        tipo="ENTRATA",
+    )
+    # Arretrata: il task la registrerà stanotte, quindi cade oggi
+    _ricorrenza(db_session, user, conto, "ANNUALE", today - timedelta(days=2), "5.00")
+    _ricorrenza(db_session, user, nascosto, "GIORNALIERA", today, "1.00")
+    db_session.commit()
+
+    forecast = get_forecast(months=1, db=db_session, current_user_id=user.id)
+
+    assert forecast["data_inizio"] == today
+    [previsione] = forecast["conti"]
+    assert previsione["conto_id"] == conto.id
+    punti = {p["data"]: p["saldo"] for p in previsione["punti"]}
+    assert punti[today] == Decimal("95.00")
+    assert punti[today + timedelta(days=1)] == Decimal("65.00")
+    assert punti[today + timedelta(days=8)] == Decimal("35.00")
+    assert punti[today + timedelta(days=10)] == Decimal("235.00")
+    assert previsione["saldo_minimo"] == Decimal("35.00")
+    assert previsione["data_saldo_minimo"] == today + timedelta(days=8)
+    settimanali = len(
+        espandi_ricorrenza(
+            today + timedelta(days=1), "SETTIMANALE", forecast["data_fine"]
+        )
+    )
+    assert previsione["saldo_finale"] == Decimal("295.00") - 30 * settimanali
+    assert punti[forecast["data_fine"]] == previsione["saldo_finale"]
+
+
+def test_forecast_24_mesi_interattivo(db_session, user):
+    today = date.today()
+    conti = [
+        Conto(nome=f"C{i}", saldo=Decimal("1000.00"), user_id=user.id)
+        for i in range(10)
+    ]
+    db_session.add_all(conti)
+    db_session.flush()
+    for i in range(100):
+        _ricorrenza(
+            db_session,
+            user,
+            conti[i % 10],
+            ("GIORNALIERA", "SETTIMANALE", "MENSILE", "ANNUALE")[i % 4],
+            today + timedelta(days=i),
+            "1.00",
+        )
+    db_session.commit()
+
+    inizio = time.perf_counter()
+    forecast = get_forecast(months=24, db=db_session, current_user_id=user.id)
+    durata = time.perf_counter() - inizio
+
+    assert len(forecast["conti"]) == 10
+    assert durata < 1.0
+
+
+def test_spese_del_mese_contano_ogni_esecuzione(db_session, user):
+    today = date.today()
+    last_day = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    db_session.add(conto)
+    db_session.flush()
+    _ricorrenza(db_session, user, conto, "GIORNALIERA", today, "2.00")
+    db_session.commit()
+
+    result = get_current_month_expenses(
+        include_future_recurring=True, db=db_session, current_user_id=user.id
+    )
+
+    giorni = (last_day - today).days + 1
+    assert result["monthly_budget"]["remaining"] == Decimal("-2.00") * giorni
@@ -0,0 +1,187 @@
+"""Conteggio delle query per richiesta (`instrumentation.py`): header
+Server-Timing, campi di log e limiti di query sugli endpoint.
+"""
+
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+from instrumentation import QueryStatsMiddleware, misura_query
+from models import (
+    Categoria,
+    Conto,
+    Investimento,
+    Ricorrenza,
+    StoricoInvestimento,
+    Transazione,
+    User,
+)
+from routers.conti import get_expenses_by_category, get_forecast
+from routers.investimenti import get_investimenti
+from schemas.investimento import InvestimentoFilters, InvestimentoOut
+
+
+def _app(server_timing):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware, server_timing=server_timing)
+
+    @app.get("/tre-query")
+    def tre_query():
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text(f"SELECT {i}"))
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_server_timing_e_log_per_richiesta(caplog):
+    with caplog.at_level(logging.INFO, logger="instrumentation"):
+        risposta = _app(server_timing=True).get("/tre-query")
+
+    assert risposta.status_code == 200
+    timing = risposta.headers["Server-Timing"]
+    assert 'desc="3 queries"' in timing
+    assert "db-slowest;dur=" in timing and "app;dur=" in timing
+
+    [record] = [r for r in caplog.records if r.name == "instrumentation"]
+    assert (record.http_method, record.http_path, record.http_status) == (
+        "GET",
+        "/tre-query",
+        200,
+    )
+    assert record.db_queries == 3
+    assert record.db_slowest_sql.startswith("SELECT")
+
+
+def test_niente_server_timing_in_produzione():
+    risposta = _app(server_timing=False).get("/tre-query")
+    assert "Server-Timing" not in risposta.headers
+
+
+def test_statement_fallito_non_lascia_tempi_sulla_connessione():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.connect() as conn:
+        with misura_query() as stats:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM inesistente"))
+            conn.execute(text("SELECT 1"))
+        assert conn.info == {}
+    assert (stats.query, stats.piu_lenta_sql) == (1, "SELECT 1")
+
+
+@pytest.fixture()
+def user(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_spese_per_categoria_in_una_query(db_session, user, max_queries):
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    categorie = [Categoria(nome=f"Cat {i}", user_id=user.id) for i in range(5)]
+    db_session.add_all([conto, *categorie])
+    db_session.flush()
+    db_session.add_all(
+        Transazione(
+            importo=Decimal("10.00"),
+            importo_netto=Decimal("10.00"),
+            tipo="USCITA",
+            data=date.today(),
+            conto_id=conto.id,
+            categoria_id=categoria.id,
+            user_id=user.id,
+        )
+        for categoria in categorie
+    )
+    db_session.commit()
+    user_id = user.id
+    db_session.expire_all()
+
+    with max_queries(1):
+        spese = get_expenses_by_category(db=db_session, current_user_id=user_id)
+
+    assert len(spese) == 5
+
+
+def test_forecast_in_due_query(db_session, user, max_queries):
+    conti = [Conto(nome=f"C{i}", saldo=Decimal("0"), user_id=user.id) for i in range(3)]
+    db_session.add_all(conti)
+    db_session.flush()
+    db_session.add_all(
+        Ricorrenza(
+            nome="R",
+            importo=Decimal("1.00"),
+            tipo="USCITA",
+            frequenza="SETTIMANALE",
+            prossima_esecuzione=date.today() + timedelta(days=1),
+            attiva=True,
+            conto_id=conto.id,
+            user_id=user.id,
+        )
+        for conto in conti
+    )
+    db_session.commit()
+    user_id = user.id
+
+    with max_queries(2):
+        previsioni = get_forecast(months=6, db=db_session, current_user_id=user_id)
+
+    assert len(previsioni["conti"]) == 3
+
+
+def test_lista_investimenti_con_storico_in_due_query(db_session, user, max_queries):
+    db_session.add_all(
+        Investimento(
+            isin=f"IT000000000{i}",
+            nome_titolo=f"Titolo {i}",
+            user_id=user.id,
+            prezzo_attuale=Decimal("10"),
+            storico=[
+                StoricoInvestimento(
+                    data=date.today(),
+                    quantita=Decimal("2"),
+                    prezzo_unitario=Decimal("9"),
+                )
+            ],
+        )
+        for i in range(4)
+    )
+    db_session.commit()
+    user_id = user.id
+    db_session.expire_all()
+    filtri = InvestimentoFilters(
+        sort_by=["nome_titolo:asc"],
+        isin=None,
+        ticker=None,
+        nome_titolo=None,
+        quantita_min=None,
+        quantita_max=None,
+        valore_attuale_min=None,
+        valore_attuale_max=None,
+        data_inizio=None,
+        data_fine=None,
+    )
+
+    # Anche la serializzazione, che legge le proprietà calcolate
+    with max_queries(2):
+        lista = [
+            InvestimentoOut.model_validate(i, from_attributes=True)
+            for i in get_investimenti(
+                filters=filtri, db=db_session, current_user_id=user_id
+            )
+        ]
+
+    assert [i.quantita_totale for i in lista] == [Decimal("2")] * 4
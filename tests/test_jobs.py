@@ -0,0 +1,179 @@
+"""`jobs.esegui_job`: con lo scheduler attivo su più istanze ogni scatto di un job
+gira una volta sola e lascia la sua riga in `job_runs`.
+
+Le istanze sono due `BackgroundScheduler` nello stesso processo, ognuna con la
+sua sessione, su un DB su file (l'in-memory di conftest ha una sola connessione).
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import jobs
+from database import Base
+from models import JobRun
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'jobs.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _wal(dbapi_connection, _record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    finally:
+        engine.dispose()
+
+
+def _runs(session_factory):
+    with session_factory() as db:
+        return db.query(JobRun).order_by(JobRun.id).all()
+
+
+def test_due_scheduler_eseguono_il_job_una_volta(session_factory):
+    esecuzioni = []
+    finito = threading.Event()
+
+    def task_di_prova():
+        esecuzioni.append(threading.current_thread().name)
+        time.sleep(0.2)
+        finito.set()
+        return 7
+
+    # Stesso scatto per entrambe: nel test il minuto potrebbe cambiare tra le due
+    slot = datetime(2026, 10, 19, 3, 0)
+    partenza = threading.Barrier(2)
+
+    def job(istanza):
+        def esegui():
+            partenza.wait()
+            jobs.esegui_job(
+                task_di_prova.__name__,
+                task_di_prova,
+                session_factory=session_factory,
+                istanza=istanza,
+                slot=slot,
+            )
+
+        return esegui
+
+    schedulers = []
+    for istanza in ("replica-a", "replica-b"):
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(job(istanza), "date", run_date=datetime.now())
+        schedulers.append(scheduler)
+    for scheduler in schedulers:
+        scheduler.start()
+    try:
+        assert finito.wait(10)
+        time.sleep(0.5)
+    finally:
+        for scheduler in schedulers:
+            scheduler.shutdown(wait=True)
+
+    assert len(esecuzioni) == 1
+    [run] = _runs(session_factory)
+    assert (run.job, run.slot, run.status) == ("task_di_prova", slot, jobs.OK)
+    assert run.instance in ("replica-a", "replica-b")
+    assert run.rows == 7
+    assert run.duration_ms >= 200
+    assert run.finished_at >= run.started_at
+
+
+def test_errore_registrato(session_factory):
+    def task_rotto():
+        raise RuntimeError("API prezzi non raggiungibile")
+
+    run_id = jobs.job_schedulato(task_rotto, session_factory=session_factory)()
+
+    [run] = _runs(session_factory)
+    assert run.id == run_id
+    assert run.status == jobs.ERROR
+    assert run.error == "API prezzi non raggiungibile"
+    assert run.rows is None
+    assert run.finished_at is not None
+
+
+def test_scatto_rimasto_running_non_blocca_il_successivo(session_factory):
+    # Istanza morta durante lo scatto precedente: la sua riga resta RUNNING
+    slot = datetime(2026, 10, 19, 4, 0)
+    with session_factory() as db:
+        db.add(
+            JobRun(
+                job="task",
+                slot=slot - timedelta(days=1),
+                instance="morta",
+                status=jobs.RUNNING,
+                started_at=slot - timedelta(days=1),
+            )
+        )
+        db.commit()
+
+    primo = jobs.esegui_job(
+        "task", lambda: None, session_factory=session_factory, slot=slot
+    )
+    doppione = jobs.esegui_job(
+        "task", lambda: 1, session_factory=session_factory, slot=slot
+    )
+
+    assert primo is not None
+    assert doppione is None
+    runs = _runs(session_factory)
+    assert [r.status for r in runs] == [jobs.RUNNING, jobs.OK]
+    assert runs[1].rows is None
+
+
+def test_slot_dallo_scatto_del_cron_non_dal_risveglio():
+    # Repliche con orologi un po' sfasati, o svegliate in ritardo, vedono lo
+    # stesso scatto delle 03:00
+    cron = CronTrigger(hour=3, minute=0, timezone=timezone.utc)
+    finestra = timedelta(hours=1)
+    for adesso in (
+        datetime(2026, 10, 19, 3, 0, 0, 100_000),
+        datetime(2026, 10, 19, 3, 0, 29),
+        datetime(2026, 10, 19, 3, 1, 5),
+    ):
+        assert jobs.ultimo_scatto(
+            cron, adesso.replace(tzinfo=timezone.utc), finestra
+        ) == datetime(2026, 10, 19, 3, 0)
+
+    assert (
+        jobs.ultimo_scatto(
+            cron, datetime(2026, 10, 19, 2, 59, 59, tzinfo=timezone.utc), finestra
+        )
+        is None
+    )
+
+
+def test_job_schedulato_usa_lo_scatto_come_slot(session_factory):
+    scatto = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(seconds=70)
+    trigger = IntervalTrigger(hours=1, start_date=scatto)
+
+    esecuzioni = []
+    for istanza in ("a", "b"):
+        esecuzioni.append(
+            jobs.job_schedulato(
+                lambda: 1,
+                trigger=trigger,
+                session_factory=session_factory,
+                istanza=istanza,
+            )()
+        )
+
+    [run] = _runs(session_factory)
+    assert esecuzioni == [run.id, None]
+    assert run.slot == scatto.replace(tzinfo=None)
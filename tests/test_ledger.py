@@ -0,0 +1,258 @@
+"""Ledger dei saldi: ogni scrittura sul saldo lascia un movimento, la somma dei
+movimenti è il saldo, e lo storico si ricostruisce a qualsiasi data.
+
+Le funzioni endpoint sono chiamate direttamente (niente HTTP).
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func
+
+from ledger import (
+    crea_snapshot_mensili,
+    registra_movimento,
+    saldo_al,
+    TRANSAZIONE,
+)
+from models import Conto, MovimentoSaldo, SaldoSnapshot, User
+from routers import transazioni
+from routers.conti import create_conto, get_balance_history, update_conto
+from routers.transazioni import (
+    create_transazione,
+    delete_transazione,
+    update_transazione,
+)
+from schemas import ContoCreate, ContoUpdate
+from schemas.transazione import (
+    TipoTransazione,
+    TransazioneCreate,
+    TransazioneUpdate,
+)
+
+
+def _somma_ledger(db, conto_id):
+    return db.query(func.sum(MovimentoSaldo.importo)).filter(
+        MovimentoSaldo.conto_id == conto_id
+    ).scalar() or Decimal("0")
+
+
+@pytest.fixture()
+def user(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _conto(db, user, nome, saldo):
+    return create_conto(
+        ContoCreate(nome=nome, saldo=Decimal(saldo)),
+        db=db,
+        current_user_id=user.id,
+    )
+
+
+def test_ogni_scrittura_passa_dal_ledger(db_session, user):
+    conto = _conto(db_session, user, "Corrente", "1000.00")
+    salvadanaio = _conto(db_session, user, "Salvadanaio", "0.00")
+
+    spesa = create_transazione(
+        TransazioneCreate(
+            importo=Decimal("100.00"),
+            tipo=TipoTransazione.USCITA,
+            data=date(2026, 3, 10),
+            conto_id=conto.id,
+        ),
+        db=db_session,
+        current_user_id=user.id,
+    )
+    giroconto = create_transazione(
+        TransazioneCreate(
+            importo=Decimal("200.00"),
+            tipo=TipoTransazione.RICARICA,
+            data=date(2026, 3, 15),
+            conto_id=conto.id,
+            conto_destinazione_id=salvadanaio.id,
+        ),
+        db=db_session,
+        current_user_id=user.id,
+    )
+    # Spesa corretta: importo e data cambiano -> storno + nuovo movimento
+    update_transazione(
+        spesa.id,
+        TransazioneUpdate(
+            importo=Decimal("120.00"),
+            tipo=TipoTransazione.USCITA,
+            data=date(2026, 3, 12),
+            conto_id=conto.id,
+        ),
+        db=db_session,
+        current_user_id=user.id,
+    )
+    delete_transazione(giroconto.id, db=db_session, current_user_id=user.id)
+    update_conto(
+        salvadanaio.id,
+        ContoUpdate(saldo=Decimal("50.00")),
+        db=db_session,
+        current_user_id=user.id,
+    )
+
+    db_session.expire_all()
+    conto = db_session.get(Conto, conto.id)
+    salvadanaio = db_session.get(Conto, salvadanaio.id)
+    assert conto.saldo == Decimal("880.00")
+    assert salvadanaio.saldo == Decimal("50.00")
+    for c in (conto, salvadanaio):
+        assert _somma_ledger(db_session, c.id) == c.saldo
+        assert saldo_al(db_session, c.id) == c.saldo
+
+    causali = [
+        m.causale
+        for m in db_session.query(MovimentoSaldo)
+        .filter(MovimentoSaldo.conto_id == conto.id)
+        .order_by(MovimentoSaldo.id)
+    ]
+    assert causali == [
+        "APERTURA",
+        "TRANSAZIONE",
+        "TRANSAZIONE",
+        "STORNO",
+        "TRANSAZIONE",
+        "STORNO",
+    ]
+
+
+def test_modifica_verso_un_conto_altrui_risponde_404_senza_bloccarlo(db_session, user):
+    other = User(username="o", email="o@example.it", hashed_password="x")
+    db_session.add(other)
+    db_session.commit()
+    conto = _conto(db_session, user, "Corrente", "100.00")
+    altrui = _conto(db_session, other, "Altrui", "500.00")
+    spesa = create_transazione(
+        TransazioneCreate(
+            importo=Decimal("10.00"),
+            tipo=TipoTransazione.USCITA,
+            data=date(2026, 3, 10),
+            conto_id=conto.id,
+        ),
+        db=db_session,
+        current_user_id=user.id,
+    )
+    bloccati = []
+    blocca = transazioni.blocca_conti
+
+    def spia(db, *conto_ids, user_id=None):
+        bloccati.append(user_id)
+        return blocca(db, *conto_ids, user_id=user_id)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(transazioni, "blocca_conti", spia)
+        with pytest.raises(HTTPException) as exc:
+            update_transazione(
+                spesa.id,
+                TransazioneUpdate(
+                    importo=Decimal("10.00"),
+                    tipo=TipoTransazione.USCITA,
+                    data=date(2026, 3, 10),
+                    conto_id=altrui.id,
+                ),
+                db=db_session,
+                current_user_id=user.id,
+            )
+
+    assert exc.value.status_code == 404
+    # Il blocco è ristretto ai conti dell'utente (il FOR UPDATE vero su Postgres:
+    # tests/test_postgres.py)
+    assert bloccati == [user.id]
+    db_session.expire_all()
+    assert db_session.get(Conto, conto.id).saldo == Decimal("90.00")
+    assert db_session.get(Conto, altrui.id).saldo == Decimal("500.00")
+
+
+def test_balance_history_usa_le_date_contabili(db_session, user):
+    conto = _conto(db_session, user, "Corrente", "0.00")
+    for giorno, importo, tipo in (
+        (date(2026, 1, 5), "1000.00", TipoTransazione.ENTRATA),
+        (date(2026, 1, 20), "300.00", TipoTransazione.USCITA),
+        (date(2026, 2, 3), "50.00", TipoTransazione.USCITA),
+    ):
+        create_transazione(
+            TransazioneCreate(
+                importo=Decimal(importo), tipo=tipo, data=giorno, conto_id=conto.id
+            ),
+            db=db_session,
+            current_user_id=user.id,
+        )
+
+    storico = get_balance_history(
+        conto.id,
+        data_inizio=date(2026, 1, 10),
+        data_fine=date(2026, 2, 28),
+        db=db_session,
+        current_user_id=user.id,
+    )
+
+    assert [(p["data"], p["saldo"]) for p in storico["punti"]] == [
+        (date(2026, 1, 10), Decimal("1000.00")),
+        (date(2026, 1, 20), Decimal("700.00")),
+        (date(2026, 2, 3), Decimal("650.00")),
+        (date(2026, 2, 28), Decimal("650.00")),
+    ]
+
+
+def test_balance_history_di_un_altro_utente_o_range_invertito(db_session, user):
+    other = User(username="o", email="o@example.it", hashed_password="x")
+    db_session.add(other)
+    db_session.commit()
+    conto_other = _conto(db_session, other, "Altrui", "10.00")
+
+    with pytest.raises(HTTPException) as exc:
+        get_balance_history(
+            conto_other.id,
+            data_inizio=None,
+            data_fine=None,
+            db=db_session,
+            current_user_id=user.id,
+        )
+    assert exc.value.status_code == 404
+
+    with pytest.raises(HTTPException) as exc:
+        get_balance_history(
+            conto_other.id,
+            data_inizio=date(2026, 2, 1),
+            data_fine=date(2026, 1, 1),
+            db=db_session,
+            current_user_id=other.id,
+        )
+    assert exc.value.status_code == 400
+
+
+def test_snapshot_e_movimenti_retrodatati(db_session, user):
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    db_session.add(conto)
+    db_session.flush()
+    registra_movimento(
+        db_session, conto, Decimal("100"), date(2026, 1, 10), TRANSAZIONE
+    )
+    registra_movimento(
+        db_session, conto, Decimal("-30"), date(2026, 2, 10), TRANSAZIONE
+    )
+    db_session.flush()
+
+    assert crea_snapshot_mensili(db_session, date(2026, 1, 31)) == 1
+    # Già presente: non lo ricrea
+    assert crea_snapshot_mensili(db_session, date(2026, 1, 31)) == 0
+
+    # Movimento retrodatato prima dello snapshot: lo snapshot si sposta con lui
+    registra_movimento(db_session, conto, Decimal("5"), date(2026, 1, 2), TRANSAZIONE)
+    db_session.flush()
+
+    snapshot = db_session.query(SaldoSnapshot).one()
+    assert snapshot.saldo == Decimal("105.00")
+    assert saldo_al(db_session, conto.id, date(2026, 1, 1)) == Decimal("0")
+    assert saldo_al(db_session, conto.id, date(2026, 1, 31)) == Decimal("105.00")
+    assert saldo_al(db_session, conto.id, date(2026, 2, 28)) == Decimal("75.00")
+    assert saldo_al(db_session, conto.id) == conto.saldo == Decimal("75")
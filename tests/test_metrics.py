@@ -0,0 +1,143 @@
+"""Metriche Prometheus (`metrics.py`) e l'endpoint protetto `/metrics`."""
+
+from datetime import datetime
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY, CollectorRegistry
+from sqlalchemy import create_engine
+
+import jobs
+import passwords
+import services
+from main import app
+from metrics import PasswordHashCollector, PoolCollector, QueuePoolMisurato
+from models import Conto
+
+
+def _valore(nome, **labels):
+    return REGISTRY.get_sample_value(nome, labels) or 0
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "segreto")
+    return TestClient(app)
+
+
+def test_metrics_richiede_il_token(client, monkeypatch):
+    assert client.get("/metrics").status_code == 401
+    sbagliato = client.get("/metrics", headers={"Authorization": "Bearer altro"})
+    assert sbagliato.status_code == 401
+
+    monkeypatch.delenv("METRICS_TOKEN")
+    assert client.get("/metrics").status_code == 404
+
+
+def test_latenza_per_route(client):
+    labels = {"method": "GET", "route": "/", "status": "200"}
+    prima = _valore("http_request_duration_seconds_count", **labels)
+
+    client.get("/")
+    risposta = client.get("/metrics", headers={"Authorization": "Bearer segreto"})
+
+    assert risposta.status_code == 200
+    assert risposta.headers["content-type"].startswith("text/plain")
+    assert "http_requests_in_progress" in risposta.text
+    assert _valore("http_request_duration_seconds_count", **labels) == prima + 1
+
+
+def test_stato_e_attesa_del_pool(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=QueuePoolMisurato,
+        pool_size=2,
+        max_overflow=1,
+    )
+    registry = CollectorRegistry()
+    registry.register(PoolCollector(engine))
+    attese = _valore("db_pool_wait_seconds_count")
+
+    with engine.connect(), engine.connect(), engine.connect():
+        assert registry.get_sample_value("db_pool_checked_out") == 3
+        assert registry.get_sample_value("db_pool_overflow") == 1
+    assert registry.get_sample_value("db_pool_checked_out") == 0
+    assert registry.get_sample_value("db_pool_size") == 2
+    assert _valore("db_pool_wait_seconds_count") == attese + 3
+    engine.dispose()
+
+
+def test_coda_degli_hash_password(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_WORKERS", 2)
+    monkeypatch.setattr(passwords, "_pending", 5)
+    registry = CollectorRegistry()
+    registry.register(PasswordHashCollector())
+
+    assert registry.get_sample_value("password_hash_pending") == 5
+    assert registry.get_sample_value("password_hash_queued") == 3
+    assert registry.get_sample_value("password_hash_workers") == 2
+    # Registrato anche nel registry servito da /metrics
+    assert _valore("password_hash_max_pending") == passwords.PASSWORD_HASH_MAX_PENDING
+
+
+def test_esiti_e_righe_dei_job(db_session):
+    def task_metriche():
+        return 4
+
+    def task_metriche_rotto():
+        raise RuntimeError("giù")
+
+    for slot, task in enumerate((task_metriche, task_metriche_rotto)):
+        jobs.esegui_job(
+            "task_metriche",
+            task,
+            session_factory=lambda: db_session,
+            slot=datetime(2026, 10, 19, 3, slot),
+        )
+
+    assert _valore("job_runs_total", job="task_metriche", status=jobs.OK) == 1
+    assert _valore("job_runs_total", job="task_metriche", status=jobs.ERROR) == 1
+    assert _valore("job_rows_processed_total", job="task_metriche") == 4
+    assert _valore("job_duration_seconds_count", job="task_metriche") == 2
+
+
+def test_sync_bancaria_per_provider_e_429(db_session, monkeypatch):
+    conto = Conto(
+        nome="Banca",
+        bank_connector_provider="ENABLEBANKING",
+        bank_connector_account_id="acc-1",
+    )
+    risposta = requests.Response()
+    risposta.status_code = 429
+
+    def troppe_richieste(*args):
+        raise requests.HTTPError(response=risposta)
+
+    monkeypatch.setattr(services, "fetch_enable_banking_transactions", troppe_richieste)
+    prima_429 = _valore("bank_sync_rate_limited_total", provider="ENABLEBANKING")
+    prima_mock = _valore(
+        "bank_sync_duration_seconds_count", provider="MOCK", outcome="ok"
+    )
+
+    with pytest.raises(requests.HTTPError):
+        services.fetch_bank_transactions_for_conto(db_session, conto)
+    conto.bank_connector_provider = "MOCK"
+    assert len(services.fetch_bank_transactions_for_conto(db_session, conto)) == 3
+
+    assert (
+        _valore("bank_sync_rate_limited_total", provider="ENABLEBANKING")
+        == prima_429 + 1
+    )
+    assert (
+        _valore(
+            "bank_sync_duration_seconds_count",
+            provider="ENABLEBANKING",
+            outcome="rate_limited",
+        )
+        >= 1
+    )
+    assert (
+        _valore("bank_sync_duration_seconds_count", provider="MOCK", outcome="ok")
+        == prima_mock + 1
+    )
@@ -0,0 +1,183 @@
+"""Le query calde usano gli indici parziali sulle righe vive.
+
+Si catturano le query SQL emesse dagli endpoint (chiamati direttamente) e se ne
+legge il piano con `EXPLAIN QUERY PLAN`: SQLite, come Postgres, usa un indice
+parziale solo se il WHERE della query implica il predicato dell'indice, quindi
+un filtro `deleted_at IS NULL` dimenticato o un filtro non sargable (es.
+`extract(year, data) = ...`) si vedono qui come SCAN o come indice sbagliato.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from auth import get_current_user_id
+from database import get_db
+from main import app
+from models import User
+from routers.bank_proposals import get_all_pending_proposals
+from routers.statistics import (
+    get_month_details_statistics,
+    get_year_details_statistics,
+)
+from routers.transazioni import get_transazioni
+from schemas.transazione import TransazioneFilters
+
+
+def _filters(**overrides):
+    values = dict(
+        sort_by=["data:desc", "id:desc"],
+        importo_min=None,
+        importo_max=None,
+        tipo=None,
+        data_inizio=None,
+        data_fine=None,
+        descrizione=None,
+        conto_id=None,
+        categoria_id=None,
+        sottocategoria_id=None,
+        tag_id=None,
+    )
+    values.update(overrides)
+    return TransazioneFilters(**values)
+
+
+@pytest.fixture()
+def user_id(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user.id
+
+
+@pytest.fixture()
+def query_plans(db_session):
+    """Esegue `fn` e restituisce, per ogni SELECT emessa, i passi del piano."""
+    engine = db_session.get_bind()
+
+    def run(fn):
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            fn()
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        with engine.connect() as conn:
+            return [
+                (
+                    statement,
+                    [
+                        row[-1]
+                        for row in conn.exec_driver_sql(
+                            "EXPLAIN QUERY PLAN " + statement, parameters
+                        )
+                    ],
+                )
+                for statement, parameters in captured
+            ]
+
+    return run
+
+
+def _transazioni_steps(plans):
+    return [
+        step
+        for _statement, steps in plans
+        for step in steps
+        if " transazioni " in f"{step} "
+    ]
+
+
+def test_lista_paginata_usa_lindice_user_data_id(db_session, user_id, query_plans):
+    plans = query_plans(
+        lambda: get_transazioni(
+            1, 10, _filters(), db=db_session, current_user_id=user_id
+        )
+    )
+
+    steps = _transazioni_steps(plans)
+    assert steps
+    assert all("USING INDEX ix_transazioni_attive_" in step for step in steps)
+
+    _statement, page_steps = next(
+        (s, steps) for s, steps in plans if "LIMIT" in s.upper()
+    )
+    assert any("ix_transazioni_attive_user_data_id" in step for step in page_steps)
+    # L'ordinamento "data desc, id desc" esce dall'indice, senza sort a parte.
+    assert not any("TEMP B-TREE FOR ORDER BY" in step for step in page_steps)
+
+
+@pytest.mark.parametrize(
+    "categoria_id, tag_id, index_name",
+    [
+        (1, None, "ix_transazioni_attive_user_categoria_data"),
+        (None, 1, "ix_transazioni_attive_user_tag_data"),
+        (None, None, "ix_transazioni_attive_user_data_id"),
+    ],
+)
+def test_statistiche_annuali_usano_gli_indici_parziali(
+    db_session, user_id, query_plans, categoria_id, tag_id, index_name
+):
+    plans = query_plans(
+        lambda: get_year_details_statistics(
+            2026, categoria_id, tag_id, db=db_session, current_user_id=user_id
+        )
+    )
+
+    steps = _transazioni_steps(plans)
+    assert len(steps) == 2
+    for step in steps:
+        assert index_name in step
+        # Il periodo è un range su `data`, risolto dentro l'indice.
+        assert "data>? AND data<?" in step
+
+
+def test_statistiche_mensili_usano_il_range_di_date(db_session, user_id, query_plans):
+    plans = query_plans(
+        lambda: get_month_details_statistics(
+            2026, 12, None, None, db=db_session, current_user_id=user_id
+        )
+    )
+
+    steps = _transazioni_steps(plans)
+    assert steps
+    assert all(
+        "ix_transazioni_attive_user_data_id" in step and "data>? AND data<?" in step
+        for step in steps
+    )
+
+
+def test_proposte_pendenti_usano_lindice_parziale(db_session, user_id, query_plans):
+    plans = query_plans(
+        lambda: get_all_pending_proposals(db=db_session, current_user_id=user_id)
+    )
+
+    [(_statement, steps)] = plans
+    assert any("ix_bank_proposals_pending_user" in step for step in steps)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/statistics/monthDetails?year=2026&month=13",
+        "/statistics/monthDetails?year=2026&month=0",
+        "/statistics/monthDetails?year=0&month=1",
+        "/statistics/yearDetails?year=9999",
+    ],
+)
+def test_periodo_fuori_range_risponde_422(db_session, user_id, url):
+    # `get_period_filter` costruisce date vere: senza i limiti sulla Query un mese
+    # 13 sarebbe un ValueError, cioè un 500
+    app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_current_user_id] = lambda: user_id
+    try:
+        risposta = TestClient(app).get(url)
+    finally:
+        app.dependency_overrides.clear()
+    assert risposta.status_code == 422
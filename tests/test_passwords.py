@@ -0,0 +1,52 @@
+"""`passwords`: bcrypt nel pool di processi dedicato, costo configurabile e coda
+limitata.
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import passwords
+
+
+@pytest.fixture(autouse=True)
+def costo_basso(monkeypatch):
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 4)
+
+
+def test_hash_col_costo_configurato():
+    hashed = passwords.get_password_hash("segreta")
+    assert hashed.startswith("$2b$04$")
+    assert not passwords.needs_rehash(hashed)
+    assert passwords.needs_rehash(passwords.get_password_hash("segreta", rounds=5))
+    assert passwords.needs_rehash("non-un-hash-bcrypt")
+
+
+def test_hash_e_verifica_nel_pool():
+    async def scenario():
+        hashed = await passwords.get_password_hash_async("segreta")
+        # Più verifiche in parallelo: finiscono tutte, al massimo una coda breve
+        esiti = await asyncio.gather(
+            *(
+                passwords.verify_password_async(password, hashed)
+                for password in ("segreta", "sbagliata", "segreta", "altra")
+            )
+        )
+        return hashed, esiti
+
+    hashed, esiti = asyncio.run(scenario())
+
+    assert hashed.startswith("$2b$04$")
+    assert esiti == [True, False, True, False]
+    assert passwords.stats()["pending"] == 0
+
+
+def test_coda_piena_risponde_503(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_PENDING", 0)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(passwords.verify_password_async("x", "y"))
+
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "1"}
@@ -0,0 +1,304 @@
+"""Comportamenti che si vedono solo su Postgres (fixture `pg_engine`).
+
+Piani di esecuzione sugli indici creati dalle migrazioni e scritture concorrenti
+da più thread, ognuno con la sua connessione: aggiornamento atomico dei saldi,
+upsert del rate limit, advisory lock dei job. Senza Postgres sono saltati.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+import jobs
+from ledger import TRANSAZIONE, registra_movimento
+from routers import transazioni
+from models import BankTransactionProposal, Conto, MovimentoSaldo, Transazione, User
+from rate_limit import DbStorage
+from routers.bank_proposals import import_bank_transaction_proposals_batch_endpoint
+from schemas.bank_transaction import BankTransactionProposalBatchImport
+from schemas.transazione import TipoTransazione, TransazioneUpdate
+from services import build_transazioni_search_query
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture()
+def sessioni(pg_engine):
+    return sessionmaker(bind=pg_engine, autoflush=False, autocommit=False)
+
+
+@pytest.fixture()
+def conto(sessioni):
+    with sessioni() as db:
+        user = User(username="pg", email="pg@example.it", hashed_password="x")
+        db.add(user)
+        db.flush()
+        conto = Conto(nome="Conto", saldo=Decimal("0"), user_id=user.id)
+        db.add(conto)
+        db.commit()
+        db.refresh(conto)
+        return conto
+
+
+def _piano(db, query) -> str:
+    """EXPLAIN con le scansioni sequenziali scoraggiate: su tabelle quasi vuote
+    il planner le preferirebbe comunque, qui interessa che l'indice sia usabile
+    per quella query."""
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    compilata = query.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    piano = db.connection().exec_driver_sql(f"EXPLAIN {compilata}")
+    return "\n".join(piano.scalars())
+
+
+def test_liste_e_ricerca_usano_gli_indici(sessioni, conto, pg_engine):
+    with sessioni() as db:
+        # Abbastanza righe perché gli indici convengano: una su cento è Amazon
+        db.execute(
+            insert(Transazione),
+            [
+                {
+                    "importo": Decimal("1"),
+                    "tipo": "USCITA",
+                    "data": date(2020, 1, 1) + timedelta(days=i % 2000),
+                    "descrizione": (
+                        f"PAGAMENTO POS AMAZON {i}"
+                        if i % 100 == 0
+                        else f"BONIFICO SEPA RIF {i}"
+                    ),
+                    "conto_id": conto.id,
+                    "user_id": conto.user_id,
+                }
+                for i in range(20_000)
+            ],
+        )
+        db.add(
+            BankTransactionProposal(
+                user_id=conto.user_id,
+                conto_id=conto.id,
+                provider="MOCK",
+                tipo="USCITA",
+                data=date(2026, 1, 1),
+                importo=Decimal("1"),
+            )
+        )
+        db.commit()
+        # Statistiche aggiornate e lista pending del GIN svuotata, come dopo
+        # l'autovacuum: sulle righe appena inserite le stime sarebbero sballate
+        with pg_engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql(
+                "VACUUM ANALYZE"
+            )
+
+        recenti = (
+            select(Transazione.id)
+            .where(
+                Transazione.user_id == conto.user_id,
+                Transazione.deleted_at.is_(None),
+                Transazione.data >= date(2025, 1, 1),
+            )
+            .order_by(Transazione.data.desc(), Transazione.id.desc())
+            .limit(10)
+        )
+        assert "ix_transazioni_attive_user_data_id" in _piano(db, recenti)
+
+        pending = select(BankTransactionProposal.id).where(
+            BankTransactionProposal.user_id == conto.user_id,
+            BankTransactionProposal.status == "PENDING",
+        )
+        assert "ix_bank_proposals_pending_user" in _piano(db, pending)
+
+        ricerca = build_transazioni_search_query(conto.user_id, "amazn", "postgresql")
+        assert "ix_transazioni_descrizione_trgm" in _piano(db, ricerca)
+
+
+def test_saldo_con_scritture_concorrenti(sessioni, conto):
+    """Tanti movimenti in parallelo sullo stesso conto: `saldo = saldo + delta`
+    nel DB non ne perde nessuno, e saldo e ledger restano allineati."""
+
+    def movimenti(_):
+        for _ in range(25):
+            with sessioni() as db:
+                registra_movimento(
+                    db,
+                    db.get(Conto, conto.id),
+                    Decimal("1.00"),
+                    date.today(),
+                    TRANSAZIONE,
+                )
+                db.commit()
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(movimenti, range(8)))
+
+    with sessioni() as db:
+        assert db.get(Conto, conto.id).saldo == Decimal("200.00")
+        assert db.scalar(
+            select(func.sum(MovimentoSaldo.importo)).where(
+                MovimentoSaldo.conto_id == conto.id
+            )
+        ) == Decimal("200.00")
+
+
+def test_rate_limit_upsert_concorrente(pg_engine):
+    """Con 80 richieste contemporanee e un limite di 50 ne passano esattamente 50:
+    l'upsert con la condizione sul limite è atomico."""
+    storage = DbStorage("db://", engine=pg_engine)
+    barriera = threading.Barrier(8)
+
+    def richieste(_):
+        barriera.wait()
+        return [
+            storage.acquire_sliding_window_entry("login/1.2.3.4", 50, 3600)
+            for _ in range(10)
+        ]
+
+    with ThreadPoolExecutor(8) as pool:
+        esiti = [e for blocco in pool.map(richieste, range(8)) for e in blocco]
+
+    assert esiti.count(True) == 50
+    assert storage.get_sliding_window("login/1.2.3.4", 3600)[2] == 50
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: storage.incr("fisso", 60), range(40)))
+    assert storage.get("fisso") == 40
+
+
+def test_import_proposte_concorrente_una_sola_volta(sessioni, conto, pg_engine):
+    """Lo stesso batch inviato due volte insieme (doppio click): entrambe le
+    richieste leggono le proposte PENDING, l'UPDATE condizionato ne fa passare una
+    sola e l'altra risponde 409 senza scrivere nulla."""
+    with sessioni() as db:
+        proposta = BankTransactionProposal(
+            user_id=conto.user_id,
+            conto_id=conto.id,
+            provider="MOCK",
+            tipo="USCITA",
+            data=date(2026, 1, 1),
+            importo=Decimal("10.00"),
+        )
+        db.add(proposta)
+        db.commit()
+        batch = BankTransactionProposalBatchImport(items=[{"proposal_id": proposta.id}])
+
+    # Entrambe le richieste arrivano alla prenotazione dopo aver letto PENDING
+    letture = threading.Barrier(2)
+
+    def dopo_la_lettura(conn, cursor, statement, parameters, context, executemany):
+        prenotazione = statement.lstrip().startswith(
+            "UPDATE bank_transaction_proposals"
+        )
+        if prenotazione and "imported_transaction_id" not in statement:
+            letture.wait(5)
+
+    def importa(_):
+        with sessioni() as db:
+            try:
+                import_bank_transaction_proposals_batch_endpoint(
+                    batch, db=db, current_user_id=conto.user_id
+                )
+                return 200
+            except HTTPException as exc:
+                return exc.status_code
+
+    event.listen(pg_engine, "before_cursor_execute", dopo_la_lettura)
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            esiti = sorted(pool.map(importa, range(2)))
+    finally:
+        event.remove(pg_engine, "before_cursor_execute", dopo_la_lettura)
+
+    assert esiti == [200, 409]
+    with sessioni() as db:
+        assert db.scalar(select(func.count()).select_from(Transazione)) == 1
+        assert db.get(Conto, conto.id).saldo == Decimal("-10.00")
+
+
+def test_modifica_non_blocca_i_conti_altrui(sessioni, conto, monkeypatch):
+    """Un `conto_id` di un altro utente nel payload: la richiesta risponde 404 e,
+    mentre è in corso, quel conto resta libero per le scritture del suo utente."""
+    with sessioni() as db:
+        other = User(username="altro", email="altro@example.it", hashed_password="x")
+        db.add(other)
+        db.flush()
+        altrui = Conto(nome="Altrui", saldo=Decimal("0"), user_id=other.id)
+        spesa = Transazione(
+            importo=Decimal("1"),
+            tipo="USCITA",
+            data=date(2026, 1, 1),
+            conto_id=conto.id,
+            user_id=conto.user_id,
+        )
+        db.add_all([altrui, spesa])
+        db.commit()
+        altrui_id, spesa_id = altrui.id, spesa.id
+
+    libero = []
+    registra = transazioni.registra_transazione
+
+    def prova_il_lock(db, *args, **kwargs):
+        # Dopo blocca_conti, a transazione aperta: il conto altrui si blocca?
+        if not libero:
+            with sessioni() as altra:
+                riga = altra.execute(
+                    text("SELECT id FROM conti WHERE id = :id FOR UPDATE SKIP LOCKED"),
+                    {"id": altrui_id},
+                ).first()
+                libero.append(riga is not None)
+                altra.rollback()
+        return registra(db, *args, **kwargs)
+
+    monkeypatch.setattr(transazioni, "registra_transazione", prova_il_lock)
+    with sessioni() as db, pytest.raises(HTTPException) as exc:
+        transazioni.update_transazione(
+            spesa_id,
+            TransazioneUpdate(
+                importo=Decimal("1"),
+                tipo=TipoTransazione.USCITA,
+                data=date(2026, 1, 1),
+                conto_id=altrui_id,
+            ),
+            db=db,
+            current_user_id=conto.user_id,
+        )
+
+    assert exc.value.status_code == 404
+    assert libero == [True]
+
+
+def test_advisory_lock_non_sovrappone_lo_stesso_job(sessioni):
+    """Due scatti diversi dello stesso job nello stesso momento (un giro lungo che
+    sconfina nel successivo): il secondo trova il lock preso e salta."""
+    in_corso = threading.Event()
+
+    def task_lungo():
+        in_corso.set()
+        time.sleep(0.5)
+        return 1
+
+    def esegui(minuto):
+        if minuto:
+            assert in_corso.wait(5)
+        return jobs.esegui_job(
+            "task_lungo",
+            task_lungo,
+            session_factory=sessioni,
+            slot=datetime(2026, 10, 19, 3, minuto),
+        )
+
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(esegui, (0, 1)))
+
+    with sessioni() as db:
+        esiti = db.execute(
+            text("SELECT slot, status FROM job_runs ORDER BY slot")
+        ).all()
+    assert [status for _, status in esiti] == [jobs.OK, jobs.SKIPPED]
@@ -0,0 +1,75 @@
+"""Quota per utente pesata sul costo delle route (`rate_limit.quota`)."""
+
+import pytest
+from fastapi import Depends, FastAPI, Header
+from fastapi.testclient import TestClient
+
+import auth
+import rate_limit
+from main import app as api
+from rate_limit import limiter, quota
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    """App con due route a costo diverso; l'utente arriva dall'header X-User."""
+    monkeypatch.setattr(rate_limit, "USER_QUOTA", rate_limit.parse("10/minute"))
+    limiter.reset()
+    app = FastAPI()
+
+    def utente_da_header(x_user: str = Header()):
+        return int(x_user)
+
+    app.dependency_overrides[auth.get_current_user_id] = utente_da_header
+
+    @app.get("/lista", dependencies=[Depends(quota(1))])
+    def lista():
+        return []
+
+    @app.post("/import", dependencies=[Depends(quota(6))])
+    def importa():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_costi_consumano_il_budget_dellutente(client):
+    utente = {"X-User": "1"}
+
+    risposta = client.get("/lista", headers=utente)
+    assert risposta.status_code == 200
+    assert risposta.headers["RateLimit-Limit"] == "10"
+    assert risposta.headers["RateLimit-Remaining"] == "9"
+    assert 0 < int(risposta.headers["RateLimit-Reset"]) <= 60
+    assert risposta.headers["RateLimit-Policy"] == "10;w=60"
+
+    assert client.post("/import", headers=utente).headers["RateLimit-Remaining"] == "3"
+
+    # Un altro import non ci sta più: 429 con i tempi per riprovare
+    esaurita = client.post("/import", headers=utente)
+    assert esaurita.status_code == 429
+    assert 0 < int(esaurita.headers["Retry-After"]) <= 60
+    assert esaurita.headers["RateLimit-Remaining"] == "0"
+
+
+def test_budget_separato_per_utente(client):
+    for _ in range(10):
+        assert client.get("/lista", headers={"X-User": "1"}).status_code == 200
+    assert client.get("/lista", headers={"X-User": "1"}).status_code == 429
+    # Stesso IP, utente diverso: budget intatto
+    assert client.get("/lista", headers={"X-User": "2"}).status_code == 200
+
+
+@pytest.mark.parametrize(
+    "path, costo",
+    [
+        ("/conti/{conto_id}/bank-connector/import-statement", 50),
+        ("/conti/{conto_id}/bank-connector/sync", 50),
+        ("/statistics/yearDetails", 10),
+        ("/transazioni/paginated", 1),
+    ],
+)
+def test_route_costose_dichiarano_la_quota(path, costo):
+    [route] = [r for r in api.routes if getattr(r, "path", None) == path]
+    costi = [getattr(d.call, "costo", None) for d in route.dependant.dependencies]
+    assert costo in costi
@@ -0,0 +1,136 @@
+"""Rate limit su storage condiviso (`rate_limit.DbStorage`).
+
+Più istanze dell'app (qui due FastAPI nello stesso processo, ognuna col suo
+`Limiter`) puntano allo stesso database: un SQLite su file fa da stand-in locale
+di Postgres. Il limite deve valere sulla somma delle richieste, non per istanza.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+
+import rate_limit
+from rate_limit import DbStorage
+
+
+@pytest.fixture()
+def storage_uri(tmp_path):
+    return f"db+sqlite:///{tmp_path / 'rate_limit.db'}"
+
+
+def _istanza(storage_uri, strategy="fixed-window"):
+    """Un'istanza dell'API con un endpoint limitato a 3 richieste al minuto."""
+    limiter = Limiter(
+        key_func=get_remote_address, storage_uri=storage_uri, strategy=strategy
+    )
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+    @app.post("/login")
+    @limiter.limit("3/minute")
+    def login(request: Request):
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("strategy", ["fixed-window", "sliding-window-counter"])
+def test_limite_condiviso_tra_istanze(storage_uri, strategy):
+    prima, seconda = _istanza(storage_uri, strategy), _istanza(storage_uri, strategy)
+
+    risposte = [
+        client.post("/login").status_code
+        for client in (prima, seconda, prima, seconda, prima)
+    ]
+
+    assert risposte == [200, 200, 200, 429, 429]
+
+
+def test_incremento_atomico_sotto_concorrenza(storage_uri):
+    storages = [DbStorage(storage_uri, connect_args={"timeout": 30}) for _ in range(4)]
+    partenza = threading.Barrier(8)
+
+    def colpisci(indice):
+        partenza.wait()
+        storage = storages[indice % len(storages)]
+        return [storage.incr("login/1.2.3.4", 60) for _ in range(10)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        conteggi = [c for risultato in pool.map(colpisci, range(8)) for c in risultato]
+
+    # Nessun incremento perso né duplicato: ogni valore restituito una sola volta
+    assert sorted(conteggi) == list(range(1, 81))
+    assert storages[0].get("login/1.2.3.4") == 80
+
+
+def test_finestra_fissa_riparte_dopo_la_scadenza(storage_uri, monkeypatch):
+    storage = DbStorage(storage_uri)
+    orologio = [1_000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: orologio[0])
+
+    assert storage.incr("k", 60) == 1
+    assert storage.incr("k", 60) == 2
+    assert storage.get_expiry("k") == 1_060.0
+
+    orologio[0] = 1_060.0
+    assert storage.get("k") == 0
+    assert storage.incr("k", 60) == 1
+    assert storage.get_expiry("k") == 1_120.0
+
+
+def test_sliding_window_pesa_la_finestra_precedente(storage_uri, monkeypatch):
+    storage = DbStorage(storage_uri)
+    orologio = [600.0]  # inizio di una finestra da 60 secondi
+    monkeypatch.setattr(rate_limit.time, "time", lambda: orologio[0])
+
+    assert all(storage.acquire_sliding_window_entry("k", 4, 60) for _ in range(4))
+    assert not storage.acquire_sliding_window_entry("k", 4, 60)
+
+    # A metà della finestra successiva le 4 di prima pesano 2: ne passano 2
+    orologio[0] = 690.0
+    assert storage.get_sliding_window("k", 60) == (4, 30.0, 0, 90.0)
+    assert storage.acquire_sliding_window_entry("k", 4, 60)
+    assert storage.acquire_sliding_window_entry("k", 4, 60)
+    assert not storage.acquire_sliding_window_entry("k", 4, 60)
+
+    # Nella finestra dopo contano le 2 di prima; in quella dopo ancora più nulla
+    orologio[0] = 750.0
+    assert storage.get_sliding_window("k", 60) == (2, 30.0, 0, 90.0)
+    orologio[0] = 780.0
+    assert storage.get_sliding_window("k", 60) == (0, 0.0, 0, 120.0)
+
+
+def test_pulizia_elimina_solo_le_righe_scadute_da_tempo(storage_uri, monkeypatch):
+    storage = DbStorage(storage_uri)
+    orologio = [1_000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: orologio[0])
+    for indice in range(5):
+        storage.incr(f"vecchio/{indice}", 60)
+    orologio[0] = 5_000.0
+    storage.incr("recente", 60)
+    # Scaduto da poco: serve ancora come finestra precedente della sliding window
+    storage.acquire_sliding_window_entry("sliding", 4, 3_600)
+
+    orologio[0] = 8_000.0
+    assert storage.elimina_scaduti(trattieni=3_600, batch_size=2) == 5
+    assert storage.get_sliding_window("sliding", 3_600)[0] == 1
+    assert storage.elimina_scaduti(trattieni=3_600) == 0
+
+
+def test_task_pulizia_rate_limit(storage_uri, monkeypatch):
+    import services
+
+    storage = DbStorage(storage_uri)
+    storage.incr("vecchio", 60)
+    monkeypatch.setattr(rate_limit.limiter.limiter, "storage", storage)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_RETENTION", -3_600)
+
+    assert services.task_pulizia_rate_limit() == 1
+    assert storage.get_expiry("vecchio") == pytest.approx(rate_limit.time.time())
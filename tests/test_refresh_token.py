@@ -144,3 +144,46 @@ def test_logout_revoca_solo_la_sessione_corrente(db_session):
     # Il telefono resta loggato
     still_valid = auth.consume_refresh_token(db_session, raw_phone)
     assert still_valid.user_id == user.id
+
+
+def test_pulizia_elimina_solo_i_token_non_piu_spendibili(db_session):
+    user = _make_user(db_session)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # Cinque sessioni scadute: con blocchi da 2 servono più giri
+    for _ in range(5):
+        auth.issue_refresh_token(db_session, user.id)
+    ruotato_da_poco = auth.issue_refresh_token(db_session, user.id)
+    revocato = auth.issue_refresh_token(db_session, user.id)
+    ruotato_da_tempo = auth.issue_refresh_token(db_session, user.id)
+    db_session.commit()
+
+    tokens = db_session.query(RefreshToken).order_by(RefreshToken.id).all()
+    # Il token attivo è la rotazione di quello ruotato da poco: stessa famiglia
+    attivo = auth.issue_refresh_token(
+        db_session, user.id, family_id=tokens[5].family_id
+    )
+    for scaduto in tokens[:5]:
+        scaduto.expires_at = now - timedelta(minutes=1)
+    tokens[5].used_at = now - timedelta(days=1)
+    tokens[6].revoked_at = now
+    tokens[7].used_at = now - timedelta(
+        days=auth.REFRESH_TOKEN_USED_RETENTION_DAYS + 1
+    )
+    db_session.commit()
+
+    assert auth.delete_stale_refresh_tokens(db_session, batch_size=2) == 7
+
+    rimasti = {t.token_hash for t in db_session.query(RefreshToken).all()}
+    assert rimasti == {
+        auth._hash_refresh_token(attivo),
+        auth._hash_refresh_token(ruotato_da_poco),
+    }
+    for raw in (revocato, ruotato_da_tempo):
+        with pytest.raises(HTTPException):
+            auth.consume_refresh_token(db_session, raw)
+    # Il token ruotato da poco serve ancora alla reuse detection: il suo replay
+    # fa cadere anche la rotazione attiva
+    with pytest.raises(HTTPException):
+        auth.consume_refresh_token(db_session, ruotato_da_poco)
+    with pytest.raises(HTTPException):
+        auth.consume_refresh_token(db_session, attivo)
@@ -0,0 +1,154 @@
+"""`task_ricarica_automatica_conti`: ricariche in blocco con le sorgenti lette una
+volta sola, saldi di una sorgente condivisa scalati in sequenza e numero di query
+che non cresce con i conti; un gruppo che fallisce non annulla gli altri.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+import services
+from ledger import saldo_al
+from models import Conto, Transazione, User
+
+
+@pytest.fixture()
+def user_id(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user.id
+
+
+@pytest.fixture()
+def esegui_task(db_session, monkeypatch):
+    """Lancia il task sulla sessione di test; ritorna le query emesse."""
+    monkeypatch.setattr(services, "SessionLocal", lambda: db_session)
+
+    def run():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            services.task_ricarica_automatica_conti()
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        return statements
+
+    return run
+
+
+def _destinazione(user_id, sorgente_id, saldo, soglia, budget, **kwargs):
+    return Conto(
+        nome=kwargs.pop("nome", "Dest"),
+        saldo=Decimal(saldo),
+        user_id=user_id,
+        ricarica_automatica=True,
+        soglia_minima=Decimal(soglia),
+        budget_obiettivo=Decimal(budget),
+        conto_sorgente_id=sorgente_id,
+        frequenza_controllo=kwargs.pop("frequenza", "SETTIMANALE"),
+        prossimo_controllo=kwargs.pop("prossimo", date.today()),
+        **kwargs,
+    )
+
+
+def test_sorgente_condivisa_scalata_in_sequenza(db_session, user_id, esegui_task):
+    today = date.today()
+    sorgente = Conto(nome="Sorgente", saldo=Decimal("100.00"), user_id=user_id)
+    db_session.add(sorgente)
+    db_session.flush()
+    prima = _destinazione(user_id, sorgente.id, "10.00", "20.00", "70.00")
+    seconda = _destinazione(
+        user_id, sorgente.id, "0.00", "20.00", "50.00", frequenza="MENSILE"
+    )
+    sopra_soglia = _destinazione(user_id, sorgente.id, "30.00", "20.00", "50.00")
+    db_session.add_all([prima, seconda, sopra_soglia])
+    db_session.commit()
+    ids = [c.id for c in (sorgente, prima, seconda, sopra_soglia)]
+
+    esegui_task()
+
+    sorgente, prima, seconda, sopra_soglia = (db_session.get(Conto, i) for i in ids)
+    # La prima ricarica (60) lascia 40 alla sorgente: la seconda (50) non ci sta
+    assert sorgente.saldo == Decimal("40.00")
+    assert prima.saldo == Decimal("70.00")
+    assert seconda.saldo == Decimal("0.00")
+    assert sopra_soglia.saldo == Decimal("30.00")
+    [ricarica] = db_session.query(Transazione).all()
+    assert (ricarica.tipo, ricarica.importo) == ("RICARICA", Decimal("60.00"))
+    assert (ricarica.conto_id, ricarica.conto_destinazione_id) == (ids[0], ids[1])
+    # Conti creati senza APERTURA: il ledger contiene solo la ricarica
+    assert saldo_al(db_session, sorgente.id) == Decimal("-60.00")
+    assert saldo_al(db_session, prima.id) == Decimal("60.00")
+    assert saldo_al(db_session, seconda.id) == Decimal("0")
+
+    # Il prossimo controllo avanza per tutti i conti controllati
+    assert prima.prossimo_controllo == today + timedelta(weeks=1)
+    assert seconda.prossimo_controllo > today + timedelta(weeks=3)
+    assert sopra_soglia.prossimo_controllo == today + timedelta(weeks=1)
+
+
+def test_query_costanti_al_crescere_dei_conti(db_session, user_id, esegui_task):
+    def conta_query(quanti):
+        sorgente = Conto(nome="S", saldo=Decimal("1000.00"), user_id=user_id)
+        db_session.add(sorgente)
+        db_session.flush()
+        db_session.add_all(
+            _destinazione(user_id, sorgente.id, "0.00", "5.00", "10.00")
+            for _ in range(quanti)
+        )
+        db_session.commit()
+        # Su SQLite l'INSERT ... RETURNING va riga per riga: si contano le altre
+        return sum(
+            not s.lstrip().upper().startswith("INSERT INTO TRANSAZIONI")
+            for s in esegui_task()
+        )
+
+    assert conta_query(2) == conta_query(20)
+    assert db_session.query(Transazione).count() == 22
+
+
+def test_sorgente_in_errore_non_annulla_le_altre(
+    db_session, user_id, esegui_task, monkeypatch
+):
+    today = date.today()
+    buona = Conto(nome="Buona", saldo=Decimal("100.00"), user_id=user_id)
+    guasta = Conto(nome="Guasta", saldo=Decimal("100.00"), user_id=user_id)
+    db_session.add_all([buona, guasta])
+    db_session.flush()
+    da_buona = _destinazione(user_id, buona.id, "0.00", "5.00", "10.00")
+    da_guasta = _destinazione(user_id, guasta.id, "0.00", "5.00", "10.00")
+    db_session.add_all([da_buona, da_guasta])
+    db_session.commit()
+    ids = [c.id for c in (buona, guasta, da_buona, da_guasta)]
+
+    scrivi = services._scrivi_transazioni_in_blocco
+
+    def scrivi_e_fallisci(db, rows, movimenti, **valori_conto):
+        # Fallisce dopo aver scritto: il savepoint deve annullare anche quello
+        transazione_ids = scrivi(db, rows, movimenti, **valori_conto)
+        if rows[0]["conto_id"] == ids[1]:
+            raise RuntimeError("vincolo violato")
+        return transazione_ids
+
+    monkeypatch.setattr(services, "_scrivi_transazioni_in_blocco", scrivi_e_fallisci)
+
+    esegui_task()
+
+    db_session.expire_all()
+    buona, guasta, da_buona, da_guasta = (db_session.get(Conto, i) for i in ids)
+    assert (buona.saldo, da_buona.saldo) == (Decimal("90.00"), Decimal("10.00"))
+    assert (guasta.saldo, da_guasta.saldo) == (Decimal("100.00"), Decimal("0.00"))
+    [ricarica] = db_session.query(Transazione).all()
+    assert ricarica.conto_destinazione_id == da_buona.id
+    assert saldo_al(db_session, guasta.id) == Decimal("0")
+    # Il gruppo fallito riprova al prossimo giro
+    assert da_buona.prossimo_controllo == today + timedelta(weeks=1)
+    assert da_guasta.prossimo_controllo == today
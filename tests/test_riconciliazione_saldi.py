@@ -0,0 +1,155 @@
+"""Riconciliazione dei saldi: ricalcolo dalle transazioni, report delle derive e
+riparazione a richiesta, con una query aggregata per blocco di conti.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event, update
+
+from ledger import (
+    RICONCILIAZIONE,
+    TRANSAZIONE,
+    registra_movimento,
+    riconcilia_saldi,
+    saldo_al,
+)
+from models import Conto, MovimentoSaldo, User
+from routers.conti import create_conto, delete_conto, reconcile_balances
+from routers.transazioni import create_transazione
+from schemas import ContoCreate
+from schemas.transazione import TipoTransazione, TransazioneCreate
+
+
+@pytest.fixture()
+def user(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _conto(db, user, nome, saldo):
+    return create_conto(
+        ContoCreate(nome=nome, saldo=Decimal(saldo)), db=db, current_user_id=user.id
+    )
+
+
+def _transazione(db, user, tipo, importo, conto, destinazione=None):
+    return create_transazione(
+        TransazioneCreate(
+            importo=Decimal(importo),
+            tipo=tipo,
+            data=date(2026, 5, 4),
+            conto_id=conto.id,
+            conto_destinazione_id=destinazione.id if destinazione else None,
+        ),
+        db=db,
+        current_user_id=user.id,
+    )
+
+
+def _altera_saldo(db, conto, delta):
+    """Deriva simulata: il saldo cambia senza transazione né movimento."""
+    db.execute(
+        update(Conto).where(Conto.id == conto.id).values(saldo=Conto.saldo + delta)
+    )
+    db.commit()
+
+
+def test_saldi_coerenti_nessuna_deriva(db_session, user):
+    corrente = _conto(db_session, user, "Corrente", "1000.00")
+    risparmi = _conto(db_session, user, "Risparmi", "0.00")
+    vecchio = _conto(db_session, user, "Vecchio", "20.00")
+    _transazione(db_session, user, TipoTransazione.USCITA, "40.00", corrente)
+    _transazione(db_session, user, TipoTransazione.ENTRATA, "15.00", corrente)
+    _transazione(
+        db_session, user, TipoTransazione.RICARICA, "300.00", corrente, risparmi
+    )
+    _transazione(db_session, user, TipoTransazione.ACCANTONAMENTO, "50.00", risparmi)
+    # Il conto cancellato nasconde le sue transazioni ma non tocca il saldo
+    _transazione(db_session, user, TipoTransazione.RICARICA, "5.00", vecchio, corrente)
+    delete_conto(vecchio.id, db=db_session, current_user_id=user.id)
+
+    report = reconcile_balances(repair=False, db=db_session, current_user_id=user.id)
+
+    assert report == {"conti_verificati": 3, "conti_sfasati": []}
+
+
+def test_deriva_riportata_e_riparata(db_session, user):
+    corrente = _conto(db_session, user, "Corrente", "100.00")
+    risparmi = _conto(db_session, user, "Risparmi", "0.00")
+    _transazione(db_session, user, TipoTransazione.RICARICA, "30.00", corrente, risparmi)
+    # Deriva fuori dal ledger (SQL a mano) e deriva passata dal ledger senza
+    # transazione (un percorso di codice sbagliato)
+    _altera_saldo(db_session, risparmi, Decimal("-7.50"))
+    registra_movimento(
+        db_session, corrente, Decimal("2.00"), date(2026, 5, 5), TRANSAZIONE
+    )
+    db_session.commit()
+
+    report = reconcile_balances(repair=False, db=db_session, current_user_id=user.id)
+    assert report["conti_sfasati"] == [
+        {
+            "conto_id": corrente.id,
+            "user_id": user.id,
+            "saldo": Decimal("72.00"),
+            "saldo_atteso": Decimal("70.00"),
+            "saldo_ledger": Decimal("72.00"),
+            "differenza": Decimal("2.00"),
+            "riparato": False,
+        },
+        {
+            "conto_id": risparmi.id,
+            "user_id": user.id,
+            "saldo": Decimal("22.50"),
+            "saldo_atteso": Decimal("30.00"),
+            "saldo_ledger": Decimal("30.00"),
+            "differenza": Decimal("-7.50"),
+            "riparato": False,
+        },
+    ]
+    db_session.expire_all()
+    assert db_session.get(Conto, risparmi.id).saldo == Decimal("22.50")
+
+    report = reconcile_balances(repair=True, db=db_session, current_user_id=user.id)
+    assert [d["riparato"] for d in report["conti_sfasati"]] == [True, True]
+
+    db_session.expire_all()
+    assert db_session.get(Conto, corrente.id).saldo == Decimal("70.00")
+    assert db_session.get(Conto, risparmi.id).saldo == Decimal("30.00")
+    # Solo il conto col ledger sfasato riceve un movimento di correzione
+    correzioni = db_session.query(MovimentoSaldo).filter(
+        MovimentoSaldo.causale == RICONCILIAZIONE
+    )
+    assert [(m.conto_id, m.importo) for m in correzioni] == [
+        (corrente.id, Decimal("-2.00"))
+    ]
+    for conto in (corrente, risparmi):
+        assert saldo_al(db_session, conto.id) == db_session.get(Conto, conto.id).saldo
+    # La correzione non diventa una nuova deriva
+    assert riconcilia_saldi(db_session)["conti_sfasati"] == []
+
+
+def test_una_query_aggregata_per_blocco(db_session, user):
+    conti = [_conto(db_session, user, f"C{i}", "10.00") for i in range(5)]
+    for conto in conti:
+        _transazione(db_session, user, TipoTransazione.USCITA, "1.00", conto)
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        report = riconcilia_saldi(db_session, batch_size=2)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert report["conti_verificati"] == 5
+    # 3 blocchi: 3 aggregati, 4 pagine di id (l'ultima vuota), niente per conto
+    assert sum("UNION ALL" in s for s in statements) == 3
+    assert len(statements) == 7
@@ -0,0 +1,194 @@
+"""`task_transazioni_ricorrenti`: recupero delle esecuzioni arretrate in un solo
+giro, in blocco e con un numero di query che non cresce con le ricorrenze.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+import services
+from ledger import saldo_al
+from models import Conto, Ricorrenza, Transazione, User
+
+
+@pytest.fixture()
+def user(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture()
+def esegui_task(db_session, monkeypatch):
+    """Lancia il task sulla sessione di test; ritorna le query emesse."""
+    monkeypatch.setattr(services, "SessionLocal", lambda: db_session)
+
+    def run():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            services.task_transazioni_ricorrenti()
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        return statements
+
+    return run
+
+
+def _ricorrenza(db, user, conto, frequenza, prossima, importo="10.00", **kwargs):
+    ric = Ricorrenza(
+        nome=f"Ric {frequenza}",
+        importo=Decimal(importo),
+        tipo=kwargs.pop("tipo", "USCITA"),
+        frequenza=frequenza,
+        prossima_esecuzione=prossima,
+        attiva=True,
+        conto_id=conto.id,
+        user_id=user.id,
+        **kwargs,
+    )
+    db.add(ric)
+    return ric
+
+
+def test_recupera_tutte_le_esecuzioni_arretrate(db_session, user, esegui_task):
+    today = date.today()
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    nascosto = Conto(nome="H", saldo=Decimal("0"), user_id=user.id, deleted_at=today)
+    db_session.add_all([conto, nascosto])
+    db_session.flush()
+    giornaliera = _ricorrenza(
+        db_session, user, conto, "GIORNALIERA", today - timedelta(days=6)
+    )
+    mensile = _ricorrenza(
+        db_session,
+        user,
+        conto,
+        "MENSILE",
+        today,
+        importo="100.00",
+        tipo="ENTRATA",
+    )
+    futura = _ricorrenza(
+        db_session, user, conto, "SETTIMANALE", today + timedelta(days=1)
+    )
+    sospesa = _ricorrenza(
+        db_session, user, nascosto, "GIORNALIERA", today - timedelta(days=3)
+    )
+    db_session.commit()
+    ids = [r.id for r in (giornaliera, mensile, futura, sospesa)]
+    conto_id = conto.id
+
+    esegui_task()
+
+    date_giornaliera = [
+        t.data
+        for t in db_session.query(Transazione)
+        .filter(Transazione.descrizione == "Ricorrente: Ric GIORNALIERA")
+        .order_by(Transazione.data)
+    ]
+    # Sette esecuzioni (da sei giorni fa a oggi), ognuna alla sua data
+    assert date_giornaliera == [today - timedelta(days=n) for n in range(6, -1, -1)]
+    assert db_session.query(Transazione).count() == 8
+
+    # Il task chiude la sessione: si rileggono le righe per id
+    giornaliera, mensile, futura, sospesa = (
+        db_session.get(Ricorrenza, ric_id) for ric_id in ids
+    )
+    assert giornaliera.prossima_esecuzione == today + timedelta(days=1)
+    assert mensile.prossima_esecuzione > today
+    assert futura.prossima_esecuzione == today + timedelta(days=1)
+    assert sospesa.prossima_esecuzione == today - timedelta(days=3)
+    conto = db_session.get(Conto, conto_id)
+    assert conto.saldo == Decimal("30.00")  # 100 di entrata, 7 x 10 di uscita
+    assert saldo_al(db_session, conto.id) == conto.saldo
+    assert saldo_al(db_session, conto.id, today - timedelta(days=4)) == Decimal(
+        "-30.00"
+    )
+
+    # Rieseguito lo stesso giorno non genera nulla
+    esegui_task()
+    assert db_session.query(Transazione).count() == 8
+
+
+def test_query_costanti_al_crescere_delle_ricorrenze(db_session, user, esegui_task):
+    today = date.today()
+    user_id = user.id
+    conti = [Conto(nome=f"C{i}", saldo=Decimal("0"), user_id=user.id) for i in range(3)]
+    db_session.add_all(conti)
+    db_session.commit()
+    conto_ids = [conto.id for conto in conti]
+
+    def conta_query(quante):
+        for i in range(quante):
+            db_session.add(
+                Ricorrenza(
+                    nome="Ric",
+                    importo=Decimal("1.00"),
+                    tipo="USCITA",
+                    frequenza="GIORNALIERA",
+                    prossima_esecuzione=today - timedelta(days=2),
+                    conto_id=conto_ids[i % len(conto_ids)],
+                    user_id=user_id,
+                )
+            )
+        db_session.commit()
+        # Su SQLite l'INSERT ... RETURNING va riga per riga: si contano le altre
+        return sum(
+            not s.lstrip().upper().startswith("INSERT INTO TRANSAZIONI")
+            for s in esegui_task()
+        )
+
+    assert conta_query(3) == conta_query(30)
+
+
+def test_arretrati_limitati_per_giro(
+    db_session, user, esegui_task, monkeypatch, caplog
+):
+    monkeypatch.setattr(services, "RICORRENZE_MAX_ARRETRATI", 5)
+    today = date.today()
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    db_session.add(conto)
+    db_session.flush()
+    ric = _ricorrenza(db_session, user, conto, "GIORNALIERA", today - timedelta(days=7))
+    db_session.commit()
+    ric_id = ric.id
+
+    esegui_task()
+
+    assert db_session.query(Transazione).count() == 5
+    ric = db_session.get(Ricorrenza, ric_id)
+    assert ric.prossima_esecuzione == today - timedelta(days=2)
+    assert "limite di 5 esecuzioni arretrate" in caplog.text
+
+    # Il giro dopo recupera il resto, fino a oggi
+    esegui_task()
+    assert db_session.query(Transazione).count() == 8
+    assert db_session.get(Ricorrenza, ric_id).prossima_esecuzione == today + timedelta(
+        days=1
+    )
+
+
+def test_rimborso_ricorrente_accredita_il_conto(db_session, user, esegui_task):
+    today = date.today()
+    conto = Conto(nome="C", saldo=Decimal("100.00"), user_id=user.id)
+    db_session.add(conto)
+    db_session.flush()
+    _ricorrenza(db_session, user, conto, "MENSILE", today, tipo="RIMBORSO")
+    db_session.commit()
+    conto_id = conto.id
+
+    esegui_task()
+
+    # Come una transazione RIMBORSO inserita a mano (ledger.effetti_transazione)
+    conto = db_session.get(Conto, conto_id)
+    assert conto.saldo == Decimal("110.00")
+    assert saldo_al(db_session, conto_id) == Decimal("10.00")
@@ -0,0 +1,107 @@
+"""Scritture concorrenti sullo stesso conto: nessun aggiornamento del saldo perso.
+
+Più thread, ognuno con la propria sessione (come richieste API e job dello
+scheduler in parallelo), creano transazioni sugli stessi conti. Serve un DB su
+file con connessioni vere (l'in-memory di conftest ne condivide una sola): le
+letture ORM girano fuori transazione, quindi un `saldo = letto + delta` fatto in
+Python perderebbe scritture, mentre `UPDATE ... SET saldo = saldo + :delta` no.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Conto, MovimentoSaldo, User
+from routers.transazioni import create_transazione
+from schemas.transazione import TipoTransazione, TransazioneCreate
+
+THREADS = 8
+PER_THREAD = 15
+
+
+@pytest.fixture()
+def session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'concorrenza.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _wal(dbapi_connection, _record):
+        # WAL: i lettori non bloccano chi scrive, chi scrive aspetta il suo turno
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    finally:
+        engine.dispose()
+
+
+def test_scritture_parallele_non_perdono_aggiornamenti(session_factory):
+    with session_factory() as db:
+        user = User(username="u", email="u@example.it", hashed_password="x")
+        db.add(user)
+        db.flush()
+        corrente = Conto(nome="Corrente", saldo=Decimal("0"), user_id=user.id)
+        risparmi = Conto(nome="Risparmi", saldo=Decimal("0"), user_id=user.id)
+        db.add_all([corrente, risparmi])
+        db.commit()
+        user_id, corrente_id, risparmi_id = user.id, corrente.id, risparmi.id
+
+    partenza = threading.Barrier(THREADS)
+
+    def lavora(indice):
+        partenza.wait()
+        # Metà dei thread gira i giroconti nel verso opposto: stessi conti,
+        # ordine inverso, il caso che senza ordine dei lock va in deadlock.
+        da, a = (
+            (corrente_id, risparmi_id) if indice % 2 else (risparmi_id, corrente_id)
+        )
+        with session_factory() as db:
+            for _ in range(PER_THREAD):
+                create_transazione(
+                    TransazioneCreate(
+                        importo=Decimal("1.00"),
+                        tipo=TipoTransazione.USCITA,
+                        data=date(2026, 3, 1),
+                        conto_id=corrente_id,
+                    ),
+                    db=db,
+                    current_user_id=user_id,
+                )
+                create_transazione(
+                    TransazioneCreate(
+                        importo=Decimal("2.00"),
+                        tipo=TipoTransazione.RICARICA,
+                        data=date(2026, 3, 1),
+                        conto_id=da,
+                        conto_destinazione_id=a,
+                    ),
+                    db=db,
+                    current_user_id=user_id,
+                )
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        for future in [pool.submit(lavora, i) for i in range(THREADS)]:
+            future.result()
+
+    with session_factory() as db:
+        corrente = db.get(Conto, corrente_id)
+        risparmi = db.get(Conto, risparmi_id)
+        # I giroconti si compensano (stesso numero per verso): restano le uscite
+        assert corrente.saldo == Decimal(-THREADS * PER_THREAD)
+        assert risparmi.saldo == Decimal("0")
+        for conto in (corrente, risparmi):
+            assert (
+                db.query(func.sum(MovimentoSaldo.importo))
+                .filter(MovimentoSaldo.conto_id == conto.id)
+                .scalar()
+                == conto.saldo
+            )
@@ -0,0 +1,43 @@
+"""L'avvio dell'API non carica le dipendenze pesanti (`benchmarks/startup.py`)."""
+
+import sys
+import types
+from decimal import Decimal
+
+from benchmarks.startup import avvio
+from services import get_live_price
+
+
+def test_import_main_senza_dipendenze_pesanti():
+    # Processo nuovo: in questo gli altri test possono averle già importate
+    assert avvio()["pesanti"] == []
+
+
+class _Serie:
+    def __init__(self, valori):
+        self.iloc = valori
+
+
+class _Storico(dict):
+    @property
+    def empty(self):
+        return not self["Close"].iloc
+
+
+def test_prezzo_live_importa_yfinance_solo_quando_serve(monkeypatch):
+    prezzi = {"VWCE.DE": [101.5, 102.25], "IE00BK5BQT80": []}
+    richiesti = []
+
+    class Ticker:
+        def __init__(self, simbolo):
+            richiesti.append(simbolo)
+            self.simbolo = simbolo
+
+        def history(self, period):
+            return _Storico(Close=_Serie(prezzi.get(self.simbolo, [])))
+
+    monkeypatch.setitem(sys.modules, "yfinance", types.SimpleNamespace(Ticker=Ticker))
+
+    assert get_live_price("VWCE.DE", "IE00BK5BQT80") == Decimal("102.25")
+    assert get_live_price("XXX", "IE00BK5BQT80") is None
+    assert richiesti == ["VWCE.DE", "XXX", "IE00BK5BQT80"]
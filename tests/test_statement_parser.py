@@ -0,0 +1,203 @@
+"""Parser degli estratti conto: funzioni pure, testate con testo/righe di esempio
+senza PDF né fogli di calcolo veri.
+"""
+
+import io
+from datetime import date
+from decimal import Decimal
+
+from services import (
+    _HEADER_SCAN_ROWS,
+    iter_statement_movimenti,
+    iter_statement_rows,
+    open_bank_statement,
+    parse_statement_text,
+)
+import services
+from statement_profiles import (
+    LEARNED_SPREADSHEET,
+    PDF,
+    SPREADSHEET,
+    STATEMENT_PROFILES,
+    detect_pdf_profile,
+)
+
+ESTRATTO = """\
+ESTRATTO CONTO AL 31/01/2026
+Saldo iniziale 1.000,00
+02/01/2026 02/01/2026 Pagamento POS
+SUPERMERCATO ROSSI
+-45,90
+05/01/2026 Bonifico stipendio 1.500,00
+Totale uscite 45,90
+"""
+
+
+def test_parse_statement_text_accorpa_i_record_multiriga():
+    movimenti = parse_statement_text(ESTRATTO)
+
+    assert [(m["data"], m["tipo"], m["importo"]) for m in movimenti] == [
+        (date(2026, 1, 2), "USCITA", Decimal("45.90")),
+        (date(2026, 1, 5), "ENTRATA", Decimal("1500.00")),
+    ]
+    assert movimenti[0]["descrizione"] == "Pagamento POS SUPERMERCATO ROSSI"
+
+
+def test_iter_statement_movimenti_produce_prima_della_fine_del_testo():
+    """Il primo movimento esce appena il suo record si chiude: le righe successive
+    (le pagine non ancora estratte) non sono ancora state lette."""
+    consumed = []
+
+    def righe():
+        for line in ESTRATTO.splitlines():
+            consumed.append(line)
+            yield line
+
+    movimenti = iter_statement_movimenti(righe())
+    primo = next(movimenti)
+
+    assert primo["importo"] == Decimal("45.90")
+    assert "05/01/2026 Bonifico stipendio 1.500,00" not in consumed
+
+
+def test_iter_statement_movimenti_scarta_i_record_senza_importo():
+    righe = ["01/02/2026 intestazione senza importo"] + ["riga"] * 20 + ["10,00"]
+
+    assert list(iter_statement_movimenti(righe)) == []
+
+
+def test_iter_statement_rows_trova_lintestazione_e_legge_in_streaming():
+    consumed = []
+
+    def righe():
+        yield ["Estratto conto", None, None]
+        yield ["Data", "Descrizione", "Importo"]
+        for i in range(1, 1000):
+            consumed.append(i)
+            yield [f"{i % 28 + 1:02d}/01/2026", f"Movimento {i}", f"-{i},00"]
+
+    movimenti = iter_statement_rows(righe(), provider="CSV")
+    primo = next(movimenti)
+
+    assert primo["tipo"] == "USCITA"
+    assert primo["importo"] == Decimal("1.00")
+    # Letto solo il prefisso in cui si cerca l'intestazione, non tutto il file.
+    assert len(consumed) <= _HEADER_SCAN_ROWS
+
+
+def test_open_bank_statement_csv_da_stream_impara_il_profilo():
+    csv_bytes = (
+        "Data;Operazione;Entrate;Uscite\n"
+        "03/02/2026;Stipendio;1.200,00;\n"
+        "04/02/2026;Affitto;;650,00\n"
+    ).encode("utf-8-sig")
+
+    profile, movimenti = open_bank_statement(io.BytesIO(csv_bytes), "x.csv")
+    movimenti = list(movimenti)
+
+    assert [(m["tipo"], m["importo"], m["descrizione"]) for m in movimenti] == [
+        ("ENTRATA", Decimal("1200.00"), "Stipendio"),
+        ("USCITA", Decimal("650.00"), "Affitto"),
+    ]
+    assert all(m["provider"] == "CSV" for m in movimenti)
+    assert profile["key"] == LEARNED_SPREADSHEET
+    assert profile["columns"] == {
+        "date": "data",
+        "descr": "operazione",
+        "entrate": "entrate",
+        "uscite": "uscite",
+    }
+
+
+def test_open_bank_statement_riusa_il_profilo_salvato_sul_conto():
+    """Col profilo in cache valgono i NOMI delle colonne salvati, anche dove
+    l'euristica a parole chiave sceglierebbe diversamente."""
+    cached = {
+        "key": LEARNED_SPREADSHEET,
+        "kind": SPREADSHEET,
+        "columns": {"date": "valuta", "descr": "causale", "amount": "importo"},
+        "date_format": "%Y-%m-%d",
+    }
+    csv_bytes = (
+        "Data contabile;Valuta;Causale;Importo\n"
+        "01/03/2026;2026-03-02;Bonifico;-10,00\n"
+    ).encode()
+
+    profile, movimenti = open_bank_statement(
+        io.BytesIO(csv_bytes), "x.csv", profiles={SPREADSHEET: cached}
+    )
+
+    assert profile is cached
+    assert [(m["data"], m["importo"]) for m in movimenti] == [
+        (date(2026, 3, 2), Decimal("10.00"))
+    ]
+
+
+def test_open_bank_statement_sostituisce_il_profilo_salvato_che_non_combacia():
+    cached = {
+        "key": LEARNED_SPREADSHEET,
+        "kind": SPREADSHEET,
+        "columns": {"date": "valuta", "descr": "causale", "amount": "importo"},
+        "date_format": "%Y-%m-%d",
+    }
+    csv_bytes = (
+        "Data;Entrate;Uscite;Descrizione;Descrizione_Completa\n"
+        "05/03/2026;;12,50;POS;Pagamento POS BAR CENTRALE\n"
+    ).encode()
+
+    profile, movimenti = open_bank_statement(
+        io.BytesIO(csv_bytes), "x.csv", profiles={SPREADSHEET: cached}
+    )
+
+    assert profile["key"] == "FINECO_XLSX"
+    assert [m["importo"] for m in movimenti] == [Decimal("12.50")]
+
+
+def test_open_bank_statement_pdf_rileva_di_nuovo_se_il_profilo_non_combacia(
+    monkeypatch,
+):
+    prima_pagina = ["Banca Qualsiasi - Estratto conto\n" + ESTRATTO]
+    monkeypatch.setattr(services, "iter_pdf_pages", lambda file: iter(prima_pagina))
+    # Profilo salvato da un estratto Isybank, con la colonna saldo scelta a mano
+    isybank = {**STATEMENT_PROFILES["ISYBANK"], "balance_column": True}
+
+    profile, movimenti = open_bank_statement(
+        b"%PDF", "estratto.pdf", profiles={PDF: isybank}
+    )
+
+    assert profile["key"] == "GENERIC_PDF"
+    assert [m["importo"] for m in movimenti] == [Decimal("45.90"), Decimal("1500.00")]
+
+    # Se la prima pagina è ancora Isybank il profilo salvato resta com'è
+    prima_pagina[0] = "ISYBANK S.p.A.\n" + ESTRATTO
+    profile, _ = open_bank_statement(b"%PDF", "estratto.pdf", profiles={PDF: isybank})
+    assert profile is isybank
+
+    # e un generico salvato lascia il posto al profilo della banca riconosciuta
+    generico = STATEMENT_PROFILES["GENERIC_PDF"]
+    profile, _ = open_bank_statement(b"%PDF", "estratto.pdf", profiles={PDF: generico})
+    assert profile["key"] == "ISYBANK"
+
+
+def test_open_bank_statement_riconosce_un_profilo_registrato():
+    csv_bytes = (
+        "Data;Entrate;Uscite;Descrizione;Descrizione_Completa\n"
+        "05/03/2026;;12,50;POS;Pagamento POS BAR CENTRALE\n"
+    ).encode()
+
+    profile, movimenti = open_bank_statement(io.BytesIO(csv_bytes), "x.csv")
+
+    assert profile["key"] == "FINECO_XLSX"
+    assert [m["descrizione"] for m in movimenti] == ["Pagamento POS BAR CENTRALE"]
+
+
+def test_open_bank_statement_senza_intestazione():
+    profile, movimenti = open_bank_statement(io.BytesIO(b"a;b\n1;2\n"), "x.csv")
+
+    assert profile is None
+    assert list(movimenti) == []
+
+
+def test_detect_pdf_profile():
+    assert detect_pdf_profile("ISYBANK S.p.A. - Estratto conto")["key"] == "ISYBANK"
+    assert detect_pdf_profile("Banca qualsiasi")["key"] == "GENERIC_PDF"
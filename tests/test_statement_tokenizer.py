@@ -0,0 +1,63 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from statement_tokenizer import (
+    clean_description,
+    coerce_amount,
+    coerce_date,
+    parse_date_token,
+    parse_italian_amount,
+)
+
+
+@pytest.mark.parametrize(
+    "token, expected",
+    [
+        ("1.234,56", Decimal("1234.56")),
+        ("-45,90", Decimal("-45.90")),
+        ("12,00-", Decimal("-12.00")),
+        ("+7,50", Decimal("7.50")),
+        ("12.00", None),
+    ],
+)
+def test_parse_italian_amount(token, expected):
+    assert parse_italian_amount(token) == expected
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, None),
+        ("", None),
+        (12.5, Decimal("12.5")),
+        (-3, Decimal("-3")),
+        ("EUR -1.000,00", Decimal("-1000.00")),
+        ("-30.00", Decimal("-30.00")),
+        ("€ 12", Decimal("12")),
+        ("n/d", None),
+    ],
+)
+def test_coerce_amount(value, expected):
+    assert coerce_amount(value) == expected
+
+
+def test_coerce_date_nativi_e_stringhe():
+    assert coerce_date(datetime(2026, 3, 1, 10, 30)) == date(2026, 3, 1)
+    assert coerce_date(date(2026, 3, 1)) == date(2026, 3, 1)
+    assert coerce_date("01.03.26") == date(2026, 3, 1)
+    assert coerce_date("31/02/2026") is None
+
+
+def test_parse_date_token_e_memoizzata():
+    parse_date_token.cache_clear()
+    for _ in range(3):
+        assert parse_date_token("05/01/2026") == date(2026, 1, 5)
+    assert parse_date_token.cache_info().hits == 2
+
+
+def test_clean_description():
+    assert clean_description("  Pagamento   POS\tROSSI EUR ") == "Pagamento POS ROSSI"
+    assert clean_description("Altre uscite€") == "Altre uscite"
+    assert clean_description("Europa") == "Europa"
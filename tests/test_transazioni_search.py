@@ -0,0 +1,102 @@
+"""`/transazioni/search`: ripiego ILIKE su SQLite e forma della query per Postgres
+(compilata, senza un server Postgres).
+"""
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from models import Conto, Transazione, User
+from routers.transazioni import search_transazioni_endpoint
+from services import build_transazioni_search_query
+
+
+def _transazione(db, user, conto, descrizione, giorno, **kwargs):
+    transazione = Transazione(
+        user_id=user.id,
+        conto_id=conto.id,
+        tipo="USCITA",
+        importo=Decimal("1.00"),
+        data=date(2026, 1, giorno),
+        descrizione=descrizione,
+        **kwargs,
+    )
+    db.add(transazione)
+    return transazione
+
+
+def test_search_trova_sottostringhe_prefissi_prima(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    other = User(username="o", email="o@example.it", hashed_password="x")
+    db_session.add_all([user, other])
+    db_session.flush()
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    conto_other = Conto(nome="X", saldo=Decimal("0"), user_id=other.id)
+    db_session.add_all([conto, conto_other])
+    db_session.flush()
+
+    _transazione(db_session, user, conto, "Pagamento POS AMAZON EU", 20)
+    _transazione(db_session, user, conto, "amazon prime", 5)
+    _transazione(db_session, user, conto, "Amazon Marketplace", 10)
+    _transazione(db_session, user, conto, "Supermercato", 25)
+    _transazione(
+        db_session,
+        user,
+        conto,
+        "Amazon cancellata",
+        28,
+        deleted_at=datetime.now(timezone.utc),
+    )
+    _transazione(db_session, other, conto_other, "Amazon altrui", 28)
+    db_session.commit()
+
+    result = search_transazioni_endpoint(
+        q="AMAZON", limit=20, db=db_session, current_user_id=user.id
+    )
+
+    # Prima chi inizia col termine, poi il resto; a parità, le più recenti.
+    assert [t.descrizione for t in result] == [
+        "Amazon Marketplace",
+        "amazon prime",
+        "Pagamento POS AMAZON EU",
+    ]
+
+
+def test_search_tratta_i_caratteri_jolly_alla_lettera(db_session):
+    user = User(username="u", email="u@example.it", hashed_password="x")
+    db_session.add(user)
+    db_session.flush()
+    conto = Conto(nome="C", saldo=Decimal("0"), user_id=user.id)
+    db_session.add(conto)
+    db_session.flush()
+    _transazione(db_session, user, conto, "Sconto 50% saldi", 1)
+    _transazione(db_session, user, conto, "Sconto 500 euro", 2)
+    db_session.commit()
+
+    result = search_transazioni_endpoint(
+        q="50%", limit=20, db=db_session, current_user_id=user.id
+    )
+
+    assert [t.descrizione for t in result] == ["Sconto 50% saldi"]
+
+
+def test_search_su_postgres_usa_similarita_trigrammi():
+    query = build_transazioni_search_query(1, "amazn", "postgresql", limit=5)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+
+    assert "ILIKE" in sql
+    assert "<%" in sql
+    assert "ORDER BY word_similarity(" in sql
+
+
+@pytest.mark.parametrize("q", ["   ", " a  b ", "\t\tab"])
+def test_search_rifiuta_termini_quasi_vuoti(db_session, q):
+    with pytest.raises(HTTPException) as exc:
+        search_transazioni_endpoint(q=q, limit=20, db=db_session, current_user_id=1)
+    assert exc.value.status_code == 422
+
+    with pytest.raises(ValueError):
+        build_transazioni_search_query(1, q, "postgresql")
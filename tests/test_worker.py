@@ -0,0 +1,73 @@
+"""`worker.py`: i job girano nel worker e non nell'API, e si possono lanciare a
+mano dalla CLI.
+"""
+
+import functools
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy.orm import sessionmaker
+
+import jobs
+import main
+import services
+import worker
+from models import JobRun
+
+
+def test_api_senza_scheduler():
+    assert not hasattr(main, "scheduler")
+    assert not hasattr(main, "RUN_SCHEDULER")
+
+
+def test_scheduler_del_worker_ha_tutti_i_job():
+    scheduler = worker.crea_scheduler(BackgroundScheduler)
+    assert sorted(job.id for job in scheduler.get_jobs()) == sorted(worker.JOBS)
+    assert scheduler.get_job("task_sync_bank_connectors").name == (
+        "task_sync_bank_connectors"
+    )
+
+
+def test_cli_run_esegue_il_job_una_volta(db_session, monkeypatch):
+    chiamate = []
+
+    def task_di_prova():
+        chiamate.append(1)
+        return 3
+
+    monkeypatch.setitem(worker.JOBS, "task_di_prova", (task_di_prova, {"hour": 0}))
+
+    esito = worker.esegui_ora("task_di_prova", session_factory=lambda: db_session)
+
+    assert esito == jobs.OK
+    assert chiamate == [1]
+    [run] = db_session.query(JobRun).all()
+    assert (run.job, run.status, run.rows) == ("task_di_prova", jobs.OK, 3)
+
+
+def test_cli_list(capsys):
+    assert worker.main(["list"]) == 0
+    righe = capsys.readouterr().out.splitlines()
+    assert [riga.split("\t")[0] for riga in righe] == list(worker.JOBS)
+
+
+def test_cli_run_task_fallito_esce_con_errore(db_session, monkeypatch):
+    # Il task gestisce l'errore nel suo try/except (rollback e log) e lo rilancia:
+    # job_runs, metriche e codice di uscita devono vedere il fallimento
+    def snapshot_rotti(db, giorno):
+        raise RuntimeError("DB non raggiungibile")
+
+    sessioni = sessionmaker(bind=db_session.get_bind(), autoflush=False)
+    monkeypatch.setattr(services, "SessionLocal", sessioni)
+    monkeypatch.setattr(services, "crea_snapshot_mensili", snapshot_rotti)
+    monkeypatch.setattr(worker, "configura_db", lambda: None)
+    monkeypatch.setattr(
+        worker,
+        "esegui_ora",
+        functools.partial(worker.esegui_ora, session_factory=sessioni),
+    )
+
+    assert worker.main(["run", "task_snapshot_saldi"]) == 1
+
+    [run] = db_session.query(JobRun).all()
+    assert (run.job, run.status) == ("task_snapshot_saldi", jobs.ERROR)
+    assert run.error == "DB non raggiungibile"
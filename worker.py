@@ -0,0 +1,174 @@
+"""Processo dei job schedulati, separato dall'API.
+
+Nel processo uvicorn i job dividevano CPU, GIL e pool di connessioni con le
+richieste: la sync bancaria rallentava l'API mentre girava. Qui girano in un
+processo a parte (stessa immagine, comando `python worker.py`), con un proprio
+pool di connessioni e un numero fisso di thread; l'API serve solo richieste.
+
+Ogni esecuzione passa da `jobs.esegui_job`, quindi più worker possono restare
+accesi insieme: ogni scatto lo esegue uno solo e finisce in `job_runs`.
+
+Uso:
+    python worker.py                 # avvia lo scheduler (bloccante)
+    python worker.py list            # job disponibili con la loro pianificazione
+    python worker.py run <job>       # esegue subito un job, una volta
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.cron import CronTrigger
+from prometheus_client import REGISTRY, start_http_server
+from sqlalchemy import create_engine
+
+import jobs
+import models
+from database import SQLALCHEMY_DATABASE_URL, SessionLocal
+from metrics import PoolCollector, QueuePoolMisurato
+from services import (
+    task_aggiornamento_prezzi,
+    task_transazioni_ricorrenti,
+    task_ricarica_automatica_conti,
+    task_sync_bank_connectors,
+    task_snapshot_saldi,
+    task_riconciliazione_saldi,
+    task_pulizia_refresh_token,
+    task_pulizia_rate_limit,
+)
+
+logger = logging.getLogger(__name__)
+
+# Job che girano in parallelo: ognuno tiene al massimo tre connessioni (la riga
+# di job_runs, l'advisory lock e la sessione del task), da cui il pool.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "2"))
+WORKER_DB_POOL_SIZE = int(os.getenv("WORKER_DB_POOL_SIZE", str(WORKER_THREADS * 3)))
+# Porta delle metriche Prometheus del worker (durate ed esiti dei job, sync
+# bancaria, pool). Solo per la rete interna: a differenza di /metrics dell'API
+# non ha token. Vuota = non esposte.
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT")
+
+# Nome del job -> (task, argomenti del trigger cron)
+JOBS = {
+    task.__name__: (task, trigger)
+    for task, trigger in (
+        (task_aggiornamento_prezzi, {"hour": 2, "minute": 0}),
+        (task_transazioni_ricorrenti, {"hour": 3, "minute": 0}),
+        (task_ricarica_automatica_conti, {"hour": 4, "minute": 0}),
+        # Ogni 6 ore (4 volte/giorno): le API AIS (PSD2) limitano gli accessi non
+        # presidiati, quindi una sync oraria genera 429 "Too Many Requests".
+        (task_sync_bank_connectors, {"hour": "*/6"}),
+        # Il primo del mese: snapshot dei saldi a fine mese precedente (ledger.py)
+        (task_snapshot_saldi, {"day": 1, "hour": 1, "minute": 0}),
+        # Dopo ricorrenze e ricariche: verifica (e a richiesta corregge) i saldi
+        (task_riconciliazione_saldi, {"hour": 5, "minute": 0}),
+        (task_pulizia_refresh_token, {"hour": 0, "minute": 30}),
+        (task_pulizia_rate_limit, {"minute": 15}),
+    )
+}
+
+
+def configura_db() -> None:
+    """Lega `SessionLocal` (usata da task e job_runs) a un engine col pool del
+    worker, al posto di quello di default pensato per l'API."""
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=QueuePoolMisurato,
+        pool_size=WORKER_DB_POOL_SIZE,
+        max_overflow=0,
+        pool_pre_ping=True,
+    )
+    SessionLocal.configure(bind=engine)
+    REGISTRY.register(PoolCollector(engine))
+
+
+def crea_scheduler(scheduler_cls=BlockingScheduler, **kwargs):
+    """Scheduler con tutti i job di `JOBS`, ognuno protetto da `esegui_job`."""
+    scheduler = scheduler_cls(
+        executors={"default": ThreadPoolExecutor(WORKER_THREADS)},
+        job_defaults={
+            # Uno scatto in ritardo (thread tutti occupati) parte comunque, una
+            # volta sola. Lo slot in job_runs è l'istante dello scatto, uguale
+            # su tutti i worker, quindi il ritardo non lo fa ripetere altrove.
+            "coalesce": True,
+            "max_instances": 1,
+            "misfire_grace_time": 30,
+        },
+        **kwargs,
+    )
+    for nome, (task, trigger) in JOBS.items():
+        cron = CronTrigger(timezone=scheduler.timezone, **trigger)
+        scheduler.add_job(
+            jobs.job_schedulato(task, trigger=cron),
+            cron,
+            id=nome,
+            name=nome,
+        )
+    return scheduler
+
+
+def esegui_ora(nome: str, session_factory=SessionLocal) -> Optional[str]:
+    """Esegue subito il job `nome`. Lo slot è l'istante del lancio, così non
+    prende il posto dello scatto del cron; l'advisory lock impedisce comunque di
+    sovrapporsi a un'esecuzione in corso. Ritorna l'esito registrato."""
+    task, _ = JOBS[nome]
+    run_id = jobs.esegui_job(
+        nome,
+        task,
+        session_factory=session_factory,
+        slot=datetime.now(timezone.utc).replace(tzinfo=None),
+    )
+    if run_id is None:
+        return None
+    db = session_factory()
+    try:
+        return db.get(models.JobRun, run_id).status
+    finally:
+        db.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Job schedulati del backend")
+    comandi = parser.add_subparsers(dest="comando")
+    comandi.add_parser("start", help="avvia lo scheduler (default)")
+    comandi.add_parser("list", help="elenca i job")
+    run = comandi.add_parser("run", help="esegue subito un job")
+    run.add_argument("job", choices=sorted(JOBS))
+    args = parser.parse_args(argv)
+
+    if args.comando == "list":
+        for nome, (_, trigger) in JOBS.items():
+            print(f"{nome}\t{trigger}")
+        return 0
+
+    logging.basicConfig(level=logging.INFO)
+    configura_db()
+
+    if args.comando == "run":
+        esito = esegui_ora(args.job)
+        print(f"{args.job}: {esito or 'slot già preso da un altro worker'}")
+        return 0 if esito == jobs.OK else 1
+
+    if WORKER_METRICS_PORT:
+        start_http_server(int(WORKER_METRICS_PORT))
+    scheduler = crea_scheduler()
+    logger.info(
+        "Worker avviato: %d job, %d thread, pool di %d connessioni",
+        len(JOBS),
+        WORKER_THREADS,
+        WORKER_DB_POOL_SIZE,
+    )
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())